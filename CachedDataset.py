@@ -6,20 +6,208 @@ import time
 import numpy
 import functools
 import threading
+import typing
+from collections import OrderedDict
 from Dataset import Dataset
 from Log import log
-from Util import NumbersDict
+from Util import NumbersDict, human_bytes_size
+
+
+class SeqFrameCache(object):
+  """
+  LRU cache of seqs, keyed by real seq idx, with a fixed budget of frames.
+  The frames of the cached seqs (the "data" key) all live in one preallocated arena.
+  New seqs are appended at the end of the used part of the arena.
+  When the end is reached, the least recently used seqs are evicted,
+  and the remaining seqs are moved to the front (compaction), see :func:`make_room`.
+  This is done before a load, not while the seqs of a load are added.
+  :func:`get` returns read-only views on the arena, thus the arena is never overwritten while any of these
+  are still in use. In that case, the compaction copies the seqs into a new arena instead,
+  otherwise no allocations are needed after the initialization.
+  Other data keys (e.g. sparse targets) are small and are kept as separate arrays per seq.
+  """
+
+  def __init__(self, num_frames, frame_shape, dtype):
+    """
+    :param int num_frames: budget, size of the arena
+    :param list[int]|tuple[int] frame_shape:
+    :param str dtype:
+    """
+    assert num_frames > 0
+    self.num_frames = num_frames
+    self.arena = numpy.zeros((num_frames,) + tuple(frame_shape), dtype=dtype)
+    # real seq idx -> (arena offset, num frames, other data keys), in LRU order (least recently used first).
+    self._entries = OrderedDict()  # type: typing.Dict[int,typing.Tuple[int,int,typing.Dict[str,numpy.ndarray]]]
+    self._end = 0  # arena is free from here on
+    self.used_frames = 0
+    self.num_hits = 0
+    self.num_misses = 0
+    self.num_evictions = 0
+    self.num_compactions = 0
+    self.num_arena_reallocs = 0
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, real_seq_idx):
+    return real_seq_idx in self._entries
+
+  def touch(self, real_seq_idx):
+    """
+    Marks the seq as recently used, and counts the hit or miss.
+
+    :param int real_seq_idx:
+    :return: whether the seq is in the cache
+    :rtype: bool
+    """
+    if real_seq_idx not in self._entries:
+      self.num_misses += 1
+      return False
+    self.num_hits += 1
+    self._entries[real_seq_idx] = self._entries.pop(real_seq_idx)  # move_to_end is PY3 only
+    return True
+
+  def get(self, real_seq_idx, key="data"):
+    """
+    :param int real_seq_idx:
+    :param str key:
+    :return: the data, a read-only view on the arena for "data", or None if the seq is not cached
+    :rtype: numpy.ndarray|None
+    """
+    entry = self._entries.get(real_seq_idx)
+    if entry is None:
+      return None
+    offset, length, other = entry
+    if key == "data":
+      data = self.arena[offset:offset + length]
+      data.flags.writeable = False
+      return data
+    return other[key]
+
+  def add(self, real_seq_idx, data, other=None, pinned=()):
+    """
+    :param int real_seq_idx:
+    :param numpy.ndarray data: frames, shape (time,)+frame_shape
+    :param dict[str,numpy.ndarray]|None other: other data keys, e.g. the targets
+    :param set[int]|tuple[int] pinned: real seq idxs which must not be evicted, e.g. the currently loaded ones
+    """
+    if real_seq_idx in self._entries:
+      self.remove(real_seq_idx)
+    length = data.shape[0]
+    assert length <= self.num_frames, "seq %i with %i frames does not fit into the cache of %i frames" % (
+      real_seq_idx, length, self.num_frames)
+    self.make_room(num_frames=length, pinned=pinned)  # usually already done before the load
+    self.arena[self._end:self._end + length] = data
+    self._entries[real_seq_idx] = (self._end, length, other or {})
+    self._end += length
+    self.used_frames += length
+
+  def make_room(self, num_frames, pinned=()):
+    """
+    Makes sure that num_frames can be appended, by evicting and compacting if needed.
+    Call this before adding the seqs of a load.
+
+    :param int num_frames:
+    :param set[int]|tuple[int] pinned: real seq idxs which must not be evicted
+    """
+    if self._end + num_frames <= self.num_frames:
+      return
+    # Keep some slack free, such that we do not need to compact the arena for every new seq.
+    self._evict(num_frames=max(num_frames, self.num_frames // 10), pinned=pinned)
+    assert self.used_frames + num_frames <= self.num_frames, "cache of %i frames is too small for the pinned seqs" % (
+      self.num_frames,)
+    self._compact()
+
+  def remove(self, real_seq_idx):
+    """
+    The frames are only reused after the next compaction, as there might still be views on them.
+
+    :param int real_seq_idx:
+    """
+    offset, length, _ = self._entries.pop(real_seq_idx)
+    self.used_frames -= length
+
+  def _evict(self, num_frames, pinned):
+    """
+    Evicts the least recently used seqs until at least num_frames are free (if possible).
+
+    :param int num_frames:
+    :param set[int]|tuple[int] pinned:
+    """
+    for real_seq_idx in list(self._entries.keys()):
+      if self.num_frames - self.used_frames >= num_frames:
+        break
+      if real_seq_idx in pinned:
+        continue
+      self.remove(real_seq_idx)
+      self.num_evictions += 1
+
+  def _compact(self):
+    """
+    Moves all cached seqs to the front of the arena, keeping their LRU order.
+    """
+    self.num_compactions += 1
+    old_arena = self.arena
+    # References: self.arena, old_arena, and the getrefcount argument. Any more are views from get().
+    if sys.getrefcount(old_arena) > 3:
+      self.arena = numpy.empty_like(old_arena)  # the views stay valid, they keep the old arena alive
+      self.num_arena_reallocs += 1
+    pos = 0
+    for real_seq_idx, (offset, length, other) in sorted(self._entries.items(), key=lambda item: item[1][0]):
+      if offset != pos or self.arena is not old_arena:
+        self.arena[pos:pos + length] = old_arena[offset:offset + length]  # pos <= offset, numpy handles the overlap
+        self._entries[real_seq_idx] = (pos, length, other)
+      pos += length
+    assert pos == self.used_frames
+    self._end = pos
+
+  def clear(self):
+    """
+    Removes all seqs. The arena stays allocated.
+    """
+    self._entries.clear()
+    self._end = 0
+    self.used_frames = 0
+
+  def get_stats_str(self):
+    """
+    :rtype: str
+    """
+    num_lookups = self.num_hits + self.num_misses
+    return (
+      "%i seqs, %i/%i frames used, hit rate %.1f%% (%i hits, %i misses), %i evictions, %i compactions"
+      " (%i with new arena)") % (
+      len(self._entries), self.used_frames, self.num_frames,
+      100. * self.num_hits / max(num_lookups, 1), self.num_hits, self.num_misses,
+      self.num_evictions, self.num_compactions, self.num_arena_reallocs)
+
+  def reset_stats(self):
+    """
+    Resets the hit/miss/eviction counters.
+    """
+    self.num_hits = self.num_misses = self.num_evictions = self.num_compactions = self.num_arena_reallocs = 0
 
 
 class CachedDataset(Dataset):
 
-  def __init__(self, cache_byte_size=0, **kwargs):
+  def __init__(self, cache_byte_size=0, cache_engine="intervals", **kwargs):
     """
-    :param int cache_byte_size:
+    :param int cache_byte_size: -1 means to cache everything
+    :param str cache_engine: "intervals" (default): a start cache of the first seqs of the epoch,
+      and the remaining seqs are loaded range-wise.
+      "lru": see :class:`SeqFrameCache`. Keyed by the real seq idx, thus the cache is kept across epochs,
+      and it works with any seq ordering and with partition_epoch.
     """
     super(CachedDataset, self).__init__(**kwargs)
+    assert cache_engine in ["intervals", "lru"], "%s: invalid cache_engine %r" % (self, cache_engine)
+    self.cache_engine = cache_engine
     self.cache_byte_size_total_limit = cache_byte_size
-    if cache_byte_size == -1:
+    self._seq_cache = None  # type: typing.Optional[SeqFrameCache]
+    if cache_engine == "lru":
+      # The start cache and all the alloc intervals logic is disabled in that case.
+      assert self.shuffle_frames_of_nseqs == 0, "%s: shuffle_frames_of_nseqs not supported with the LRU cache" % self
+      self.cache_byte_size_limit_at_start = 0
+    elif cache_byte_size == -1:
       self.cache_byte_size_limit_at_start = 1024 ** 4
     elif cache_byte_size == 0:
       self.cache_byte_size_limit_at_start = 0
@@ -47,6 +235,9 @@ class CachedDataset(Dataset):
   def initialize(self):
     super(CachedDataset, self).initialize()
 
+    if self.cache_engine == "lru" and self.cache_byte_size_total_limit != 0:
+      self._init_seq_cache()
+
     if self.cache_byte_size_limit_at_start > 0:
       # Calculate cache sizes.
       temp_cache_size_bytes = max(0, self.cache_byte_size_total_limit)
@@ -100,6 +291,68 @@ class CachedDataset(Dataset):
         return False
     return True
 
+  def _init_seq_cache(self):
+    """
+    Creates the :class:`SeqFrameCache`. The budget is cache_byte_size, or the whole corpus for -1.
+    """
+    frame_shape = self.get_data_shape("data")
+    frame_bytes = numpy.dtype(self.get_data_dtype("data")).itemsize * int(numpy.prod(frame_shape))
+    total_frames = sum(self._get_seq_length_by_real_idx(i)[0] for i in range(self._num_seqs))
+    if self.cache_byte_size_total_limit == -1:
+      num_frames = total_frames
+    else:
+      num_frames = min(self.cache_byte_size_total_limit // frame_bytes, total_frames)
+    num_frames = max(num_frames, 1)
+    self._seq_cache = SeqFrameCache(num_frames=num_frames, frame_shape=frame_shape, dtype=self.get_data_dtype("data"))
+    print("%s: LRU seq cache of %i frames (%s), corpus has %i frames" % (
+      self, num_frames, human_bytes_size(num_frames * frame_bytes), total_frames), file=log.v4)
+
+  def _load_seqs_with_seq_cache(self, start, end):
+    """
+    Loads the seqs which are not in the :class:`SeqFrameCache` via :func:`_read_seqs`.
+
+    :param int start: start sorted seq idx
+    :param int end: end sorted seq idx
+    """
+    if self._seq_cache is None:
+      self._init_seq_cache()
+    cache = self._seq_cache
+    real_seq_idxs = [self.get_corpus_seq_idx(idc) for idc in range(start, end)]
+    pinned = set(real_seq_idxs)
+    missing = [ids for ids in sorted(pinned) if not cache.touch(ids)]
+    if not missing:
+      return
+    num_frames = sum(self._get_seq_length_by_real_idx(ids)[0] for ids in pinned)
+    if num_frames > cache.num_frames:
+      raise Exception(
+        "%s: load_seqs(%i, %i) needs %i frames but the cache only has %i frames, increase cache_byte_size" % (
+          self, start, end, num_frames, cache.num_frames))
+    cache.make_room(num_frames=sum(self._get_seq_length_by_real_idx(ids)[0] for ids in missing), pinned=pinned)
+    for ids, data in self._read_seqs(missing).items():
+      x = self.preprocess(data["data"])
+      if self.window > 1:
+        x = self.sliding_window(x)
+      cache.add(ids, x, other={k: v for (k, v) in data.items() if k != "data"}, pinned=pinned)
+
+  def _read_seqs(self, real_seq_idxs):
+    """
+    Used by the LRU cache (cache_engine="lru").
+
+    :param list[int] real_seq_idxs: in any order
+    :return: real seq idx -> data key -> raw data
+    :rtype: dict[int,dict[str,numpy.ndarray]]
+    """
+    raise NotImplementedError
+
+  def finish_epoch(self):
+    """
+    Logs the cache statistics of the epoch.
+    """
+    if self._seq_cache is not None:
+      print("%s: seq cache: %s" % (self, self._seq_cache.get_stats_str()), file=log.v3)
+      self._seq_cache.reset_stats()
+    super(CachedDataset, self).finish_epoch()
+
   def get_current_seq_order(self):
     assert self.cache_byte_size_limit_at_start == 0  # not implemented otherwise, we ignore _index_map
     return self._seq_index
@@ -179,6 +432,10 @@ class CachedDataset(Dataset):
     assert start >= 0
     assert start <= end
 
+    if self.cache_engine == "lru" and self.cache_byte_size_total_limit != 0:
+      self._load_seqs_with_seq_cache(start, end)
+      return
+
     if self.is_cached(start, end, blocking=True):
       return
 
@@ -447,6 +704,9 @@ class CachedDataset(Dataset):
     if start == end:
       return True  # Empty.
     assert start < end
+    if self.cache_engine == "lru":
+      return self._seq_cache is not None and all(
+        self.get_corpus_seq_idx(idc) in self._seq_cache for idc in range(start, end))
     if blocking and end <= self.preload_end:
       while not set(range(start,end)) <= self.preload_set:
         time.sleep(0.2)
@@ -492,6 +752,10 @@ class CachedDataset(Dataset):
     return self.timestamps[seq_start:seq_start + seq_len]
 
   def get_input_data(self, sorted_seq_idx):
+    if self._seq_cache is not None:
+      data = self._seq_cache.get(self.get_corpus_seq_idx(sorted_seq_idx))
+      assert data is not None, "seq %i not loaded" % sorted_seq_idx
+      return data
     seq_idx = self._index_map[sorted_seq_idx]
     idi = self.alloc_interval_index(seq_idx)
     assert idi >= 0, "failed to get data for seq %i" % sorted_seq_idx
@@ -508,6 +772,10 @@ class CachedDataset(Dataset):
     return self.num_outputs[key][0]
 
   def get_targets(self, target, sorted_seq_idx):
+    if self._seq_cache is not None:
+      data = self._seq_cache.get(self.get_corpus_seq_idx(sorted_seq_idx), key=target)
+      assert data is not None, "seq %i not loaded" % sorted_seq_idx
+      return data
     seq_idx = self._index_map[sorted_seq_idx]
     idx = self.target_keys.index(target) + 1
     seq_start = self.get_seq_start(seq_idx)[idx]
@@ -4,7 +4,9 @@ Provides :class:`CachedDataset2`.
 """
 
 from Dataset import Dataset, DatasetSeq
-from threading import Condition
+from threading import Condition, Thread
+from collections import deque
+import time
 import typing
 try:
   # noinspection PyCompatibility
@@ -26,16 +28,34 @@ class CachedDataset2(Dataset):
   - handle seq ordering by overriding `init_seq_order`
   - you can set `_estimated_num_seqs`
   - you can set `_num_seqs` or `_num_timesteps` if you know them in advance
+
+  Prefetching (prefetch_num_seqs > 0) calls `_prefetch_collect_single_seq` in background threads,
+  for the next seqs of the epoch, while the consumer still works on the earlier ones.
+  By default, this is just `_collect_single_seq`, which then must not depend on `_load_seqs`.
+  Otherwise, override `_prefetch_collect_single_seq` to do the loading there (e.g. :class:`MetaDataset`),
+  or assert that prefetching is disabled (e.g. :class:`CombinedDataset`).
+  With prefetch_num_threads > 1, it must be thread-safe and work in any order.
   """
 
-  def __init__(self, **kwargs):
+  def __init__(self, prefetch_num_seqs=0, prefetch_num_threads=1, prefetch_max_bytes=None, **kwargs):
+    """
+    :param int prefetch_num_seqs: collect up to this number of seqs ahead in the background. 0 disables prefetching
+    :param int prefetch_num_threads: with 1, the seqs are collected in order
+    :param int|None prefetch_max_bytes: budget for the prefetched seqs together with the buffer (added_data)
+    """
     super(CachedDataset2, self).__init__(**kwargs)
     self._num_timesteps = None
     self.epoch = None
     self.reached_final_seq = False
-    self.added_data = []  # type: typing.List[DatasetSeq]
+    self.added_data = DatasetSeqBuffer()
     self.expected_load_seq_start = 0
     self._num_timesteps_accumulated = 0
+    self.prefetch_num_seqs = prefetch_num_seqs
+    self.prefetch_num_threads = prefetch_num_threads
+    self.prefetch_max_bytes = prefetch_max_bytes
+    self._prefetcher = None  # type: typing.Optional[SeqPrefetcher]
+    self._added_data_bytes = 0
+    self.load_wait_time = 0.0  # time in _load_seqs waiting for seqs in this epoch
 
   def init_seq_order(self, epoch=None, seq_list=None):
     """
@@ -47,37 +67,45 @@ class CachedDataset2(Dataset):
     This is called when we start a new epoch, or at initialization.
     Call this when you reset the seq list.
     """
+    self._stop_prefetcher()
     super(CachedDataset2, self).init_seq_order(epoch=epoch, seq_list=seq_list)
     if not epoch:
       epoch = 1
     self.expected_load_seq_start = 0
     self.reached_final_seq = False
-    self.added_data = []
+    self.added_data = DatasetSeqBuffer()
+    self._added_data_bytes = 0
     self._num_timesteps_accumulated = 0
     self._num_seqs = None
     self.epoch = epoch
+    self.load_wait_time = 0.0
     return True
 
+  def finish_epoch(self):
+    """
+    Stops the prefetching.
+    """
+    self._stop_prefetcher()
+    super(CachedDataset2, self).finish_epoch()
+
+  def _stop_prefetcher(self):
+    if self._prefetcher:
+      self._prefetcher.stop()
+      self._prefetcher = None
+
   def _cleanup_old_seqs(self, seq_idx_end):
     """
     :param int seq_idx_end:
     """
-    i = 0
-    while i < len(self.added_data):
-      if self.added_data[i].seq_idx >= seq_idx_end:
-        break
-      i += 1
-    del self.added_data[:i]
+    while self.added_data and self.added_data[0].seq_idx < seq_idx_end:
+      self._added_data_bytes -= self.added_data.popleft().get_num_bytes()
 
   def _get_seq(self, seq_idx):
     """
     :param int seq_idx:
     :rtype: DatasetSeq|None
     """
-    for data in self.added_data:
-      if data.seq_idx == seq_idx:
-        return data
-    return None
+    return self.added_data.get(seq_idx)
 
   def is_cached(self, start, end):
     """
@@ -114,11 +142,38 @@ class CachedDataset2(Dataset):
       self.expected_load_seq_start = start
     if self.added_data:
       start = max(self.added_data[-1].seq_idx + 1, start)
-    seqs = [self._collect_single_seq(seq_idx=seq_idx) for seq_idx in range(start, end)]
+    if self.prefetch_num_seqs > 0:
+      seqs = self._get_prefetched_seqs(start, end)
+    else:
+      start_time = time.time()
+      seqs = [self._collect_single_seq(seq_idx=seq_idx) for seq_idx in range(start, end)]
+      self.load_wait_time += time.time() - start_time
     seqs = list(filter(None, seqs))  # We might not know the num seqs in advance.
     self._num_timesteps_accumulated += sum([seq.num_frames for seq in seqs])
+    self._added_data_bytes += sum([seq.get_num_bytes() for seq in seqs])
     self.added_data += seqs
 
+  def _get_prefetched_seqs(self, start, end):
+    """
+    :param int start:
+    :param int end:
+    :return: seqs from the prefetcher, None for seqs after the end
+    :rtype: list[DatasetSeq|None]
+    """
+    if not self._prefetcher:
+      self._prefetcher = SeqPrefetcher(
+        collect_func=lambda seq_idx: self._prefetch_collect_single_seq(seq_idx=seq_idx),
+        start_seq_idx=start, end_seq_idx=self._num_seqs,
+        num_seqs_ahead=self.prefetch_num_seqs, num_threads=self.prefetch_num_threads,
+        max_bytes=self.prefetch_max_bytes, name="%s prefetch" % self)
+    wait_time = self._prefetcher.wait_time
+    seqs = []
+    for seq_idx in range(start, end):
+      self._prefetcher.set_extra_bytes(self._added_data_bytes + sum([seq.get_num_bytes() for seq in seqs if seq]))
+      seqs.append(self._prefetcher.get(seq_idx))
+    self.load_wait_time += self._prefetcher.wait_time - wait_time
+    return seqs
+
   def is_less_than_num_seqs(self, n):
     """
     :param int n:
@@ -149,6 +204,16 @@ class CachedDataset2(Dataset):
     """
     raise NotImplementedError
 
+  def _prefetch_collect_single_seq(self, seq_idx):
+    """
+    Called by the prefetcher, in a background thread, instead of `_load_seqs` and `_collect_single_seq`.
+
+    :param int seq_idx:
+    :rtype: DatasetSeq | None
+    :returns DatasetSeq or None if seq_idx >= num_seqs.
+    """
+    return self._collect_single_seq(seq_idx=seq_idx)
+
   def get_num_timesteps(self):
     """
     :rtype: int
@@ -268,6 +333,255 @@ class CachedDataset2(Dataset):
     return str(self.added_data[0].get_data(key).dtype)
 
 
+class DatasetSeqBuffer(object):
+  """
+  The buffer of loaded seqs, see :attr:`CachedDataset2.added_data`, ordered by seq idx.
+  This behaves mostly like a list, but the lookup by seq idx, appending at the end and removing at the front
+  are all O(1).
+  Other modifications (e.g. slice assignment) rebuild the index.
+  """
+
+  def __init__(self, seqs=()):
+    """
+    :param typing.Iterable[DatasetSeq] seqs:
+    """
+    self._seqs = deque()  # type: typing.Deque[DatasetSeq]
+    self._seqs_by_idx = {}  # type: typing.Dict[int,DatasetSeq]
+    self.extend(seqs)
+
+  def __repr__(self):
+    return "<%s %r>" % (self.__class__.__name__, list(self._seqs))
+
+  def __len__(self):
+    return len(self._seqs)
+
+  def __iter__(self):
+    return iter(self._seqs)
+
+  def __getitem__(self, item):
+    """
+    :param int|slice item: position (not seq idx)
+    :rtype: DatasetSeq|list[DatasetSeq]
+    """
+    if isinstance(item, slice):
+      return list(self._seqs)[item]
+    return self._seqs[item]
+
+  def __setitem__(self, item, value):
+    """
+    :param int|slice item: position (not seq idx)
+    :param DatasetSeq|list[DatasetSeq] value:
+    """
+    seqs = list(self._seqs)
+    seqs[item] = value
+    self._reset(seqs)
+
+  def __delitem__(self, item):
+    """
+    :param int|slice item: position (not seq idx)
+    """
+    if isinstance(item, slice) and not item.start and item.step is None and item.stop is not None and item.stop >= 0:
+      for _ in range(min(item.stop, len(self._seqs))):
+        self.popleft()
+      return
+    seqs = list(self._seqs)
+    del seqs[item]
+    self._reset(seqs)
+
+  def __iadd__(self, seqs):
+    """
+    :param typing.Iterable[DatasetSeq] seqs:
+    :rtype: DatasetSeqBuffer
+    """
+    self.extend(seqs)
+    return self
+
+  def _reset(self, seqs):
+    """
+    :param list[DatasetSeq] seqs:
+    """
+    self.clear()
+    self.extend(seqs)
+
+  def append(self, seq):
+    """
+    :param DatasetSeq seq:
+    """
+    self._seqs.append(seq)
+    self._seqs_by_idx[seq.seq_idx] = seq
+
+  def extend(self, seqs):
+    """
+    :param typing.Iterable[DatasetSeq] seqs:
+    """
+    for seq in seqs:
+      self.append(seq)
+
+  def popleft(self):
+    """
+    :return: the first seq, which is removed
+    :rtype: DatasetSeq
+    """
+    seq = self._seqs.popleft()
+    if self._seqs_by_idx.get(seq.seq_idx) is seq:
+      del self._seqs_by_idx[seq.seq_idx]
+    return seq
+
+  def clear(self):
+    """
+    Removes all seqs.
+    """
+    self._seqs.clear()
+    self._seqs_by_idx.clear()
+
+  def get(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: DatasetSeq|None
+    """
+    return self._seqs_by_idx.get(seq_idx)
+
+
+class SeqPrefetcher(object):
+  """
+  Collects seqs in background threads, ahead of the consumer, which gets them in increasing seq idx order.
+  The number of seqs ahead and the bytes are limited.
+  """
+
+  def __init__(self, collect_func, start_seq_idx=0, end_seq_idx=None, num_seqs_ahead=10, num_threads=1,
+               max_bytes=None, name=None):
+    """
+    :param (int)->(DatasetSeq|None) collect_func: returns None for seq idx >= num seqs
+    :param int start_seq_idx:
+    :param int|None end_seq_idx: exclusive. None if unknown in advance
+    :param int num_seqs_ahead:
+    :param int num_threads: with 1, collect_func is called in increasing seq idx order
+    :param int|None max_bytes: limit of the prefetched bytes together with the extra bytes, see :func:`set_extra_bytes`
+    :param str|None name:
+    """
+    assert num_seqs_ahead > 0 and num_threads > 0
+    self.collect_func = collect_func
+    self.num_seqs_ahead = num_seqs_ahead
+    self.max_bytes = max_bytes
+    self.condition = Condition()
+    self.next_seq_idx = start_seq_idx  # next seq to be collected by some worker
+    self.consumer_seq_idx = start_seq_idx  # next seq the consumer wants
+    self.end_seq_idx = end_seq_idx
+    self.results = {}  # type: typing.Dict[int,typing.Union[DatasetSeq,None,BaseException]]
+    self.result_bytes = 0
+    self.extra_bytes = 0
+    self.wait_time = 0.0
+    self.stopped = False
+    self.threads = [
+      Thread(target=self._worker_loop, name="%s worker %i" % (name or "SeqPrefetcher", i))
+      for i in range(num_threads)]
+    for thread in self.threads:
+      thread.daemon = True
+      thread.start()
+
+  def _may_collect(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: bool
+    """
+    if seq_idx <= self.consumer_seq_idx:
+      return True  # the consumer waits for it, so never block this
+    if seq_idx >= self.consumer_seq_idx + self.num_seqs_ahead:
+      return False
+    if self.max_bytes is not None and self.result_bytes + self.extra_bytes >= self.max_bytes:
+      return False
+    return True
+
+  def _worker_loop(self):
+    while True:
+      with self.condition:
+        while True:
+          if self.stopped:
+            return
+          if self.end_seq_idx is not None and self.next_seq_idx >= self.end_seq_idx:
+            return
+          if self._may_collect(self.next_seq_idx):
+            break
+          self.condition.wait()
+        seq_idx = self.next_seq_idx
+        self.next_seq_idx += 1
+      # noinspection PyBroadException
+      try:
+        result = self.collect_func(seq_idx)
+      except BaseException as exc:
+        result = exc
+      with self.condition:
+        if result is None or isinstance(result, BaseException):
+          # No further seqs after this one.
+          if self.end_seq_idx is None or self.end_seq_idx > seq_idx + 1:
+            self.end_seq_idx = seq_idx if result is None else seq_idx + 1
+        if seq_idx >= self.consumer_seq_idx:
+          self.results[seq_idx] = result
+          if isinstance(result, DatasetSeq):
+            self.result_bytes += result.get_num_bytes()
+        self.condition.notify_all()
+
+  def set_extra_bytes(self, num_bytes):
+    """
+    :param int num_bytes: bytes which count to the max_bytes budget as well, e.g. the buffer of the consumer
+    """
+    with self.condition:
+      self.extra_bytes = num_bytes
+      self.condition.notify_all()
+
+  def get(self, seq_idx):
+    """
+    Blocks until the seq is collected.
+
+    :param int seq_idx: must not be smaller than the seq idx of the last call
+    :return: the seq, or None if seq_idx >= num seqs
+    :rtype: DatasetSeq|None
+    """
+    start_time = time.time()
+    with self.condition:
+      assert not self.stopped
+      assert seq_idx >= self.consumer_seq_idx, "%s: requested seq %i but already at %i" % (
+        self, seq_idx, self.consumer_seq_idx)
+      for i in [i for i in self.results if i < seq_idx]:  # skipped seqs
+        self._pop_result(i)
+      self.consumer_seq_idx = seq_idx
+      self.next_seq_idx = max(self.next_seq_idx, seq_idx)
+      self.condition.notify_all()
+      while seq_idx not in self.results:
+        if self.end_seq_idx is not None and seq_idx >= self.end_seq_idx:
+          break
+        self.condition.wait()
+      result = self._pop_result(seq_idx)
+      self.consumer_seq_idx = seq_idx + 1
+      self.condition.notify_all()
+    self.wait_time += time.time() - start_time
+    if isinstance(result, BaseException):
+      raise result
+    return result
+
+  def _pop_result(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: DatasetSeq|None|BaseException
+    """
+    result = self.results.pop(seq_idx, None)
+    if isinstance(result, DatasetSeq):
+      self.result_bytes -= result.get_num_bytes()
+    return result
+
+  def stop(self):
+    """
+    Stops the workers, and waits for them to finish their current seq.
+    """
+    with self.condition:
+      self.stopped = True
+      self.condition.notify_all()
+    for thread in self.threads:
+      thread.join()
+    self.results.clear()
+    self.result_bytes = 0
+
+
 class SingleStreamPipeDataset(CachedDataset2):
   """
   Producer: Gets data from somewhere / an external source, running in some thread.
@@ -23,7 +23,7 @@ import functools
 import typing
 
 from Log import log
-from EngineBatch import Batch, BatchSetGenerator
+from EngineBatch import Batch, BatchPlan, BatchSetGenerator
 from Util import PY3, try_run, NumbersDict, unicode, OptionalNotImplementedError
 
 
@@ -32,6 +32,10 @@ class Dataset(object):
   Base class for any dataset. This defines the dataset API.
   """
 
+  # Whether the get_seq_len passed to get_seq_order_for_epoch only depends on the original seq idx,
+  # i.e. is the same in every epoch. Then the seq lens can be cached, see seq_order_seq_lens_cache.
+  _seq_order_seq_lens_static = True
+
   @staticmethod
   def kwargs_update_from_config(config, kwargs):
     """
@@ -87,7 +91,7 @@ class Dataset(object):
                seq_ordering='default', random_seed_offset=0,
                partition_epoch=None, repeat_epoch=None,
                seq_list_filter_file=None, unique_seq_tags=False,
-               seq_order_seq_lens_file=None,
+               seq_order_seq_lens_file=None, seq_order_seq_lens_cache=None, batch_plan_cache=None,
                shuffle_frames_of_nseqs=0, min_chunk_size=0, chunking_variance=0,
                estimated_num_seqs=None):
     """
@@ -96,7 +100,7 @@ class Dataset(object):
       not all datasets support this option.
     :param None|int|dict|NumbersDict|(dict,dict) context_window: will add this context for each chunk
     :param None|str|int|(int,int)|dict|(dict,dict) chunking: "chunk_size:chunk_step"
-    :param str seq_ordering: "batching"-option in config. e.g. "default", "sorted" or "random".
+    :param str seq_ordering: "batching"-option in config. e.g. "default", "sorted", "random" or "bucketed".
       See self.get_seq_order_for_epoch() for more details.
     :param int random_seed_offset:
     :param int|None partition_epoch:
@@ -106,6 +110,18 @@ class Dataset(object):
     :param str|None seq_list_filter_file: defines a subset of sequences (by tag) to use
     :param bool unique_seq_tags: uniquify seqs with same seq tags in seq order
     :param str|None seq_order_seq_lens_file: for seq order, use the seq length given by this file
+    :param bool|str|None seq_order_seq_lens_cache: for seq order, keep the seq lengths across epochs in memory,
+      unless this is False.
+      If this is True or a str and the dataset was created via :func:`init_dataset`,
+      they are also stored in a file (numpy, memory-mapped), keyed by a hash of the dataset options,
+      and thus also reused after a restart.
+      If this is a str, it is the directory for these files, otherwise some temp dir is used.
+    :param bool|str|None batch_plan_cache: store the batches of an epoch (a :class:`BatchPlan`) in a file,
+      once they were generated completely, and load them from there when they are requested again,
+      e.g. after a restart. This needs the dataset to be created via :func:`init_dataset`.
+      The file is keyed by the dataset options, the epoch and the batching options.
+      If this is a str, it is the directory for these files, otherwise some temp dir is used.
+      See also :func:`precompute_batch_plan`.
     :param int shuffle_frames_of_nseqs: shuffles the frames. not always supported
     :param None|int estimated_num_seqs: for progress reporting in case the real num_seqs is unknown
     """
@@ -123,6 +139,13 @@ class Dataset(object):
     self.unique_seq_tags = unique_seq_tags
     self._seq_order_seq_lens_file = seq_order_seq_lens_file
     self._seq_order_seq_lens_by_idx = None
+    self.seq_order_seq_lens_cache = seq_order_seq_lens_cache
+    self._seq_order_seq_lens_cache_key = None  # type: typing.Optional[str]
+    # Set by init_dataset. (class name, kwargs), for seq_order_seq_lens_cache_key, which is calculated on demand.
+    self._init_dataset_kwargs = None  # type: typing.Optional[typing.Tuple[str,typing.Dict[str]]]
+    self._seq_order_seq_lens_array = None  # type: typing.Optional[numpy.ndarray]
+    self._seq_order_group_ids = None  # type: typing.Optional[numpy.ndarray]  # for "bucketed", seq idx -> group
+    self.batch_plan_cache = batch_plan_cache
     # There is probably no use case for combining the two, so avoid potential misconfiguration.
     assert self.partition_epoch == 1 or self.repeat_epoch == 1, (
       "Combining partition_epoch and repeat_epoch is prohibited.")
@@ -362,11 +385,71 @@ class Dataset(object):
       self._seq_order_seq_lens_by_idx = [seq_lens[tag] for tag in all_tags]
     return self._seq_order_seq_lens_by_idx[seq_idx]
 
+  @property
+  def seq_order_seq_lens_cache_key(self):
+    """
+    :return: hash of the dataset options (see :func:`init_dataset`), or None.
+      Only calculated when needed, as this might stat many files.
+    :rtype: str|None
+    """
+    if self._seq_order_seq_lens_cache_key is None and self._init_dataset_kwargs:
+      self._seq_order_seq_lens_cache_key = _get_dataset_kwargs_hash(*self._init_dataset_kwargs)
+      self._init_dataset_kwargs = None
+    return self._seq_order_seq_lens_cache_key
+
+  def _get_seq_order_seq_lens_cache_filename(self):
+    """
+    :return: filename for the seq lens (numpy file), or None if we should not store them
+    :rtype: str|None
+    """
+    if not self.seq_order_seq_lens_cache or not self.seq_order_seq_lens_cache_key:
+      return None
+    if isinstance(self.seq_order_seq_lens_cache, str):
+      cache_dir = self.seq_order_seq_lens_cache
+    else:
+      from Util import get_temp_dir
+      cache_dir = "%s/returnn_seq_lens_cache" % get_temp_dir()
+    return "%s/%s.npy" % (cache_dir, self.seq_order_seq_lens_cache_key)
+
+  def _get_seq_order_seq_lens_array(self, num_seqs, get_seq_len):
+    """
+    :param int num_seqs:
+    :param (int)->int get_seq_len: original seq idx -> len
+    :return: seq lens, original seq idx -> len, shape (num_seqs,). maybe cached, see seq_order_seq_lens_cache
+    :rtype: numpy.ndarray
+    """
+    if self.seq_order_seq_lens_cache is False or not self._seq_order_seq_lens_static:
+      return numpy.array([get_seq_len(i) for i in range(num_seqs)])
+    if self._seq_order_seq_lens_array is not None and self._seq_order_seq_lens_array.shape == (num_seqs,):
+      return self._seq_order_seq_lens_array
+    filename = self._get_seq_order_seq_lens_cache_filename()
+    if filename and os.path.exists(filename):
+      seq_lens = numpy.load(filename, mmap_mode="r")
+      if seq_lens.shape == (num_seqs,):
+        print("%s: use seq lens from %r" % (self, filename), file=log.v4)
+        self._seq_order_seq_lens_array = seq_lens
+        return seq_lens
+      print("%s: seq lens file %r has shape %r but we have %i seqs, recreate it" % (
+        self, filename, seq_lens.shape, num_seqs), file=log.v3)
+    seq_lens = numpy.array([get_seq_len(i) for i in range(num_seqs)])
+    if filename:
+      from Util import maybe_make_dirs
+      maybe_make_dirs(os.path.dirname(filename))
+      tmp_filename = "%s.%i.tmp.npy" % (filename[:-len(".npy")], os.getpid())
+      numpy.save(tmp_filename, seq_lens)
+      os.rename(tmp_filename, filename)  # atomic, in case there are multiple processes
+      print("%s: stored seq lens in %r" % (self, filename), file=log.v4)
+    self._seq_order_seq_lens_array = seq_lens
+    return seq_lens
+
   def get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None):
     """
     Returns the order of the given epoch.
     This is mostly a static method, except that is depends on the configured type of ordering,
     such as 'default' (= as-is), 'sorted' or 'random'. 'sorted' also uses the sequence length.
+    'bucketed' groups seqs of similar length, such that the batches of these groups need little padding,
+    see :func:`_get_bucketed_seq_order`. :func:`_generate_batches` will not put seqs of different groups
+    into the same batch.
 
     :param int epoch: for 'random', this determines the random seed
     :param int num_seqs:
@@ -385,6 +468,11 @@ class Dataset(object):
     seq_index = list(range(num_seqs))  # type: typing.List[int]  # the real seq idx after sorting
     if self._seq_order_seq_lens_file:
       get_seq_len = self._get_seq_order_seq_lens_by_idx
+    seq_lens = None  # type: typing.Optional[numpy.ndarray]
+    group_ids = None  # type: typing.Optional[numpy.ndarray]  # real seq idx -> group, for "bucketed"
+    if self.seq_ordering.startswith(("sort", "laplace", "bucketed")):
+      assert get_seq_len
+      seq_lens = self._get_seq_order_seq_lens_array(num_seqs=num_seqs, get_seq_len=get_seq_len)
     if self.seq_ordering == 'default':
       pass  # Keep order as-is.
     elif self.seq_ordering.startswith("default_every_n:"):
@@ -399,14 +487,13 @@ class Dataset(object):
     elif self.seq_ordering == 'reverse':
       seq_index = list(reversed(seq_index))
     elif self.seq_ordering == 'sorted':
-      assert get_seq_len
-      seq_index.sort(key=get_seq_len)  # sort by length, starting with shortest
+      # Sort by length, starting with shortest. Stable sort, like list.sort.
+      seq_index = numpy.argsort(seq_lens, kind="stable").tolist()
     elif self.seq_ordering == "sorted_reverse":
-      assert get_seq_len
-      seq_index.sort(key=get_seq_len, reverse=True)  # sort by length, in reverse, starting with longest
+      # Sort by length, in reverse, starting with longest. Stable, like list.sort(reverse=True).
+      seq_index = numpy.argsort(-seq_lens, kind="stable").tolist()
     elif self.seq_ordering.startswith('sort_bin_shuffle'):
       # Shuffle seqs, sort by length, and shuffle bins (then shuffle seqs within each bin if sort_bin_shuffle_x2).
-      assert get_seq_len
       tmp = self.seq_ordering.split(':')[1:]
       # Keep this deterministic! Use fixed seed.
       if len(tmp) <= 1:
@@ -416,7 +503,8 @@ class Dataset(object):
       rnd_seed = ((full_epoch - 1) // nth + 1) if full_epoch else 1
       rnd = Random(rnd_seed + self.random_seed_offset)
       rnd.shuffle(seq_index)  # Shuffle sequences.
-      seq_index.sort(key=get_seq_len)  # Sort by length, starting with shortest.
+      seq_index = numpy.array(seq_index, dtype="int64")
+      seq_index = seq_index[numpy.argsort(seq_lens[seq_index], kind="stable")].tolist()  # Sort by length.
       if len(tmp) == 0:
         bins = 2
       else:
@@ -437,7 +525,6 @@ class Dataset(object):
         out_index += part
       seq_index = out_index
     elif self.seq_ordering.startswith('laplace'):
-      assert get_seq_len
       tmp = self.seq_ordering.split(':')[1:]
       if len(tmp) == 0:
         bins = 2
@@ -459,9 +546,28 @@ class Dataset(object):
           part = seq_index[i * len(seq_index) // bins:][:]
         else:
           part = seq_index[i * len(seq_index) // bins:(i + 1) * len(seq_index) // bins][:]
-        part.sort(key=get_seq_len, reverse=(i % 2 == 1))
-        out_index += part
+        part = numpy.array(part, dtype="int64")
+        part_seq_lens = seq_lens[part]
+        if i % 2 == 1:
+          part_seq_lens = -part_seq_lens
+        out_index += part[numpy.argsort(part_seq_lens, kind="stable")].tolist()
       seq_index = out_index
+    elif self.seq_ordering.startswith("bucketed"):
+      # "bucketed:<num_buckets>:<max_frames>:<max_seqs>", all optional.
+      # Like with "laplace", num_buckets can also be ".<num_seqs_per_bucket>".
+      # Ideally, max_frames and max_seqs are the batch_size and max_seqs of the batching.
+      tmp = self.seq_ordering.split(':')[1:]
+      if len(tmp) == 0:
+        num_buckets = 10
+      elif tmp[0].startswith("."):
+        num_buckets = max(num_seqs // int(tmp[0][1:]), 1)
+      else:
+        num_buckets = int(tmp[0])
+      max_frames = int(tmp[1]) if len(tmp) > 1 else None
+      max_seqs = int(tmp[2]) if len(tmp) > 2 else None
+      rnd = Random(full_epoch + self.random_seed_offset)
+      seq_index, group_ids = self._get_bucketed_seq_order(
+        seq_lens=seq_lens, num_buckets=num_buckets, max_frames=max_frames, max_seqs=max_seqs, rnd=rnd)
     elif self.seq_ordering.startswith('random'):
       tmp = self.seq_ordering.split(':')
       nth = int(tmp[1]) if len(tmp) > 1 else 1
@@ -492,8 +598,51 @@ class Dataset(object):
       seq_index = [i for i in seq_index if all_seq_tags[i] in self.seq_tags_filter]
       assert seq_index, "%s: empty after applying seq_list_filter_file. Example filter tags: %r, used tags: %r" % (
         self, sorted(self.seq_tags_filter)[:3], [all_seq_tags[i] for i in old_seq_index[:3]])
+    if group_ids is not None and epoch == (self.epoch or 1):  # only for the epoch in init_seq_order
+      self._seq_order_group_ids = group_ids[seq_index]
     return seq_index
 
+  @staticmethod
+  def _get_bucketed_seq_order(seq_lens, num_buckets, max_frames, max_seqs, rnd):
+    """
+    The seqs are sorted by length and split into num_buckets buckets of (roughly) equal number of seqs.
+    Inside each bucket, the seqs are grouped into batches, such that the padded number of frames
+    is at most max_frames and there are at most max_seqs seqs.
+    Then the order of all these groups is shuffled.
+
+    :param numpy.ndarray seq_lens: real seq idx -> len
+    :param int num_buckets:
+    :param int|None max_frames:
+    :param int|None max_seqs:
+    :param Random rnd:
+    :return: seq order (list of real seq idx), and real seq idx -> group idx
+    :rtype: (list[int], numpy.ndarray)
+    """
+    num_seqs = len(seq_lens)
+    seq_index = list(range(num_seqs))
+    rnd.shuffle(seq_index)  # random order for seqs of same length
+    seq_index = numpy.array(seq_index, dtype="int64")
+    seq_index = seq_index[numpy.argsort(seq_lens[seq_index], kind="stable")]
+    groups = []  # type: typing.List[numpy.ndarray]
+    for i in range(num_buckets):
+      bucket = seq_index[i * num_seqs // num_buckets:(i + 1) * num_seqs // num_buckets]
+      start = 0
+      for j in range(len(bucket)):
+        # Sorted by length, i.e. the current seq is the longest one of the group.
+        num_frames = seq_lens[bucket[j]] * (j - start + 1)
+        if j > start and (
+              (max_frames is not None and num_frames > max_frames) or
+              (max_seqs is not None and j - start + 1 > max_seqs)):
+          groups.append(bucket[start:j])
+          start = j
+      if start < len(bucket):
+        groups.append(bucket[start:])
+    rnd.shuffle(groups)
+    group_ids = numpy.zeros((num_seqs,), dtype="int64")
+    for i, group in enumerate(groups):
+      group_ids[group] = i
+    return numpy.concatenate(groups).tolist() if groups else [], group_ids
+
   @classmethod
   def _apply_partition_epoch(cls, seq_index, partition_epoch, epoch):
     """
@@ -537,6 +686,8 @@ class Dataset(object):
     This is called when we start a new epoch, or at initialization.
     Call this when you reset the seq list.
     """
+    if seq_list is not None or self.epoch is None or self.epoch != epoch:
+      self._seq_order_group_ids = None  # get_seq_order_for_epoch sets it again for "bucketed"
     self.epoch = epoch
     self.rnd_seq_drop = Random(self._get_random_seed_for_epoch(epoch=epoch))
     return False
@@ -1008,6 +1159,17 @@ class Dataset(object):
     end += self.ctx_right
     return start, end
 
+  def get_seq_lengths_array(self):
+    """
+    All the seq lengths of the current epoch (i.e. after :func:`init_seq_order`), in the order of the epoch.
+    Datasets which know the seq lengths in advance can implement this,
+    which enables the vectorized code path in :func:`_generate_batches`.
+
+    :return: data key -> seq lengths, shape (num_seqs,), or None if not available
+    :rtype: dict[str,numpy.ndarray]|None
+    """
+    return None
+
   def sample(self, seq_idx):
     """
     :param int seq_idx:
@@ -1072,6 +1234,20 @@ class Dataset(object):
     for idx in self.weights:
       self.weights[idx][1] = random() * avg_weight * pruning
       self.weights[idx][0] *= (1. + pruning)
+    if recurrent_net and NumbersDict(chunk_size) == 0:
+      seq_lens = self.get_seq_lengths_array()
+      # All the keys which the batches must cover. Otherwise, we use the generic code below.
+      required_keys = set(self.ctx_left.keys()) | set(self.ctx_right.keys())
+      required_keys |= set(used_data_keys if used_data_keys is not None else self.get_data_keys())
+      if seq_lens is not None and required_keys <= set(seq_lens.keys()):
+        for batch in self._generate_batches_vectorized(
+              seq_lens=seq_lens, batch_size=batch_size, max_seqs=max_seqs,
+              max_seq_length=max_seq_length, max_pad_size=max_pad_size, min_seq_length=min_seq_length,
+              seq_drop=seq_drop, max_total_num_seqs=max_total_num_seqs, group_ids=self._seq_order_group_ids):
+          yield batch
+        return
+    group_ids = self._seq_order_group_ids  # see seq_ordering "bucketed"
+    last_group_id = None
     for seq_idx, t_start, t_end in self.iterate_seqs(
           chunk_size=chunk_size, chunk_step=chunk_step, used_data_keys=used_data_keys):
       if not self.sample(seq_idx):
@@ -1090,9 +1266,13 @@ class Dataset(object):
           print("warning: sequence length (%r) larger than limit (%r)" % (length, batch_size), file=log.v4)
         if self.rnd_seq_drop.random() < seq_drop:
           continue
+        group_id = group_ids[seq_idx] if group_ids is not None and seq_idx < len(group_ids) else None
         dt, ds = batch.try_sequence_as_slice(length)
         if batch.num_slices >= 1:
-          if (dt * ds).any_compare(batch_size, (lambda a, b: a > b)):
+          if group_id != last_group_id:
+            yield batch
+            batch = Batch()
+          elif (dt * ds).any_compare(batch_size, (lambda a, b: a > b)):
             yield batch
             batch = Batch()
           elif ds > max_seqs:
@@ -1101,6 +1281,7 @@ class Dataset(object):
           elif (dt * ds - batch.get_total_num_frames() - length).any_compare(max_pad_size, (lambda a, b: a > b)):
             yield batch
             batch = Batch()
+        last_group_id = group_id
         batch.add_sequence_as_slice(seq_idx=seq_idx, seq_start_frame=t_start, length=length)
       else:  # Not recurrent.
         while t_start.max_value() < t_end.max_value():
@@ -1121,6 +1302,126 @@ class Dataset(object):
     if batch.get_all_slices_num_frames().max_value() > 0:
       yield batch
 
+  def _generate_batches_vectorized(self, seq_lens, batch_size, max_seqs, max_seq_length, max_pad_size, min_seq_length,
+                                   seq_drop, max_total_num_seqs, group_ids=None):
+    """
+    Same as :func:`_generate_batches` for the recurrent case without chunking, and yields the same batches,
+    but works on all the seq lengths of the epoch at once.
+    The filtering is done on the whole arrays, and the batch boundaries are determined
+    via running max and cumulative sums over a window of seqs.
+
+    :param dict[str,numpy.ndarray] seq_lens: via :func:`get_seq_lengths_array`
+    :param NumbersDict batch_size:
+    :param int|float max_seqs:
+    :param NumbersDict max_seq_length:
+    :param NumbersDict max_pad_size:
+    :param NumbersDict min_seq_length:
+    :param float seq_drop:
+    :param int|float max_total_num_seqs:
+    :param numpy.ndarray|None group_ids: seq idx -> group. seqs of different groups are not put into one batch
+    :rtype: typing.Generator[Batch]
+    """
+    from EngineBatch import BatchSeqCopyPart
+    keys = sorted(seq_lens.keys())
+    lens = numpy.stack([numpy.asarray(seq_lens[key], dtype="int64") for key in keys], axis=1)  # (num_seqs,num_keys)
+    # Do the same NumbersDict ops as in _generate_batches with zero lengths, to get the context window offsets.
+    # All these are linear in the seq length.
+    start_frame = NumbersDict.constant_like(0, numbers_dict=NumbersDict({key: 0 for key in keys}))
+    start_frame -= self.ctx_left
+    length_offset = (NumbersDict({key: 0 for key in keys}) + self.ctx_right) - start_frame
+    end_frame_value = (start_frame + length_offset).value
+    start_frame_offsets = [start_frame[key] for key in keys]
+    lens += numpy.array([length_offset[key] for key in keys], dtype="int64")
+    max_num_frames_value = NumbersDict.max([NumbersDict(0), length_offset]).value
+    columns = list(keys)
+    if length_offset.value is not None:
+      # NumbersDict.any_compare also compares the broadcast values. Treat it like another key.
+      columns.append(None)
+      lens = numpy.concatenate([lens, numpy.full((lens.shape[0], 1), length_offset.value, dtype="int64")], axis=1)
+
+    def get_limits(limit, no_limit=float("inf")):
+      """
+      Like :func:`NumbersDict.any_compare`: If the key is not in the limit, use the broadcast value, if there is any.
+
+      :param NumbersDict limit:
+      :param float no_limit: used where there is no limit
+      :return: shape (num_columns,)
+      :rtype: numpy.ndarray
+      """
+      values = [limit.dict[key] if (key is not None and key in limit.dict) else limit.value for key in columns]
+      return numpy.array([no_limit if v is None else v for v in values], dtype="float64")
+
+    batch_size_limits = get_limits(batch_size)
+    max_pad_size_limits = get_limits(max_pad_size)
+    have_max_pad_size = bool(numpy.isfinite(max_pad_size_limits).any())
+    seq_idxs = numpy.arange(lens.shape[0])
+    mask = numpy.logical_and(
+      numpy.logical_not((lens > get_limits(max_seq_length)).any(axis=1)),
+      numpy.logical_not((lens < get_limits(min_seq_length, no_limit=-float("inf"))).any(axis=1)))
+    for seq_idx in self.weights:
+      if seq_idx < len(mask) and not self.sample(seq_idx):
+        mask[seq_idx] = False
+    seq_idxs = seq_idxs[mask]
+    num_seqs_limit = len(seq_idxs)
+    if max_total_num_seqs < len(seq_idxs):
+      num_seqs_limit = int(max_total_num_seqs) + 1  # see _generate_batches, the check is before adding
+    if seq_drop:
+      kept = []
+      for seq_idx in seq_idxs:
+        if len(kept) >= num_seqs_limit:
+          break
+        if self.rnd_seq_drop.random() >= seq_drop:
+          kept.append(seq_idx)
+      seq_idxs = numpy.array(kept, dtype=seq_idxs.dtype)
+    else:
+      seq_idxs = seq_idxs[:num_seqs_limit]
+    lens = lens[seq_idxs]
+    if group_ids is not None and len(group_ids) == len(mask):  # otherwise it does not match the seq order
+      group_ids = group_ids[seq_idxs]
+    else:
+      group_ids = None
+    for i in numpy.nonzero((lens > batch_size_limits).any(axis=1))[0]:
+      length = NumbersDict(numbers_dict=dict(zip(keys, lens[i].tolist())), broadcast_value=length_offset.value)
+      print("warning: sequence length (%r) larger than limit (%r)" % (length, batch_size), file=log.v4)
+
+    num_seqs = len(seq_idxs)
+    start = 0
+    window = 16
+    while start < num_seqs:
+      limit_end = num_seqs if max_seqs >= num_seqs - start else start + int(max_seqs)
+      while True:
+        stop = min(start + window, limit_end)
+        seg = lens[start:stop]
+        cur_max = numpy.maximum.accumulate(seg, axis=0)
+        padded = cur_max * numpy.arange(1, stop - start + 1)[:, None]  # dt * ds in _generate_batches
+        exceeded = (padded > batch_size_limits).any(axis=1)
+        if have_max_pad_size:
+          exceeded |= (padded - numpy.cumsum(seg, axis=0) > max_pad_size_limits).any(axis=1)
+        if group_ids is not None:
+          exceeded |= group_ids[start:stop] != group_ids[start]
+        exceeded[0] = False  # a single seq always makes a batch
+        if exceeded.any():
+          end = start + int(numpy.argmax(exceeded))
+          break
+        if stop >= limit_end:
+          end = stop
+          break
+        window *= 2
+      window = max(16, (end - start) * 2)
+      batch = Batch()
+      for i, (seq_idx, seq_lens_) in enumerate(zip(seq_idxs[start:end].tolist(), lens[start:end].tolist())):
+        end_frame = NumbersDict(
+          numbers_dict={key: offset + length for (key, offset, length) in zip(keys, start_frame_offsets, seq_lens_)},
+          broadcast_value=end_frame_value)
+        batch.seqs.append(BatchSeqCopyPart(
+          seq_idx=seq_idx, seq_start_frame=start_frame, seq_end_frame=end_frame,
+          batch_slice=i, batch_frame_offset=0))
+      batch.num_slices = end - start
+      batch.max_num_frames_per_slice = NumbersDict(
+        numbers_dict=dict(zip(keys, lens[start:end].max(axis=0).tolist())), broadcast_value=max_num_frames_value)
+      yield batch
+      start = end
+
   def batch_set_generator_cache_whole_epoch(self):
     """
     The BatchSetGenerator can cache the list of batches which we generated across epochs.
@@ -1142,11 +1443,70 @@ class Dataset(object):
     :param kwargs: will be passed to :func:`_generate_batches`
     :rtype: BatchSetGenerator
     """
+    plan = None
+    plan_filename = self._get_batch_plan_cache_filename(**kwargs)
+    if plan_filename and os.path.exists(plan_filename):
+      plan = BatchPlan.load(plan_filename)
+      print("%s: use batch plan from %r, %i batches" % (self, plan_filename, len(plan)), file=log.v4)
+    elif plan_filename:
+      print("%s: no batch plan in %r yet, batching options %r" % (self, plan_filename, kwargs), file=log.v4)
     return BatchSetGenerator(
       dataset=self,
-      generator=self._generate_batches(**kwargs),
+      generator=iter(()) if plan is not None else self._generate_batches(**kwargs),
       shuffle_batches=shuffle_batches,
-      cache_whole_epoch=self.batch_set_generator_cache_whole_epoch())
+      cache_whole_epoch=self.batch_set_generator_cache_whole_epoch(),
+      plan=plan, plan_filename=None if plan is not None else plan_filename)
+
+  def _get_batch_plan_cache_filename(self, **kwargs):
+    """
+    :param kwargs: the batching options, as for :func:`_generate_batches`
+    :return: filename for the batch plan of the current epoch, or None if we should not store it
+    :rtype: str|None
+    """
+    if not self.batch_plan_cache or not self.seq_order_seq_lens_cache_key or self.epoch is None:
+      return None
+    import hashlib
+    opts = dict(kwargs)
+    if opts.get("used_data_keys") is not None:
+      opts["used_data_keys"] = sorted(opts["used_data_keys"])
+    # These influence the seq order or the chunking, but are not part of seq_order_seq_lens_cache_key.
+    opts.update(dict(
+      seq_ordering=self.seq_ordering, random_seed_offset=self.random_seed_offset,
+      partition_epoch=self.partition_epoch, repeat_epoch=self.repeat_epoch,
+      chunk_size=self.chunk_size, chunk_step=self.chunk_step, ctx_left=self.ctx_left, ctx_right=self.ctx_right,
+      min_chunk_size=self.min_chunk_size, chunking_variance=self.chunking_variance))
+    opts = repr(sorted(opts.items()))
+    if " at 0x" in opts:  # not stable across restarts
+      return None
+    if isinstance(self.batch_plan_cache, str):
+      cache_dir = self.batch_plan_cache
+    else:
+      from Util import get_temp_dir
+      cache_dir = "%s/returnn_batch_plan_cache" % get_temp_dir()
+    return "%s/%s_epoch%i_%s.npz" % (
+      cache_dir, self.seq_order_seq_lens_cache_key, self.epoch, hashlib.sha1(opts.encode("utf8")).hexdigest())
+
+  def precompute_batch_plan(self, epoch, **kwargs):
+    """
+    Generates all batches of the given epoch and stores them, such that :func:`generate_batches`
+    (in another process, e.g. the training) can just load them.
+    This needs the option ``batch_plan_cache``.
+    This will call :func:`init_seq_order`, thus it should be an own dataset instance.
+
+    :param int epoch:
+    :param kwargs: the batching options, exactly as they will be passed to :func:`generate_batches`,
+      except of shuffle_batches
+    :return: filename of the batch plan
+    :rtype: str
+    """
+    self.init_seq_order(epoch=epoch)
+    filename = self._get_batch_plan_cache_filename(**kwargs)
+    assert filename, "%s: batch plan cache not enabled or not possible" % self
+    if not os.path.exists(filename):
+      plan = BatchPlan.from_batches(self._generate_batches(**kwargs))
+      plan.save(filename)
+      print("%s: stored batch plan for epoch %i in %r, %i batches" % (self, epoch, filename, len(plan)), file=log.v4)
+    return filename
 
   @classmethod
   def index_shape_for_batches(cls, batches, data_key="data"):
@@ -1203,6 +1563,13 @@ class DatasetSeq:
          for (k, v) in self.features.items()}
     return NumbersDict(d)
 
+  def get_num_bytes(self):
+    """
+    :return: size of all the data of this seq
+    :rtype: int
+    """
+    return sum([v.nbytes for v in self.features.values()])
+
   def get_data(self, key):
     """
     :param str key:
@@ -1230,7 +1597,7 @@ def get_dataset_class(name):
   # because this function is only used for such cases.
   mod_names = [
     "HDFDataset", "SprintDataset", "GeneratingDataset", "NumpyDumpDataset",
-    "MetaDataset", "LmDataset", "StereoDataset", "RawWavDataset"]
+    "MetaDataset", "LmDataset", "StereoDataset", "RawWavDataset", "MemmapDataset"]
   for mod_name in mod_names:
     mod = import_module(mod_name)
     if name in vars(mod):
@@ -1282,10 +1649,59 @@ def init_dataset(kwargs, extra_kwargs=None, default_kwargs=None):
     kwargs.update(extra_kwargs)
   obj = clazz(**kwargs)
   assert isinstance(obj, Dataset)
+  obj._init_dataset_kwargs = (clazz_name, kwargs)
   obj.initialize()
   return obj
 
 
+def _get_dataset_kwargs_hash(class_name, kwargs):
+  """
+  Used as key for the seq lens cache, see :func:`Dataset._get_seq_order_seq_lens_array`.
+  Options which do not have an influence on the seq lens are ignored.
+  For existing files in the options, the mtime and size are included.
+  For directories, this covers all the files in it.
+
+  :param str class_name:
+  :param dict[str] kwargs:
+  :return: hash, or None if the options cannot be hashed in a stable way
+  :rtype: str|None
+  """
+  import hashlib
+  ignored_keys = {
+    "name", "seq_ordering", "random_seed_offset", "partition_epoch", "repeat_epoch",
+    "seq_order_seq_lens_cache", "batch_plan_cache", "chunking", "context_window", "estimated_num_seqs"}
+
+  def _file_info(value):
+    """
+    :param object value:
+    :rtype: object
+    """
+    if isinstance(value, str) and os.path.isdir(value):
+      # E.g. a corpus directory. Files in it might be rewritten, which does not change the directory itself.
+      dir_files = []
+      for dir_path, dir_names, file_names in os.walk(value):
+        dir_names.sort()
+        for fn in sorted(file_names):
+          st = os.stat(os.path.join(dir_path, fn))
+          dir_files.append((os.path.relpath(os.path.join(dir_path, fn), value), st.st_mtime, st.st_size))
+      return value, hashlib.sha1(repr(dir_files).encode("utf8")).hexdigest()
+    if isinstance(value, str) and os.path.exists(value):
+      st = os.stat(value)
+      return value, st.st_mtime, st.st_size
+    if isinstance(value, numpy.ndarray):  # repr would be truncated
+      return value.dtype.str, value.shape, hashlib.sha1(numpy.ascontiguousarray(value).tobytes()).hexdigest()
+    if isinstance(value, (list, tuple)):
+      return [_file_info(v) for v in value]
+    if isinstance(value, dict):
+      return sorted([(k, _file_info(v)) for (k, v) in value.items()])
+    return value
+
+  opts = repr(sorted([(key, _file_info(value)) for (key, value) in kwargs.items() if key not in ignored_keys]))
+  if " at 0x" in opts:  # e.g. some function or other object. this would not be the same after a restart
+    return None
+  return "%s_%s" % (class_name, hashlib.sha1(opts.encode("utf8")).hexdigest())
+
+
 def init_dataset_via_str(config_str, config=None, cache_byte_size=None, **kwargs):
   """
   :param str config_str: hdf-files, or "LmDataset:..." or so
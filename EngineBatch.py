@@ -4,8 +4,13 @@ Defines :class:`BatchSeqCopyPart` and other batch related helpers.
 This is shared across different backends.
 """
 
+from __future__ import print_function
+
+import os
 import random
 import typing
+import numpy
+from Log import log
 from Util import NumbersDict
 
 
@@ -163,6 +168,421 @@ class Batch:
       return 0
     return self.end_seq - self.start_seq
 
+  def get_parts_columns(self, keys):
+    """
+    The seq parts of the batch in columnar form, such that the batch data can be assembled
+    without any of the NumbersDict objects.
+    Values are as for the NumbersDict, e.g. ``seq.seq_start_frame.get(key)``, i.e. with the broadcast value as fallback,
+    and None if not defined.
+
+    :param list[str]|set[str] keys: data keys
+    :return: "seq_idx" -> list, "batch_slice" -> list, (field, key) -> list,
+      for field in "start", "end", "offset", "length"
+    :rtype: dict[str|(str,str),list[int|None]]
+    """
+    columns = {"seq_idx": [seq.seq_idx for seq in self.seqs], "batch_slice": [seq.batch_slice for seq in self.seqs]}
+    for key in keys:
+      columns["start", key] = [seq.seq_start_frame.get(key) for seq in self.seqs]
+      columns["end", key] = [seq.seq_end_frame.get(key) for seq in self.seqs]
+      columns["offset", key] = [seq.batch_frame_offset.get(key) for seq in self.seqs]
+      columns["length", key] = [seq.frame_length.get(key) for seq in self.seqs]
+    return columns
+
+
+class BatchPlan:
+  """
+  Many batches (e.g. all of an epoch) in a compact columnar representation,
+  as an alternative to a list of :class:`Batch` with its many small :class:`NumbersDict` objects.
+  There is one numpy record array with one row per seq part (like :class:`BatchSeqCopyPart`)
+  with the columns seq_idx, batch_slice, and start/end/offset per data key,
+  and one record array with one row per batch, with num_slices and the max num frames per slice per data key.
+  The broadcast value of a NumbersDict is stored like another key, and a missing value as :attr:`NoValue`.
+  :class:`PlannedBatch` is the view on a single batch.
+  """
+
+  NoValue = numpy.iinfo(numpy.int64).min
+  BroadcastKey = "*"
+  PartFields = ("start", "end", "offset")
+
+  def __init__(self):
+    self.keys = []  # type: typing.List[str]  # data keys, sorted, excluding BroadcastKey
+    self.num_batches = 0
+    self.num_parts = 0
+    self._parts = numpy.zeros((16,), dtype=self._get_parts_dtype(self.keys))
+    self._batches = numpy.zeros((16,), dtype=self._get_batches_dtype(self.keys))
+
+  @classmethod
+  def from_batches(cls, batches):
+    """
+    :param typing.Iterable[Batch] batches:
+    :rtype: BatchPlan
+    """
+    plan = cls()
+    for batch in batches:
+      plan.append_batch(batch)
+    return plan
+
+  def __len__(self):
+    return self.num_batches
+
+  def __repr__(self):
+    return "<%s keys %r, %i batches, %i seq parts>" % (
+      self.__class__.__name__, self.keys, self.num_batches, self.num_parts)
+
+  @classmethod
+  def _get_parts_dtype(cls, keys):
+    """
+    :param list[str] keys:
+    :rtype: numpy.dtype
+    """
+    return numpy.dtype(
+      [("seq_idx", "int64"), ("batch_slice", "int32")] +
+      [("%s:%s" % (field, key), "int64") for field in cls.PartFields for key in keys + [cls.BroadcastKey]])
+
+  @classmethod
+  def _get_batches_dtype(cls, keys):
+    """
+    :param list[str] keys:
+    :rtype: numpy.dtype
+    """
+    return numpy.dtype(
+      [("parts_start", "int64"), ("num_slices", "int32")] +
+      [("max_num_frames:%s" % key, "int64") for key in keys + [cls.BroadcastKey]])
+
+  @classmethod
+  def _numbers_dict_to_values(cls, d, keys):
+    """
+    :param NumbersDict d:
+    :param list[str] keys:
+    :return: values for keys + [BroadcastKey]
+    :rtype: list[int]
+    """
+    values = [d.dict.get(key) for key in keys] + [d.value]
+    return [cls.NoValue if v is None else int(v) for v in values]
+
+  def _numbers_dict_from_values(self, row, field):
+    """
+    :param numpy.void row: of the parts or the batches
+    :param str field:
+    :rtype: NumbersDict
+    """
+    values = {key: int(row["%s:%s" % (field, key)]) for key in self.keys}
+    broadcast_value = int(row["%s:%s" % (field, self.BroadcastKey)])
+    return NumbersDict(
+      numbers_dict={key: v for (key, v) in values.items() if v != self.NoValue},
+      broadcast_value=None if broadcast_value == self.NoValue else broadcast_value)
+
+  def _add_keys(self, keys):
+    """
+    :param set[str] keys: new keys, will be added as new columns
+    """
+    new_keys = sorted(set(self.keys) | set(keys))
+    parts = numpy.full(self._parts.shape, self.NoValue, dtype=self._get_parts_dtype(new_keys))
+    for name in self._parts.dtype.names:
+      parts[name] = self._parts[name]
+    batches = numpy.full(self._batches.shape, self.NoValue, dtype=self._get_batches_dtype(new_keys))
+    for name in self._batches.dtype.names:
+      batches[name] = self._batches[name]
+    self.keys, self._parts, self._batches = new_keys, parts, batches
+
+  @staticmethod
+  def _grow(array, size):
+    """
+    :param numpy.ndarray array:
+    :param int size: needed size
+    :return: array with at least the size, maybe the same
+    :rtype: numpy.ndarray
+    """
+    if array.shape[0] >= size:
+      return array
+    new_array = numpy.zeros((max(size, array.shape[0] * 2),), dtype=array.dtype)
+    new_array[:array.shape[0]] = array
+    return new_array
+
+  def append_batch(self, batch):
+    """
+    :param Batch batch:
+    """
+    new_keys = set(batch.max_num_frames_per_slice.keys())
+    for seq in batch.seqs:
+      new_keys.update(seq.seq_start_frame.keys(), seq.seq_end_frame.keys(), seq.batch_frame_offset.keys())
+    new_keys.difference_update(self.keys)
+    if new_keys:
+      self._add_keys(new_keys)
+    num_parts = len(batch.seqs)
+    self._parts = self._grow(self._parts, self.num_parts + num_parts)
+    self._batches = self._grow(self._batches, self.num_batches + 1)
+    if num_parts:
+      self._parts[self.num_parts:self.num_parts + num_parts] = [
+        tuple(
+          [seq.seq_idx, seq.batch_slice] +
+          self._numbers_dict_to_values(seq.seq_start_frame, self.keys) +
+          self._numbers_dict_to_values(seq.seq_end_frame, self.keys) +
+          self._numbers_dict_to_values(seq.batch_frame_offset, self.keys))
+        for seq in batch.seqs]
+    self._batches[self.num_batches] = tuple(
+      [self.num_parts, batch.num_slices] + self._numbers_dict_to_values(batch.max_num_frames_per_slice, self.keys))
+    self.num_parts += num_parts
+    self.num_batches += 1
+
+  def save(self, filename):
+    """
+    Stores the plan in a (compressed) numpy npz file.
+    The file is first written under a temporary name and then renamed, in case there are multiple processes.
+
+    :param str filename: should end with ".npz"
+    """
+    from Util import maybe_make_dirs
+    assert filename.endswith(".npz")
+    maybe_make_dirs(os.path.dirname(filename) or ".")
+    tmp_filename = "%s.%i.tmp.npz" % (filename[:-len(".npz")], os.getpid())
+    numpy.savez_compressed(
+      tmp_filename,
+      keys=numpy.array(self.keys, dtype="U"),
+      parts=self._parts[:self.num_parts], batches=self._batches[:self.num_batches])
+    os.rename(tmp_filename, filename)
+
+  @classmethod
+  def load(cls, filename):
+    """
+    :param str filename: via :func:`save`
+    :rtype: BatchPlan
+    """
+    with numpy.load(filename) as f:
+      plan = cls()
+      plan.keys = [str(key) for key in f["keys"]]
+      plan._parts = f["parts"]
+      plan._batches = f["batches"]
+    assert plan._parts.dtype == cls._get_parts_dtype(plan.keys)
+    assert plan._batches.dtype == cls._get_batches_dtype(plan.keys)
+    plan.num_parts = plan._parts.shape[0]
+    plan.num_batches = plan._batches.shape[0]
+    return plan
+
+  def get_batch(self, batch_idx):
+    """
+    :param int batch_idx:
+    :rtype: PlannedBatch
+    """
+    assert 0 <= batch_idx < self.num_batches
+    return PlannedBatch(plan=self, batch_idx=batch_idx)
+
+  def get_batches(self):
+    """
+    :rtype: list[PlannedBatch]
+    """
+    return [PlannedBatch(plan=self, batch_idx=i) for i in range(self.num_batches)]
+
+  def get_parts(self, batch_idx):
+    """
+    :param int batch_idx:
+    :return: rows of the seq parts of the batch
+    :rtype: numpy.ndarray
+    """
+    start = self._batches["parts_start"][batch_idx]
+    end = self._batches["parts_start"][batch_idx + 1] if batch_idx + 1 < self.num_batches else self.num_parts
+    return self._parts[start:end]
+
+  def get_batch_row(self, batch_idx):
+    """
+    :param int batch_idx:
+    :rtype: numpy.void
+    """
+    return self._batches[batch_idx]
+
+  def get_sub_plan(self, batch_idxs):
+    """
+    :param list[int] batch_idxs:
+    :return: plan with a copy of only these batches
+    :rtype: BatchPlan
+    """
+    plan = BatchPlan()
+    plan.keys = list(self.keys)
+    parts = [self.get_parts(i) for i in batch_idxs]
+    plan._parts = numpy.concatenate(parts) if parts else self._parts[:0].copy()
+    plan._batches = self._batches[batch_idxs].copy()
+    plan._batches["parts_start"] = numpy.cumsum([0] + [len(p) for p in parts[:-1]])[:len(batch_idxs)]
+    plan.num_batches = len(batch_idxs)
+    plan.num_parts = plan._parts.shape[0]
+    return plan
+
+  def get_part_values(self, parts, field, key):
+    """
+    :param numpy.ndarray parts: via :func:`get_parts`
+    :param str field: "start", "end" or "offset"
+    :param str key: data key
+    :return: like ``NumbersDict.get``, i.e. the broadcast value as fallback, and otherwise NoValue
+    :rtype: numpy.ndarray
+    """
+    values = parts["%s:%s" % (field, self.BroadcastKey)]
+    if key in self.keys:
+      key_values = parts["%s:%s" % (field, key)]
+      values = numpy.where(key_values != self.NoValue, key_values, values)
+    return values
+
+  def get_parts_columns(self, batch_idx, keys):
+    """
+    :param int batch_idx:
+    :param list[str]|set[str] keys:
+    :return: see :func:`Batch.get_parts_columns`
+    :rtype: dict[str|(str,str),list[int|None]]
+    """
+    parts = self.get_parts(batch_idx)
+
+    def to_list(values):
+      """
+      :param numpy.ndarray values:
+      :rtype: list[int|None]
+      """
+      values = values.tolist()
+      if self.NoValue in values:
+        values = [None if v == self.NoValue else v for v in values]
+      return values
+
+    columns = {"seq_idx": parts["seq_idx"].tolist(), "batch_slice": parts["batch_slice"].tolist()}
+    for key in keys:
+      columns["start", key] = to_list(self.get_part_values(parts, "start", key))
+      columns["end", key] = to_list(self.get_part_values(parts, "end", key))
+      columns["offset", key] = to_list(self.get_part_values(parts, "offset", key))
+      columns["length", key] = to_list(self.get_part_lengths(parts, key))
+    return columns
+
+  def get_part_lengths(self, parts, key):
+    """
+    :param numpy.ndarray parts: via :func:`get_parts`
+    :param str key: data key, or BroadcastKey
+    :return: like ``seq.frame_length.get(key)``, and NoValue if not defined
+    :rtype: numpy.ndarray
+    """
+    start = self.get_part_values(parts, "start", key)
+    end = self.get_part_values(parts, "end", key)
+    # Like NumbersDict subtraction: a missing value counts as 0, unless both are missing.
+    start_missing, end_missing = start == self.NoValue, end == self.NoValue
+    length = numpy.where(end_missing, 0, end) - numpy.where(start_missing, 0, start)
+    length[numpy.logical_and(start_missing, end_missing)] = self.NoValue
+    return length
+
+  def get_total_num_frames(self, batch_idx):
+    """
+    :param int batch_idx:
+    :return: like the sum over ``seq.frame_length``, see :func:`Batch.get_total_num_frames`
+    :rtype: NumbersDict
+    """
+    parts = self.get_parts(batch_idx)
+
+    def sum_lengths(key):
+      """
+      :param str key: data key, or BroadcastKey
+      :return: like NumbersDict addition, i.e. a missing value counts as 0, unless all are missing
+      :rtype: int|None
+      """
+      length = self.get_part_lengths(parts, key)
+      length = length[length != self.NoValue]
+      return int(length.sum()) if len(length) else None
+
+    if not len(parts):
+      return NumbersDict(0)
+    # A key is in the dict of the sum if it is in the dict of start or end of any seq part.
+    keys = [
+      key for key in self.keys
+      if numpy.any(parts["start:%s" % key] != self.NoValue) or numpy.any(parts["end:%s" % key] != self.NoValue)]
+    return NumbersDict(
+      numbers_dict={key: sum_lengths(key) for key in keys}, broadcast_value=sum_lengths(self.BroadcastKey))
+
+
+class PlannedBatch(Batch):
+  """
+  A single batch of a :class:`BatchPlan`, with the (read-only) interface of :class:`Batch`.
+  The :class:`BatchSeqCopyPart` objects are only created when :attr:`seqs` is accessed.
+  """
+
+  # noinspection PyMissingConstructor
+  def __init__(self, plan, batch_idx):
+    """
+    :param BatchPlan plan:
+    :param int batch_idx:
+    """
+    self.plan = plan
+    self.batch_idx = batch_idx
+
+  def __repr__(self):
+    return "<PlannedBatch %i start_seq:%r, num seq parts:%i>" % (
+      self.batch_idx, self.start_seq, len(self.plan.get_parts(self.batch_idx)))
+
+  def __reduce__(self):
+    # Do not pickle the whole plan, e.g. when sent to a worker process.
+    return PlannedBatch, (self.plan.get_sub_plan([self.batch_idx]), 0)
+
+  @property
+  def seqs(self):
+    """
+    :rtype: list[BatchSeqCopyPart]
+    """
+    return [
+      BatchSeqCopyPart(
+        seq_idx=int(row["seq_idx"]),
+        seq_start_frame=self.plan._numbers_dict_from_values(row, "start"),
+        seq_end_frame=self.plan._numbers_dict_from_values(row, "end"),
+        batch_slice=int(row["batch_slice"]),
+        batch_frame_offset=self.plan._numbers_dict_from_values(row, "offset"))
+      for row in self.plan.get_parts(self.batch_idx)]
+
+  @property
+  def num_slices(self):
+    """
+    :rtype: int
+    """
+    return int(self.plan.get_batch_row(self.batch_idx)["num_slices"])
+
+  @property
+  def max_num_frames_per_slice(self):
+    """
+    :rtype: NumbersDict
+    """
+    return self.plan._numbers_dict_from_values(self.plan.get_batch_row(self.batch_idx), "max_num_frames")
+
+  @property
+  def start_seq(self):
+    """
+    :rtype: int|None
+    """
+    parts = self.plan.get_parts(self.batch_idx)
+    if not len(parts):
+      return None
+    return int(parts["seq_idx"].min())
+
+  @property
+  def end_seq(self):
+    """
+    :rtype: int|None
+    """
+    parts = self.plan.get_parts(self.batch_idx)
+    if not len(parts):
+      return None
+    return int(parts["seq_idx"].max()) + 1
+
+  def get_total_num_frames(self):
+    """
+    :rtype: NumbersDict
+    """
+    return self.plan.get_total_num_frames(self.batch_idx)
+
+  def get_num_seqs(self):
+    """
+    :rtype: int
+    """
+    seq_idxs = self.plan.get_parts(self.batch_idx)["seq_idx"]
+    if not len(seq_idxs):
+      return 0
+    return int(seq_idxs.max()) + 1 - int(seq_idxs.min())
+
+  def get_parts_columns(self, keys):
+    """
+    :param list[str]|set[str] keys: data keys
+    :rtype: dict[str|(str,str),list[int|None]]
+    """
+    return self.plan.get_parts_columns(self.batch_idx, keys)
+
 
 class BatchSetGenerator:
   """
@@ -173,33 +593,89 @@ class BatchSetGenerator:
   you call self.advance() explicitly to go forward to next batches.
   """
 
-  def __init__(self, dataset, generator, shuffle_batches=False, cache_whole_epoch=True):
+  def __init__(self, dataset, generator, shuffle_batches=False, cache_whole_epoch=True,
+               plan=None, plan_filename=None):
     """
     :type dataset: Dataset.Dataset
     :type generator: typing.Generator[Batch]|typing.Iterator[Batch]
     :param bool shuffle_batches:
     :param bool cache_whole_epoch:
+    :param BatchPlan|None plan: all batches of the epoch, e.g. loaded from file. then the generator is not used
+    :param str|None plan_filename: if given, store all batches (the plan) there once the generator is finished
     """
     self.dataset = dataset
     self.generator = generator
     self.shuffle_batches = shuffle_batches
     # In some cases, it might be faster to cache the list of batches.
     self.cache_whole_epoch = cache_whole_epoch
-    self.cache = []  # type: typing.List[Batch]
+    self.cache = plan if plan is not None else BatchPlan()  # compact, see :class:`BatchPlan`
+    self.plan_filename = plan_filename
     self.buffer = []  # type: typing.List[Batch]
     self.last_batch = None  # type: typing.Optional[Batch]
-    self.reached_end = False
+    self.reached_end = plan is not None
+    self.stats_num_batches = 0
+    self.stats_num_seqs = 0
+    self.stats_batch_frames = 0
+    self.stats_min_batch_frames = None  # type: typing.Optional[int]
+    self.stats_max_batch_frames = None  # type: typing.Optional[int]
+    self.stats_padded_frames = NumbersDict(0)
+    self.stats_used_frames = NumbersDict(0)
     random.seed(1234)
     self._reset()
 
   def _reset(self):
-    self.buffer = self.cache[:]
+    self.buffer = self.cache.get_batches()
     if self.shuffle_batches:
       random.shuffle(self.buffer)
     self.cache_active = self.reached_end
     self.reached_end = False
     self.last_batch = None  # type: typing.Optional[Batch]
     self.current_batch_idx = 0
+    self.reset_stats()
+
+  def reset_stats(self):
+    """
+    Resets the statistics about the batches, see :func:`get_stats_str`.
+    """
+    self.stats_num_batches = 0
+    self.stats_num_seqs = 0
+    self.stats_batch_frames = 0
+    self.stats_min_batch_frames = None
+    self.stats_max_batch_frames = None
+    self.stats_padded_frames = NumbersDict(0)
+    self.stats_used_frames = NumbersDict(0)
+
+  def _collect_stats(self, batch):
+    """
+    :param Batch batch: which we advanced over
+    """
+    padded_frames = batch.get_all_slices_num_frames()
+    num_frames = padded_frames.max_value()
+    if not self.stats_num_batches:
+      self.stats_min_batch_frames = self.stats_max_batch_frames = num_frames
+    self.stats_num_batches += 1
+    self.stats_num_seqs += batch.get_num_seqs()
+    self.stats_batch_frames += num_frames
+    self.stats_min_batch_frames = min(self.stats_min_batch_frames, num_frames)
+    self.stats_max_batch_frames = max(self.stats_max_batch_frames, num_frames)
+    self.stats_padded_frames += padded_frames
+    self.stats_used_frames += batch.get_total_num_frames()
+
+  def get_stats_str(self):
+    """
+    :return: statistics about the batches so far (since the last reset), e.g. the fraction of padded frames
+    :rtype: str
+    """
+    if not self.stats_num_batches:
+      return "no batches"
+    padding = []
+    for key in sorted(self.stats_padded_frames.keys()):
+      padded, used = self.stats_padded_frames[key], self.stats_used_frames.get(key) or 0
+      padding.append("%s %.1f%%" % (key, (1. - float(used) / padded) * 100. if padded else 0.))
+    return "%i batches, %.1f seqs per batch, frames per batch avg %.1f, min %i, max %i, padding: %s" % (
+      self.stats_num_batches, float(self.stats_num_seqs) / self.stats_num_batches,
+      float(self.stats_batch_frames) / self.stats_num_batches,
+      self.stats_min_batch_frames, self.stats_max_batch_frames, ", ".join(padding))
 
   def reset(self):
     """
@@ -215,11 +691,16 @@ class BatchSetGenerator:
       batch = next(self.generator)
     except StopIteration:
       self.reached_end = True
+      if self.plan_filename and not self.cache_active:
+        self.cache.save(self.plan_filename)
+        print("%s: stored batch plan in %r" % (self.dataset, self.plan_filename), file=log.v4)
       return False
     else:
+      if (self.cache_whole_epoch or self.plan_filename) and not self.cache_active:
+        # Only keep the compact form. Then the batch itself (with all its NumbersDict objects) can be freed.
+        self.cache.append_batch(batch)
+        batch = self.cache.get_batch(self.cache.num_batches - 1)
       self.buffer += [batch]
-      if self.cache_whole_epoch and not self.cache_active:
-        self.cache += [batch]
       return True
 
   def _read_next_up_to_n(self, n):
@@ -245,6 +726,8 @@ class BatchSetGenerator:
     assert n > 0
     self._read_next_up_to_n(n)
     assert n <= len(self.buffer)
+    for batch in self.buffer[:n]:
+      self._collect_stats(batch)
     self.last_batch = self.buffer[n - 1]
     self.buffer = self.buffer[n:]
     self.current_batch_idx += n
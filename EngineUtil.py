@@ -1,11 +1,15 @@
 
 """
-Contains utility functions to construct a batch.
+Contains utility functions to construct a batch,
+and :class:`SearchOutputWriter`.
 This is used both by Theano and TF.
 """
 
 from __future__ import print_function
 
+import os
+import typing
+from threading import Thread
 import numpy
 from EngineBatch import Batch
 from Log import log
@@ -31,38 +35,41 @@ def assign_dev_data(device, dataset, batches, load_seqs=True):
     if load_seqs:
       dataset.load_seqs(batch.start_seq, batch.end_seq)
     device.num_frames += batch.get_total_num_frames()
+    # Columnar, such that we do not need the NumbersDict objects of the seqs. See Batch.get_parts_columns().
+    columns = batch.get_parts_columns(device.used_data_keys)
     with dataset.lock:
-      for seq in batch.seqs:
-        o = seq.batch_frame_offset
-        q = seq.batch_slice + offset_slice
-        length = seq.frame_length
+      for i, seq_idx in enumerate(columns["seq_idx"]):
+        q = columns["batch_slice"][i] + offset_slice
         # input-data, input-index will also be set in this loop. That is data-key "data".
         # targets are usually data-key "classes".
         for k in device.used_data_keys:
           # device.used_data_keys are set by the train-net, but we will also get here during forward-only,
           # e.g. via SprintInterface, where we don't have e.g. the "classes" data.
-          # In that case, l.get(k) should be None. In some earlier code, l.get(k) could also be 0 in that case.
-          if length.get(k) in [0, None]:
+          # In that case, the length should be None. In some earlier code, it could also be 0 in that case.
+          length = columns["length", k][i]
+          if length in [0, None]:
             continue
-          data = dataset.get_data_slice(seq.seq_idx, k, seq.seq_start_frame[k], seq.seq_end_frame[k])
+          o = columns["offset", k][i]
+          data = dataset.get_data_slice(seq_idx, k, columns["start", k][i], columns["end", k][i])
           ls = data.shape[0]
           if "[sparse:" in k:
-            assert o[k] == 0, "sparse non-recurrent batching + chunking not implemented"
+            assert o == 0, "sparse non-recurrent batching + chunking not implemented"
             _device_maybe_enlarge_data(device, k, ls)
           else:
-            if ls != length[k]:
+            if ls != length:
+              seq = batch.seqs[i]
               raise Exception("got shape[0]: %i, expected: %i, start/end: %r/%r, seq_idx: %i, seq len: %r" % (
-                ls, length[k], seq.seq_start_frame, seq.seq_end_frame, seq.seq_idx,
-                dataset.get_seq_length(seq.seq_idx)))
-          device.output_index[k][o[k]:o[k] + ls, q] = numpy.ones((ls,), dtype='int8')
-          device.targets[k][o[k]:o[k] + ls, q] = data
+                ls, length, seq.seq_start_frame, seq.seq_end_frame, seq_idx,
+                dataset.get_seq_length(seq_idx)))
+          device.output_index[k][o:o + ls, q] = numpy.ones((ls,), dtype='int8')
+          device.targets[k][o:o + ls, q] = data
         # Only copy ctc targets if chunking is inactive to avoid out of range access.
         # CTC is not compatible with chunking anyway.
         chunking_active = dataset.chunk_size != 0
         if dataset.has_ctc_targets() and not chunking_active:
-          device.ctc_targets[q] = dataset.get_ctc_targets(seq.seq_idx)
+          device.ctc_targets[q] = dataset.get_ctc_targets(seq_idx)
 
-        device.tags[q] = dataset.get_tag(seq.seq_idx)
+        device.tags[q] = dataset.get_tag(seq_idx)
     # Note on multiple batches for the non-recurrent case:
     # We could either concatenate all into a single slice, or do multiple slices.
     # We do multiple slices here.
@@ -124,3 +131,196 @@ def maybe_subtract_priors(network, train, config):
     b_softmax = ls[0]
     b_softmax.set_value(b_softmax.get_value() - prior_scale * numpy.log(priors))
     print("subtracting priors with prior_scale", prior_scale, file=log.v3)
+
+
+class SearchOutputWriter:
+  """
+  Streams the search results (see ``Engine.search``) to disk, while the search is running,
+  instead of keeping them all in memory until the end.
+  The results are appended to ``<output_file>.partial`` by a background thread, in the order they come in,
+  one line per seq with the corpus seq idx, the seq tag and the serialized output.
+  We keep an index (corpus seq idx -> offset in the partial file), and :func:`finalize` writes the final
+  ``output_file`` in corpus order, in the "txt" or "py" format, and removes the partial file.
+
+  If the search crashed, a partial file is left behind.
+  With ``resume=True``, it is read again (an incomplete last line is cut off),
+  and :func:`have_seq` tells which seqs can be skipped.
+  The first line of the partial file has the format and the fingerprint (e.g. of the dataset and the model).
+  A partial file of another search, i.e. where these do not match, is not resumed but overwritten.
+  """
+
+  PartialFileSuffix = ".partial"
+
+  def __init__(self, output_file, output_file_format="txt", fingerprint=None, resume=False, max_queue_size=1000):
+    """
+    :param str output_file: the final file
+    :param str output_file_format: "txt" or "py"
+    :param str|None fingerprint: identifies the search, e.g. a hash of the dataset options and the model.
+      single line. only a partial file with the same fingerprint is resumed
+    :param bool resume: continue with an existing partial file
+    :param int max_queue_size: max number of seqs waiting to be written. :func:`write` blocks if there are more
+    """
+    try:
+      # noinspection PyCompatibility
+      from Queue import Queue
+    except ImportError:
+      # noinspection PyCompatibility
+      from queue import Queue
+    assert output_file_format in {"txt", "py"}
+    assert not os.path.exists(output_file), "%s: output file %r already exists" % (self, output_file)
+    self.output_file = output_file
+    self.output_file_format = output_file_format
+    self.partial_file = output_file + self.PartialFileSuffix
+    self.index = {}  # type: typing.Dict[int,typing.Tuple[int,int]]  # corpus seq idx -> (offset, len) in partial file
+    self.num_resumed_seqs = 0
+    assert fingerprint is None or "\n" not in fingerprint
+    header = ("# search output, format %s, fingerprint %s\n" % (output_file_format, fingerprint)).encode("utf8")
+    if resume and os.path.exists(self.partial_file) and self._read_partial_file(header):
+      self.num_resumed_seqs = len(self.index)
+      print("%s: resume with %i seqs from %r" % (self, self.num_resumed_seqs, self.partial_file), file=log.v2)
+      self._file = open(self.partial_file, "ab")
+    else:
+      self._file = open(self.partial_file, "wb")
+      self._file.write(header)
+    self._queue = Queue(maxsize=max_queue_size)
+    self._exception = None  # type: typing.Optional[BaseException]
+    self._thread = Thread(target=self._thread_main, name="%s thread" % self)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def __repr__(self):
+    return "<%s %r>" % (self.__class__.__name__, self.output_file)
+
+  def _read_partial_file(self, header):
+    """
+    Fills the index. Cuts off an incomplete last line.
+
+    :param bytes header: expected first line
+    :return: whether the partial file is from the same search, i.e. has the expected first line.
+      otherwise, the index stays empty
+    :rtype: bool
+    """
+    with open(self.partial_file, "rb") as f:
+      first_line = f.readline()
+      if first_line != header:
+        print("%s: partial file %r is from another search, first line %r, expected %r, not resuming" % (
+          self, self.partial_file, first_line, header), file=log.v2)
+        return False
+      offset = f.tell()
+      while True:
+        line = f.readline()
+        if not line.endswith(b"\n"):
+          break  # end of file, or incomplete
+        corpus_seq_idx = int(line.split(b"\t", 1)[0])
+        self.index[corpus_seq_idx] = (offset, len(line))
+        offset += len(line)
+    if offset < os.path.getsize(self.partial_file):
+      print("%s: cut off incomplete last entry in %r" % (self, self.partial_file), file=log.v3)
+      with open(self.partial_file, "r+b") as f:
+        f.truncate(offset)
+    return True
+
+  def _read_entry(self, offset, f=None):
+    """
+    :param int offset: in the partial file
+    :param typing.BinaryIO|None f: opened partial file
+    :return: corpus seq idx, seq tag repr, serialized output repr
+    :rtype: (int,str,str)
+    """
+    if f is None:
+      with open(self.partial_file, "rb") as f:
+        return self._read_entry(offset, f)
+    f.seek(offset)
+    corpus_seq_idx, seq_tag, output = f.readline().decode("utf8").rstrip("\n").split("\t")
+    return int(corpus_seq_idx), seq_tag, output
+
+  def have_seq(self, corpus_seq_idx):
+    """
+    :param int corpus_seq_idx:
+    :return: whether the output of this seq is already there (written or queued), e.g. via resume
+    :rtype: bool
+    """
+    return corpus_seq_idx in self.index
+
+  def write(self, corpus_seq_idx, seq_tag, output):
+    """
+    Queues the output of the seq for writing. Outputs of seqs which are already there are ignored.
+
+    :param int corpus_seq_idx:
+    :param str seq_tag:
+    :param str|list[(float,str)]|dict[str] output: like in ``Engine.search``
+    """
+    if self._exception:
+      raise self._exception
+    if corpus_seq_idx in self.index:
+      return
+    self.index[corpus_seq_idx] = (-1, 0)  # the offset is set by the thread
+    self._queue.put((corpus_seq_idx, seq_tag, output))
+
+  def _serialize(self, output):
+    """
+    :param str|list[(float,str)]|dict[str] output:
+    :return: single line, like it will be written to the final output file
+    :rtype: str
+    """
+    from Util import better_repr
+    if self.output_file_format == "txt":
+      return repr("%s" % (output,))
+    return repr(better_repr(output))
+
+  def _thread_main(self):
+    try:
+      while True:
+        item = self._queue.get()
+        if item is None:
+          break
+        corpus_seq_idx, seq_tag, output = item
+        line = ("%i\t%r\t%s\n" % (corpus_seq_idx, seq_tag, self._serialize(output))).encode("utf8")
+        offset = self._file.tell()
+        self._file.write(line)
+        self.index[corpus_seq_idx] = (offset, len(line))
+        if self._queue.empty():
+          self._file.flush()
+    except BaseException as exc:
+      self._exception = exc
+      # Unblock write() calls.
+      while not self._queue.empty():
+        self._queue.get_nowait()
+
+  def close(self):
+    """
+    Writes all remaining queued outputs and closes the partial file.
+    """
+    if self._thread:
+      self._queue.put(None)
+      self._thread.join()
+      self._thread = None
+      self._file.close()
+    if self._exception:
+      raise self._exception
+
+  def finalize(self):
+    """
+    Writes the final output file in corpus order, and removes the partial file.
+    The outputs of all seqs 0 to max corpus seq idx must be there.
+    """
+    import ast
+    self.close()
+    num_seqs = len(self.index)
+    assert num_seqs > 0 and 0 in self.index and num_seqs - 1 in self.index
+    tmp_filename = "%s.tmp" % self.output_file
+    with open(self.partial_file, "rb") as partial_f, open(tmp_filename, "w") as f:
+      if self.output_file_format == "py":
+        f.write("{\n")
+      for i in range(num_seqs):
+        corpus_seq_idx, seq_tag, output = self._read_entry(self.index[i][0], f=partial_f)
+        assert corpus_seq_idx == i
+        if self.output_file_format == "txt":
+          f.write("%s\n" % ast.literal_eval(output))
+        else:
+          f.write("%s: %s,\n" % (seq_tag, ast.literal_eval(output)))
+      if self.output_file_format == "py":
+        f.write("}\n")
+    os.rename(tmp_filename, self.output_file)
+    os.remove(self.partial_file)
+    print("%s: wrote %i seqs" % (self, num_seqs), file=log.v2)
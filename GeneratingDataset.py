@@ -836,6 +836,15 @@ class StaticDataset(GeneratingDataset):
     data = self.data[seq_idx]
     return DatasetSeq(seq_idx=seq_idx, features={key: data[key] for key in self.data_keys})
 
+  def get_seq_lengths_array(self):
+    """
+    :return: data key -> seq lengths. see :func:`Dataset.get_seq_lengths_array`
+    :rtype: dict[str,numpy.ndarray]
+    """
+    return {
+      key: numpy.array([seq[key].shape[0] if seq[key].ndim >= 1 else 1 for seq in self.data], dtype="int64")
+      for key in self.data_keys}
+
   def get_data_keys(self):
     """
     :rtype: list[str]
@@ -922,7 +931,8 @@ class ExtractAudioFeatures:
                features="mfcc", feature_options=None, random_permute=None, random_state=None, raw_ogg_opts=None,
                pre_process=None, post_process=None,
                sample_rate=None,
-               peak_normalization=True, preemphasis=None, join_frames=None):
+               peak_normalization=True, preemphasis=None, join_frames=None,
+               cache=None):
     """
     :param float window_len: in seconds
     :param float step_len: in seconds
@@ -941,6 +951,10 @@ class ExtractAudioFeatures:
     :param bool peak_normalization: set to False to disable the peak normalization for audio files
     :param float|None preemphasis: set a preemphasis filter coefficient
     :param int|None join_frames: concatenate multiple frames together to a superframe
+    :param dict[str]|None cache: kwargs for :class:`AudioFeatureCache`, e.g. ``{"path": "/var/tmp/features"}``.
+      The dataset must support it (e.g. :class:`OggZipDataset`).
+      This is only used if there is no randomness, i.e. no random_permute, pre_process, post_process
+      or custom features function.
     :return: (audio_len // int(step_len * sample_rate), (with_delta + 1) * num_feature_filters), float32
     :rtype: numpy.ndarray
     """
@@ -980,6 +994,29 @@ class ExtractAudioFeatures:
     self.sample_rate = sample_rate
     self.raw_ogg_opts = raw_ogg_opts
     self.peak_normalization = peak_normalization
+    self.cache = None  # type: typing.Optional[AudioFeatureCache]
+    if cache:
+      if (random_permute and random_permute.truth_value) or pre_process or post_process or callable(features):
+        print("ExtractAudioFeatures: feature cache disabled, as the features are not deterministic", file=log.v2)
+      else:
+        self.cache = AudioFeatureCache(options_hash=self._get_options_hash(), **cache)
+
+  def _get_options_hash(self):
+    """
+    :return: hash of all options which have an influence on the features, for :class:`AudioFeatureCache`
+    :rtype: str
+    """
+    import hashlib
+    opts = []
+    for key in [
+          "window_len", "step_len", "num_feature_filters", "with_delta", "norm_mean", "norm_std_dev",
+          "features", "feature_options", "sample_rate", "raw_ogg_opts", "peak_normalization", "preemphasis",
+          "join_frames"]:
+      value = getattr(self, key)
+      if isinstance(value, numpy.ndarray):
+        value = value.tolist()
+      opts.append((key, value))
+    return hashlib.sha1(repr(opts).encode("utf8")).hexdigest()
 
   def _load_feature_vec(self, value):
     """
@@ -1133,6 +1170,367 @@ class ExtractAudioFeatures:
     return (self.with_delta + 1) * self.num_feature_filters * (self.join_frames or 1)
 
 
+class ExtractAudioFeaturesPool:
+  """
+  Runs :func:`ExtractAudioFeatures.get_audio_features_from_raw_bytes` in a pool of forked worker processes,
+  for the next seqs in epoch order (look-ahead).
+  The consumer (e.g. ``_collect_single_seq``, called via :func:`CachedDataset2._load_seqs`)
+  gets the results in order via :func:`get_features`.
+  The random state of the feature extractor (e.g. for ``random_permute``) is seeded per seq,
+  such that the features do not depend on the number of workers or the timing.
+  """
+
+  def __init__(self, feature_extractor, get_job, num_workers, look_ahead=None, name=None):
+    """
+    :param ExtractAudioFeatures feature_extractor:
+    :param (int)->((bytes,str,list[int])|numpy.ndarray|None) get_job:
+      seq idx -> (raw audio bytes, seq tag, random seed),
+      or directly the features (e.g. from a cache), or None if seq idx >= num seqs.
+      This is called in the consumer thread.
+    :param int num_workers:
+    :param int|None look_ahead: number of seqs which are prepared in advance. 2 * num_workers by default
+    :param str|None name:
+    """
+    import os
+    from threading import Thread, Condition
+    from TaskSystem import AsyncTask
+    try:
+      # noinspection PyCompatibility
+      from Queue import Queue
+    except ImportError:
+      # noinspection PyCompatibility
+      from queue import Queue
+    assert num_workers > 0
+    self.feature_extractor = feature_extractor
+    self.get_job = get_job
+    self.num_workers = num_workers
+    self.look_ahead = look_ahead or 2 * num_workers
+    self.name = name or "ExtractAudioFeaturesPool"
+    self._creator_pid = os.getpid()
+    self._cond = Condition()
+    self._generation = 0  # increased in reset(), to ignore results from the previous epoch
+    self._next_submit_seq_idx = 0
+    self._end_seq_idx = None  # type: typing.Optional[int]
+    self._pending = set()  # type: typing.Set[int]  # seq idx
+    self._results = {}  # type: typing.Dict[int,typing.Tuple[typing.Optional[numpy.ndarray],typing.Optional[str]]]
+    self._task_queue = Queue()
+    self._threads = []  # type: typing.List[Thread]
+    # Fork all workers first, before we start any of our threads.
+    procs = [
+      AsyncTask(func=self._worker_proc_main, name="%s worker %i" % (self.name, i)) for i in range(num_workers)]
+    for i, proc in enumerate(procs):
+      thread = Thread(target=self._worker_thread_main, args=(proc,), name="%s worker %i" % (self.name, i))
+      thread.daemon = True
+      thread.start()
+      self._threads.append(thread)
+
+  def __repr__(self):
+    return "<%s %r, %i workers>" % (self.__class__.__name__, self.name, self.num_workers)
+
+  def close(self):
+    """
+    Stops the workers.
+    """
+    import os
+    if os.getpid() != self._creator_pid:  # e.g. some other forked process
+      return
+    for _ in self._threads:
+      self._task_queue.put(None)
+    self._threads = []
+
+  def reset(self):
+    """
+    Call this at the beginning of an epoch, i.e. whenever the seq order changes.
+    """
+    with self._cond:
+      self._generation += 1
+      self._next_submit_seq_idx = 0
+      self._end_seq_idx = None
+      self._pending.clear()
+      self._results.clear()
+
+  def _extract(self, raw_bytes, seq_tag, seed):
+    """
+    :param bytes raw_bytes:
+    :param str seq_tag:
+    :param list[int] seed:
+    :rtype: numpy.ndarray
+    """
+    import io
+    if self.feature_extractor.random_state is not None:
+      self.feature_extractor.random_state.seed(seed)
+    return self.feature_extractor.get_audio_features_from_raw_bytes(io.BytesIO(raw_bytes), seq_name=seq_tag)
+
+  def _submit(self, seq_idx):
+    """
+    :param int seq_idx:
+    :return: whether this is a valid seq (< num seqs)
+    :rtype: bool
+    """
+    job = self.get_job(seq_idx)
+    if job is None:
+      return False
+    with self._cond:
+      if isinstance(job, numpy.ndarray):  # features are already known, e.g. from a cache
+        self._results[seq_idx] = (job, None)
+      else:
+        self._pending.add(seq_idx)
+        self._task_queue.put((self._generation, seq_idx) + tuple(job))
+    return True
+
+  def get_features(self, seq_idx):
+    """
+    :param int seq_idx: should be increasing, i.e. in epoch order
+    :return: features, like :func:`ExtractAudioFeatures.get_audio_features_from_raw_bytes`
+    :rtype: numpy.ndarray
+    """
+    import os
+    if os.getpid() != self._creator_pid:  # e.g. some forked data provider worker. we cannot use our workers
+      job = self.get_job(seq_idx)
+      assert job is not None, "%s: invalid seq idx %i" % (self, seq_idx)
+      if isinstance(job, numpy.ndarray):
+        return job
+      return self._extract(*job)
+    with self._cond:
+      for old_seq_idx in [i for i in self._results if i < seq_idx]:
+        del self._results[old_seq_idx]  # not needed anymore
+      need_submit = seq_idx not in self._results and seq_idx not in self._pending
+    if need_submit:
+      assert self._submit(seq_idx), "%s: invalid seq idx %i" % (self, seq_idx)
+    self._next_submit_seq_idx = max(self._next_submit_seq_idx, seq_idx + 1)
+    while self._end_seq_idx is None and self._next_submit_seq_idx <= seq_idx + self.look_ahead:
+      if not self._submit(self._next_submit_seq_idx):
+        self._end_seq_idx = self._next_submit_seq_idx
+        break
+      self._next_submit_seq_idx += 1
+    with self._cond:
+      while seq_idx not in self._results:
+        self._cond.wait()
+      features, error_str = self._results.pop(seq_idx)
+    if error_str:
+      raise Exception("%s: feature extraction of seq %i failed: %s" % (self, seq_idx, error_str))
+    return features
+
+  def _worker_thread_main(self, proc):
+    """
+    Sends the tasks to the worker process and collects the results.
+
+    :param TaskSystem.AsyncTask proc:
+    """
+    try:
+      while True:
+        task = self._task_queue.get()
+        if task is None:
+          break
+        generation, seq_idx = task[:2]
+        if generation != self._generation:
+          continue  # old epoch
+        # noinspection PyBroadException
+        try:
+          proc.put(task[2:])
+          features, error_str = proc.get()
+        except Exception as exc:
+          features, error_str = None, "worker process: %r" % exc
+        with self._cond:
+          if generation == self._generation:
+            self._pending.discard(seq_idx)
+            self._results[seq_idx] = (features, error_str)
+          self._cond.notify_all()
+    finally:
+      proc.put(None)
+
+  def _worker_proc_main(self, proc):
+    """
+    Main loop of a forked worker process.
+
+    :param TaskSystem.AsyncTask proc:
+    """
+    while True:
+      task = proc.get()
+      if task is None:
+        break
+      # noinspection PyBroadException
+      try:
+        features = self._extract(*task)
+      except Exception:
+        import traceback
+        proc.put((None, "".join(traceback.format_exception(*sys.exc_info()))))
+      else:
+        proc.put((features, None))
+
+
+class AudioFeatureCache:
+  """
+  Persistent cache for the features of :class:`ExtractAudioFeatures`, keyed by some file id,
+  in a directory for the hash of the feature options.
+  The features are stored in an append-only blob (``data.bin``), which is read memory-mapped,
+  and an index (``index.pkl``), which is written via :func:`save_index` (e.g. at the end of an epoch).
+  If the size of all cached features exceeds ``max_size``, the least recently used entries are removed,
+  and the blob is rewritten when it has become too large.
+  Only one process should write to the same cache directory at a time,
+  and in forked sub processes (e.g. data provider workers), the cache is not used.
+  """
+
+  Alignment = 64
+
+  def __init__(self, path, options_hash, max_size=10 * 1024 ** 3):
+    """
+    :param str path: directory
+    :param str options_hash: see :func:`ExtractAudioFeatures._get_options_hash`
+    :param int max_size: in bytes
+    """
+    import os
+    import pickle
+    from collections import OrderedDict
+    from Util import maybe_make_dirs
+    self.path = "%s/%s" % (path, options_hash)
+    self.max_size = max_size
+    maybe_make_dirs(self.path)
+    self._data_filename = "%s/data.bin" % self.path
+    self._index_filename = "%s/index.pkl" % self.path
+    # file id -> (offset, shape, dtype). in LRU order, i.e. the first entry is the least recently used
+    self._index = OrderedDict()  # type: typing.Dict[str,typing.Tuple[int,typing.Tuple[int,...],str]]
+    self._data_size = 0  # sum of all entries in the index, in bytes
+    if os.path.exists(self._index_filename) and os.path.exists(self._data_filename):
+      with open(self._index_filename, "rb") as f:
+        self._index = pickle.load(f)
+      file_size = os.path.getsize(self._data_filename)
+      for file_id, (offset, shape, dtype) in list(self._index.items()):
+        if offset + self._get_num_bytes(shape, dtype) > file_size:  # e.g. crash after writing the index
+          del self._index[file_id]
+      self._data_size = sum([self._get_num_bytes(shape, dtype) for (_, shape, dtype) in self._index.values()])
+    self._mmap = None  # type: typing.Optional[numpy.memmap]
+    self._creator_pid = os.getpid()
+    self.num_hits = 0
+    self.num_misses = 0
+    self.num_bytes_read = 0
+    self.num_bytes_written = 0
+
+  def __repr__(self):
+    return "<%s %r>" % (self.__class__.__name__, self.path)
+
+  @staticmethod
+  def _get_num_bytes(shape, dtype):
+    """
+    :param tuple[int] shape:
+    :param str dtype:
+    :rtype: int
+    """
+    return int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize
+
+  def _get_data(self, offset, num_bytes):
+    """
+    :param int offset:
+    :param int num_bytes:
+    :return: memory-mapped bytes
+    :rtype: numpy.ndarray
+    """
+    if self._mmap is None or offset + num_bytes > self._mmap.shape[0]:
+      self._mmap = numpy.memmap(self._data_filename, dtype="uint8", mode="r")
+    return self._mmap[offset:offset + num_bytes]
+
+  def get(self, file_id):
+    """
+    :param str file_id:
+    :return: features, or None if not in the cache
+    :rtype: numpy.ndarray|None
+    """
+    import os
+    if os.getpid() != self._creator_pid:
+      return None
+    entry = self._index.get(file_id)
+    if entry is None:
+      self.num_misses += 1
+      return None
+    self._index[file_id] = self._index.pop(file_id)  # most recently used. OrderedDict.move_to_end is PY3 only
+    offset, shape, dtype = entry
+    num_bytes = self._get_num_bytes(shape, dtype)
+    self.num_hits += 1
+    self.num_bytes_read += num_bytes
+    if num_bytes == 0:
+      return numpy.zeros(shape, dtype=dtype)
+    return self._get_data(offset, num_bytes).view(dtype).reshape(shape)
+
+  def add(self, file_id, features):
+    """
+    :param str file_id:
+    :param numpy.ndarray features:
+    """
+    import os
+    if os.getpid() != self._creator_pid or file_id in self._index:
+      return
+    features = numpy.ascontiguousarray(features)
+    if features.nbytes > self.max_size:
+      return
+    with open(self._data_filename, "ab") as f:
+      offset = f.tell()
+      if offset % self.Alignment:
+        f.write(b"\0" * (self.Alignment - offset % self.Alignment))
+        offset = f.tell()
+      f.write(features.tobytes())
+    self._index[file_id] = (offset, features.shape, features.dtype.str)
+    self._data_size += features.nbytes
+    self.num_bytes_written += features.nbytes
+    while self._data_size > self.max_size:
+      _, (_, shape, dtype) = self._index.popitem(last=False)
+      self._data_size -= self._get_num_bytes(shape, dtype)
+    if os.path.getsize(self._data_filename) > 2 * self.max_size:
+      self._compact()
+
+  def _compact(self):
+    """
+    Rewrites the blob with only the entries of the index.
+    """
+    import os
+    tmp_filename = "%s.tmp" % self._data_filename
+    new_index = type(self._index)()
+    with open(tmp_filename, "wb") as f:
+      for file_id, (offset, shape, dtype) in self._index.items():
+        num_bytes = self._get_num_bytes(shape, dtype)
+        if f.tell() % self.Alignment:
+          f.write(b"\0" * (self.Alignment - f.tell() % self.Alignment))
+        new_index[file_id] = (f.tell(), shape, dtype)
+        f.write(self._get_data(offset, num_bytes).tobytes())
+    self._mmap = None
+    os.rename(tmp_filename, self._data_filename)
+    self._index = new_index
+    self.save_index()
+
+  def save_index(self):
+    """
+    Writes the index. The data itself is always written directly.
+    """
+    import os
+    import pickle
+    if os.getpid() != self._creator_pid:
+      return
+    tmp_filename = "%s.%i.tmp" % (self._index_filename, os.getpid())
+    with open(tmp_filename, "wb") as f:
+      pickle.dump(self._index, f)
+    os.rename(tmp_filename, self._index_filename)
+
+  def get_stats_str(self):
+    """
+    :return: statistics since the last :func:`reset_stats`
+    :rtype: str
+    """
+    from Util import human_bytes_size
+    num_lookups = self.num_hits + self.num_misses
+    return "%i lookups, hit rate %.1f%%, read %s, written %s, total size %s in %i entries" % (
+      num_lookups, 100. * self.num_hits / max(num_lookups, 1),
+      human_bytes_size(self.num_bytes_read), human_bytes_size(self.num_bytes_written),
+      human_bytes_size(self._data_size), len(self._index))
+
+  def reset_stats(self):
+    """
+    Resets the statistics.
+    """
+    self.num_hits = 0
+    self.num_misses = 0
+    self.num_bytes_read = 0
+    self.num_bytes_written = 0
+
+
 def _get_audio_linear_spectrogram(audio, sample_rate, window_len=0.025, step_len=0.010, num_feature_filters=512):
   """
   Computes linear spectrogram features from an audio signal.
@@ -1895,13 +2293,15 @@ class BytePairEncoding(Vocabulary):
   Proceedings of the 54th Annual Meeting of the Association for Computational Linguistics (ACL 2016). Berlin, Germany.
   """
 
-  def __init__(self, vocab_file, bpe_file, seq_postfix=None, unknown_label="UNK"):
+  def __init__(self, vocab_file, bpe_file, seq_postfix=None, unknown_label="UNK", encode_cache_size=100000):
     """
     :param str vocab_file:
     :param str bpe_file:
     :param list[int]|None seq_postfix: labels will be added to the seq in self.get_seq
     :param str|None unknown_label:
+    :param int encode_cache_size: max number of words in the cache of encoded words (least recently used are removed)
     """
+    from collections import OrderedDict
     super(BytePairEncoding, self).__init__(vocab_file=vocab_file, seq_postfix=seq_postfix, unknown_label=unknown_label)
     # check version information
     bpe_file_first_line = open(bpe_file, "r").readline()
@@ -1914,31 +2314,71 @@ class BytePairEncoding(Vocabulary):
     # some hacking to deal with duplicates (only consider first instance)
     self._bpe_codes = dict([(code, i) for (i, code) in reversed(list(enumerate(self._bpe_codes)))])
     self._bpe_codes_reverse = dict([(pair[0] + pair[1], pair) for pair, i in self._bpe_codes.items()])
-    self._bpe_encode_cache = {}
+    self._bpe_encode_cache = OrderedDict()  # type: typing.Dict[str,typing.Union[str,typing.List[str]]]
+    self._bpe_encode_cache_size = encode_cache_size
     self._bpe_separator = '@@'
 
-  @staticmethod
-  def _get_pairs(word):
+  def _apply_merges(self, word):
     """
-    :param tuple[str] word: represented as tuple of symbols (symbols being variable-length strings)
-    :return: set of symbol pairs in a word
-    :rtype: set[(str,str)]
+    Applies the BPE merge operations, in the order of their rank.
+    In each step, all (non-overlapping, from left to right) occurrences of the best ranked pair are merged,
+    like in subword-nmt. The pairs are kept in a priority queue, and the symbols in a linked list.
+
+    :param tuple[str] word: initial symbols
+    :return: merged symbols
+    :rtype: tuple[str]
     """
-    pairs = set()
-    prev_char = word[0]
-    for char in word[1:]:
-      pairs.add((prev_char, char))
-      prev_char = char
-    return pairs
+    import heapq
+    bpe_codes = self._bpe_codes
+    symbols = list(word)  # type: typing.List[typing.Optional[str]]  # None if merged into the left neighbor
+    next_pos = list(range(1, len(symbols))) + [-1]
+    prev_pos = list(range(-1, len(symbols) - 1))
+    queue = []  # type: typing.List[typing.Tuple[int,int]]  # (rank, pos of first symbol)
+    for pos in range(len(symbols) - 1):
+      rank = bpe_codes.get((symbols[pos], symbols[pos + 1]))
+      if rank is not None:
+        queue.append((rank, pos))
+    heapq.heapify(queue)
+
+    while queue:
+      rank = queue[0][0]
+      positions = []
+      while queue and queue[0][0] == rank:
+        positions.append(heapq.heappop(queue)[1])
+      new_pairs = []
+      for pos in sorted(set(positions)):
+        # The entry could be outdated, by a previous merge.
+        nxt = next_pos[pos]
+        if symbols[pos] is None or nxt < 0 or bpe_codes.get((symbols[pos], symbols[nxt])) != rank:
+          continue
+        symbols[pos] += symbols[nxt]
+        symbols[nxt] = None
+        next_pos[pos] = next_pos[nxt]
+        if next_pos[pos] >= 0:
+          prev_pos[next_pos[pos]] = pos
+        new_pairs.append(pos)
+      for pos in new_pairs:
+        if symbols[pos] is None:
+          continue
+        for first in (prev_pos[pos], pos):
+          if first < 0 or next_pos[first] < 0:
+            continue
+          new_rank = bpe_codes.get((symbols[first], symbols[next_pos[first]]))
+          if new_rank is not None:
+            heapq.heappush(queue, (new_rank, first))
+
+    return tuple([symbol for symbol in symbols if symbol is not None])
 
   def _encode_word(self, orig):
     """
     Encode word based on list of BPE merge operations, which are applied consecutively.
     :param str orig:
-    :rtype: tuple[str]
+    :rtype: tuple[str]|list[str]|str
     """
 
     if orig in self._bpe_encode_cache:
+      # Most recently used. OrderedDict.move_to_end is PY3 only.
+      self._bpe_encode_cache[orig] = self._bpe_encode_cache.pop(orig)
       return self._bpe_encode_cache[orig]
 
     if self._bpe_file_version == (0, 1):
@@ -1948,38 +2388,10 @@ class BytePairEncoding(Vocabulary):
     else:
       raise NotImplementedError
 
-    pairs = self._get_pairs(word)
-    if not pairs:
+    if len(word) < 2:
       return orig
 
-    while True:
-      bigram = min(pairs, key=lambda pair: self._bpe_codes.get(pair, float('inf')))
-      if bigram not in self._bpe_codes:
-        break
-      first, second = bigram
-      new_word = []
-      i = 0
-      while i < len(word):
-        try:
-          j = word.index(first, i)
-          new_word.extend(word[i:j])
-          i = j
-        except ValueError:
-          new_word.extend(word[i:])
-          break
-
-        if word[i] == first and i < len(word) - 1 and word[i + 1] == second:
-          new_word.append(first + second)
-          i += 2
-        else:
-          new_word.append(word[i])
-          i += 1
-      new_word = tuple(new_word)
-      word = new_word
-      if len(word) == 1:
-        break
-      else:
-        pairs = self._get_pairs(word)
+    word = self._apply_merges(word)
 
     # don't print end-of-word symbols
     if word[-1] == '</w>':
@@ -1991,6 +2403,8 @@ class BytePairEncoding(Vocabulary):
       word = self.check_vocab_and_split(word, self._bpe_codes_reverse, self.labels, self._bpe_separator)
 
     self._bpe_encode_cache[orig] = word
+    if len(self._bpe_encode_cache) > self._bpe_encode_cache_size:
+      self._bpe_encode_cache.popitem(last=False)
     return word
 
   def check_vocab_and_split(self, orig, bpe_codes, vocab, separator):
@@ -2249,6 +2663,7 @@ class LibriSpeechCorpus(CachedDataset2):
                use_zip=False, use_ogg=False, use_cache_manager=False,
                fixed_random_seed=None, fixed_random_subset=None,
                epoch_wise_filter=None,
+               feature_extraction_num_workers=0, feature_extraction_look_ahead=None,
                name=None,
                **kwargs):
     """
@@ -2268,6 +2683,9 @@ class LibriSpeechCorpus(CachedDataset2):
       If given, will use this random subset. This will be applied initially at loading time,
       i.e. not dependent on the epoch. It will use an internally hardcoded fixed random seed, i.e. it's deterministic.
     :param dict|None epoch_wise_filter: see init_seq_order
+    :param int feature_extraction_num_workers: if > 0, extract the audio features in a pool of worker processes,
+      for the next seqs in epoch order. see :class:`ExtractAudioFeaturesPool`
+    :param int|None feature_extraction_look_ahead: number of seqs to prepare in advance, for the worker pool
     """
     if not name:
       name = "prefix:" + prefix
@@ -2332,8 +2750,26 @@ class LibriSpeechCorpus(CachedDataset2):
       self.transs = {s: self.transs[s] for s in seqs}
     self.epoch_wise_filter = epoch_wise_filter
     self._seq_order = None  # type: typing.Optional[typing.List[int]]
+    self._audio_random_seed = None  # type: typing.Optional[int]
+    self._feature_extraction_pool = None  # type: typing.Optional[ExtractAudioFeaturesPool]
+    if self.feature_extractor and feature_extraction_num_workers:
+      import weakref
+      # The pool must not keep a reference to us, such that __del__ can close it.
+      self_ref = weakref.ref(self)
+      self._feature_extraction_pool = ExtractAudioFeaturesPool(
+        feature_extractor=self.feature_extractor,
+        get_job=lambda seq_idx: self_ref()._get_feature_extraction_job(seq_idx),
+        num_workers=feature_extraction_num_workers, look_ahead=feature_extraction_look_ahead, name=str(self))
     self.init_seq_order()
 
+  def __del__(self):
+    # noinspection PyBroadException
+    try:
+      if self._feature_extraction_pool:
+        self._feature_extraction_pool.close()
+    except Exception:  # e.g. at shutdown, or not fully initialized. but does not matter
+      pass
+
   def _collect_trans(self):
     from glob import glob
     import os
@@ -2388,7 +2824,10 @@ class LibriSpeechCorpus(CachedDataset2):
     super(LibriSpeechCorpus, self).init_seq_order(epoch=epoch, seq_list=seq_list)
     if not epoch:
       epoch = 1
-    self._audio_random.seed(self._fixed_random_seed or self._get_random_seed_for_epoch(epoch=epoch))
+    self._audio_random_seed = self._fixed_random_seed or self._get_random_seed_for_epoch(epoch=epoch)
+    self._audio_random.seed(self._audio_random_seed)
+    if self._feature_extraction_pool:
+      self._feature_extraction_pool.reset()
 
     def get_seq_len(i):
       """
@@ -2551,13 +2990,27 @@ class LibriSpeechCorpus(CachedDataset2):
       assert os.path.exists(audio_fn)
       return open(audio_fn, "rb")
 
+  def _get_feature_extraction_job(self, seq_idx):
+    """
+    :param int seq_idx:
+    :return: (raw audio bytes, seq tag, random seed) or None. see :class:`ExtractAudioFeaturesPool`
+    :rtype: (bytes,str,list[int])|None
+    """
+    if seq_idx >= self._num_seqs:
+      return None
+    with self._open_audio_file(seq_idx) as audio_file:
+      raw_bytes = audio_file.read()
+    return raw_bytes, self.get_tag(seq_idx), [self._audio_random_seed, self._get_ref_seq_idx(seq_idx)]
+
   def _collect_single_seq(self, seq_idx):
     """
     :param int seq_idx:
     :rtype: DatasetSeq
     """
     seq_tag = self.get_tag(seq_idx)
-    if self.feature_extractor:
+    if self._feature_extraction_pool:
+      features = self._feature_extraction_pool.get_features(seq_idx)
+    elif self.feature_extractor:
       with self._open_audio_file(seq_idx) as audio_file:
         features = self.feature_extractor.get_audio_features_from_raw_bytes(audio_file, seq_name=seq_tag)
     else:
@@ -2599,6 +3052,7 @@ class OggZipDataset(CachedDataset2):
                use_cache_manager=False,
                fixed_random_seed=None, fixed_random_subset=None,
                epoch_wise_filter=None,
+               feature_extraction_num_workers=0, feature_extraction_look_ahead=None,
                **kwargs):
     """
     :param str path: filename to zip
@@ -2612,6 +3066,9 @@ class OggZipDataset(CachedDataset2):
       If given, will use this random subset. This will be applied initially at loading time,
       i.e. not dependent on the epoch. It will use an internally hardcoded fixed random seed, i.e. it's deterministic.
     :param dict|None epoch_wise_filter: see init_seq_order
+    :param int feature_extraction_num_workers: if > 0, extract the audio features in a pool of worker processes,
+      for the next seqs in epoch order. see :class:`ExtractAudioFeaturesPool`
+    :param int|None feature_extraction_look_ahead: number of seqs to prepare in advance, for the worker pool
     """
     import os
     import zipfile
@@ -2658,8 +3115,26 @@ class OggZipDataset(CachedDataset2):
       self._filter_fixed_random_subset(fixed_random_subset)
     self.epoch_wise_filter = EpochWiseFilter(epoch_wise_filter) if epoch_wise_filter else None
     self._seq_order = None  # type: typing.Optional[typing.List[int]]
+    self._audio_random_seed = None  # type: typing.Optional[int]
+    self._feature_extraction_pool = None  # type: typing.Optional[ExtractAudioFeaturesPool]
+    if self.feature_extractor and feature_extraction_num_workers:
+      import weakref
+      # The pool must not keep a reference to us, such that __del__ can close it.
+      self_ref = weakref.ref(self)
+      self._feature_extraction_pool = ExtractAudioFeaturesPool(
+        feature_extractor=self.feature_extractor,
+        get_job=lambda seq_idx: self_ref()._get_feature_extraction_job(seq_idx),
+        num_workers=feature_extraction_num_workers, look_ahead=feature_extraction_look_ahead, name=str(self))
     self.init_seq_order()
 
+  def __del__(self):
+    # noinspection PyBroadException
+    try:
+      if self._feature_extraction_pool:
+        self._feature_extraction_pool.close()
+    except Exception:  # e.g. at shutdown, or not fully initialized. but does not matter
+      pass
+
   def _read(self, filename, zip_index):
     """
     :param str filename: in zip-file
@@ -2670,6 +3145,29 @@ class OggZipDataset(CachedDataset2):
       return self._zip_files[zip_index].read(filename)
     return open("%s/%s" % (self.paths[0], filename), "rb").read()
 
+  def _get_file_id(self, filename, zip_index):
+    """
+    :param str filename: in zip-file
+    :param int zip_index: index of the zip file, unused when loading without zip
+    :return: unique id of the file content, for the :class:`AudioFeatureCache`
+    :rtype: str
+    """
+    import os
+    if self._zip_files is not None:
+      info = self._zip_files[zip_index].getinfo(filename)
+      return "%s:%s:%i:%i" % (os.path.abspath(self.paths[zip_index]), filename, info.CRC, info.file_size)
+    filename = os.path.abspath("%s/%s" % (self.paths[0], filename))
+    stat = os.stat(filename)
+    return "%s:%i:%i" % (filename, stat.st_mtime, stat.st_size)
+
+  def _get_audio_file_id(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: str
+    """
+    seq = self._data[self._get_ref_seq_idx(seq_idx)]
+    return self._get_file_id("%s/%s" % (self._names[seq['_zip_file_index']], seq["file"]), seq['_zip_file_index'])
+
   def _collect_data_part(self, zip_index):
     """
     collect all the entries of a single zip-file or txt file
@@ -2735,7 +3233,10 @@ class OggZipDataset(CachedDataset2):
     super(OggZipDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
     if not epoch:
       epoch = 1
-    self._audio_random.seed(self._fixed_random_seed or self._get_random_seed_for_epoch(epoch=epoch))
+    self._audio_random_seed = self._fixed_random_seed or self._get_random_seed_for_epoch(epoch=epoch)
+    self._audio_random.seed(self._audio_random_seed)
+    if self._feature_extraction_pool:
+      self._feature_extraction_pool.reset()
 
     def get_seq_len(i):
       """
@@ -2771,6 +3272,17 @@ class OggZipDataset(CachedDataset2):
     assert self._seq_order is not None
     return self._seq_order
 
+  def finish_epoch(self):
+    """
+    Stores the index of the feature cache, and prints its statistics.
+    """
+    if self.feature_extractor and self.feature_extractor.cache:
+      cache = self.feature_extractor.cache
+      cache.save_index()
+      print("%s, epoch %s, feature cache: %s" % (self, self.epoch, cache.get_stats_str()), file=log.v3)
+      cache.reset_stats()
+    super(OggZipDataset, self).finish_epoch()
+
   def _get_ref_seq_idx(self, seq_idx):
     """
     :param int seq_idx:
@@ -2847,15 +3359,41 @@ class OggZipDataset(CachedDataset2):
     raw_bytes = self._read(audio_fn, seq['_zip_file_index'])
     return io.BytesIO(raw_bytes)
 
+  def _get_feature_extraction_job(self, seq_idx):
+    """
+    :param int seq_idx:
+    :return: (raw audio bytes, seq tag, random seed) or None. see :class:`ExtractAudioFeaturesPool`
+    :rtype: (bytes,str,list[int])|None
+    """
+    if seq_idx >= self._num_seqs:
+      return None
+    if self.feature_extractor.cache:
+      features = self.feature_extractor.cache.get(self._get_audio_file_id(seq_idx))
+      if features is not None:
+        return features
+    with self._open_audio_file(seq_idx) as audio_file:
+      raw_bytes = audio_file.read()
+    return raw_bytes, self.get_tag(seq_idx), [self._audio_random_seed, self._get_ref_seq_idx(seq_idx)]
+
   def _collect_single_seq(self, seq_idx):
     """
     :param int seq_idx:
     :rtype: DatasetSeq
     """
     seq_tag = self.get_tag(seq_idx)
-    if self.feature_extractor:
-      with self._open_audio_file(seq_idx) as audio_file:
-        features = self.feature_extractor.get_audio_features_from_raw_bytes(audio_file, seq_name=seq_tag)
+    if self._feature_extraction_pool:
+      features = self._feature_extraction_pool.get_features(seq_idx)
+      if self.feature_extractor.cache:
+        self.feature_extractor.cache.add(self._get_audio_file_id(seq_idx), features)
+    elif self.feature_extractor:
+      cache = self.feature_extractor.cache
+      file_id = self._get_audio_file_id(seq_idx) if cache else None
+      features = cache.get(file_id) if cache else None
+      if features is None:
+        with self._open_audio_file(seq_idx) as audio_file:
+          features = self.feature_extractor.get_audio_features_from_raw_bytes(audio_file, seq_name=seq_tag)
+        if cache:
+          cache.add(file_id, features)
     else:
       features = numpy.zeros(())  # currently the API requires some dummy values...
     targets, txt = self._get_transcription(seq_idx)
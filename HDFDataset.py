@@ -5,6 +5,7 @@ Provides :class:`HDFDataset`.
 
 from __future__ import print_function
 import typing
+import bisect
 import collections
 import gc
 import h5py
@@ -30,14 +31,18 @@ class HDFDataset(CachedDataset):
   This was the main original dataset format of RETURNN.
   """
 
+  # Neighbouring seqs in a file are read via a single h5py slice, up to this number of frames (of "data").
+  max_read_chunk_frames = 100000
+
   def __init__(self, files=None, use_cache_manager=False, **kwargs):
     """
     :param None|list[str] files:
     :param bool use_cache_manager: uses :func:`Util.cf` for files
     """
     super(HDFDataset, self).__init__(**kwargs)
-    assert self.partition_epoch == 1 or self.cache_byte_size_total_limit == 0, \
-      "To use partition_epoch in HDFDatasets, disable caching by setting cache_byte_size=0"
+    assert self.partition_epoch == 1 or self.cache_byte_size_total_limit == 0 or self.cache_engine == "lru", (
+      "To use partition_epoch in HDFDatasets, disable caching by setting cache_byte_size=0, "
+      "or use cache_engine='lru'")
     self._use_cache_manager = use_cache_manager
     self.files = []  # type: typing.List[str]  # file names
     self.h5_files = []  # type: typing.List[h5py.File]
@@ -45,6 +50,8 @@ class HDFDataset(CachedDataset):
     self.file_seq_start = []  # type: typing.List[numpy.ndarray]
     self.data_dtype = {}  # type: typing.Dict[str,str]
     self.data_sparse = {}  # type: typing.Dict[str,bool]
+    # With disabled cache, this keeps the data of the seqs of the last load_seqs call. real seq idx -> key -> data.
+    self._direct_read_buffer = {}  # type: typing.Dict[int,typing.Dict[str,numpy.ndarray]]
     if files:
       for fn in files:
         self.add_file(fn)
@@ -211,46 +218,107 @@ class HDFDataset(CachedDataset):
     assert start < self.num_seqs
     assert end <= self.num_seqs
     if self.cache_byte_size_total_limit == 0:
-      # Just don't use the alloc intervals, or any of the other logic. Just load it on the fly when requested.
+      # Just don't use the alloc intervals, or any of the other logic.
+      # Read the requested seqs now (in as few reads as possible), and keep them only until the next call.
+      real_seq_idxs = [self._seq_index[idc] for idc in range(start, end)]
+      buffer = {ids: self._direct_read_buffer[ids] for ids in real_seq_idxs if ids in self._direct_read_buffer}
+      buffer.update(self._read_seqs([ids for ids in real_seq_idxs if ids not in buffer]))
+      self._direct_read_buffer = buffer
       return
     selection = self.insert_alloc_interval(start, end)
     assert len(selection) <= end - start, (
       "DEBUG: more sequences requested (" + str(len(selection)) + ") as required (" + str(end-start) + ")")
     self.preload_set |= set(range(start, end)) - set(selection)
-    file_info = [[] for _ in range(len(self.files))]  # type: typing.List[typing.List[typing.Tuple[int,int]]]
-    # file_info[i] is (sorted seq idx from selection, real seq idx)
+    seqs_by_real_idx = {}  # type: typing.Dict[int,typing.List[int]]  # real seq idx -> sorted seq idxs
     for idc in selection:
       if self.sample(idc):
-        ids = self._seq_index[idc]
-        file_info[self._get_file_index(ids)].append((idc, ids))
+        seqs_by_real_idx.setdefault(self._seq_index[idc], []).append(idc)
       else:
         self.preload_set.add(idc)
-    for i in range(len(self.files)):
-      if len(file_info[i]) == 0:
-        continue
-      if start == 0 or self.cache_byte_size_total_limit > 0:  # suppress with disabled cache
-        print("loading file %d/%d (seq range %i-%i)" % (i+1, len(self.files), start, end), self.files[i], file=log.v4)
-      fin = self.h5_files[i]
-      inputs = fin['inputs']
-      targets = None
-      if 'targets' in fin:
-        targets = {k: fin['targets/data/' + k] for k in fin['targets/data']}
-      for idc, ids in file_info[i]:
-        s = ids - self.file_start[i]
-        p = self.file_seq_start[i][s]
-        q = self.file_seq_start[i][s + 1]
-        if 'targets' in fin:
-          for k in fin['targets/data']:
+    last_file_idx = None
+    for file_idx, real_seq_idxs in self._plan_reads(sorted(seqs_by_real_idx.keys())):
+      if file_idx != last_file_idx:
+        print("loading file %d/%d (seq range %i-%i)" % (
+          file_idx + 1, len(self.files), start, end), self.files[file_idx], file=log.v4)
+        last_file_idx = file_idx
+      for ids, data in self._read_contiguous_seqs(file_idx, real_seq_idxs).items():
+        for idc in seqs_by_real_idx[ids]:
+          for k, targets in data.items():
+            if k == "data":
+              continue
             if self.targets[k] is None:
               self.targets[k] = numpy.zeros(
-                (self._num_codesteps[self.target_keys.index(k)],) + targets[k].shape[1:], dtype=self.data_dtype[k]) - 1
+                (self._num_codesteps[self.target_keys.index(k)],) + targets.shape[1:], dtype=self.data_dtype[k]) - 1
             ldx = self.target_keys.index(k) + 1
-            self.targets[k][self.get_seq_start(idc)[ldx]:self.get_seq_start(idc)[ldx] + q[ldx] - p[ldx]] = (
-              targets[k][p[ldx]:q[ldx]])
-        self._set_alloc_intervals_data(idc, data=inputs[p[0]:q[0]])
-        self.preload_set.add(idc)
+            self.targets[k][self.get_seq_start(idc)[ldx]:self.get_seq_start(idc)[ldx] + targets.shape[0]] = targets
+          self._set_alloc_intervals_data(idc, data=data["data"])
+          self.preload_set.add(idc)
     gc.collect()
 
+  def _plan_reads(self, real_seq_idxs):
+    """
+    Groups the seqs by file, and neighbouring seqs within a file,
+    such that each group can be read via a single slice (per data key).
+
+    :param list[int] real_seq_idxs: sorted (ascending), unique
+    :return: list of (file idx, list of real seq idx), where the seqs of each entry are consecutive in the file
+    :rtype: list[(int,list[int])]
+    """
+    reads = []  # type: typing.List[typing.Tuple[int,typing.List[int]]]
+    file_idx, file_end, frames = None, None, 0
+    for ids in real_seq_idxs:
+      if file_idx is not None and ids < file_end and ids == reads[-1][1][-1] + 1:
+        s = ids - self.file_start[file_idx]
+        seq_frames = self.file_seq_start[file_idx][s + 1][0] - self.file_seq_start[file_idx][s][0]
+        if frames + seq_frames <= self.max_read_chunk_frames:
+          reads[-1][1].append(ids)
+          frames += seq_frames
+          continue
+      file_idx = self._get_file_index(ids)
+      file_end = self.file_start[file_idx + 1]
+      s = ids - self.file_start[file_idx]
+      frames = self.file_seq_start[file_idx][s + 1][0] - self.file_seq_start[file_idx][s][0]
+      reads.append((file_idx, [ids]))
+    return reads
+
+  def _read_contiguous_seqs(self, file_idx, real_seq_idxs):
+    """
+    Reads the given consecutive seqs of one file via a single slice per data key, and splits them in memory.
+
+    :param int file_idx:
+    :param list[int] real_seq_idxs: consecutive, e.g. via :func:`_plan_reads`
+    :return: real seq idx -> data key -> raw data
+    :rtype: dict[int,dict[str,numpy.ndarray]]
+    """
+    fin = self.h5_files[file_idx]
+    s0 = real_seq_idxs[0] - self.file_start[file_idx]
+    s1 = real_seq_idxs[-1] - self.file_start[file_idx] + 1
+    seq_start = self.file_seq_start[file_idx][s0:s1 + 1]
+    streams = {"data": (fin['inputs'], 0)}
+    if 'targets' in fin:
+      for k in fin['targets/data']:
+        if k in self.target_keys:
+          streams[k] = (fin['targets/data/' + k], self.target_keys.index(k) + 1)
+    res = {ids: {} for ids in real_seq_idxs}  # type: typing.Dict[int,typing.Dict[str,numpy.ndarray]]
+    for k, (stream, ldx) in streams.items():
+      offsets = seq_start[:, ldx]
+      chunk = stream[offsets[0]:offsets[-1]]
+      offsets = offsets - offsets[0]
+      for i, ids in enumerate(real_seq_idxs):
+        res[ids][k] = chunk[offsets[i]:offsets[i + 1]]
+    return res
+
+  def _read_seqs(self, real_seq_idxs):
+    """
+    :param list[int] real_seq_idxs: in any order
+    :return: real seq idx -> data key -> raw data
+    :rtype: dict[int,dict[str,numpy.ndarray]]
+    """
+    res = {}  # type: typing.Dict[int,typing.Dict[str,numpy.ndarray]]
+    for file_idx, file_real_seq_idxs in self._plan_reads(sorted(set(real_seq_idxs))):
+      res.update(self._read_contiguous_seqs(file_idx, file_real_seq_idxs))
+    return res
+
   def get_data(self, seq_idx, key):
     """
     :param int seq_idx:
@@ -260,8 +328,14 @@ class HDFDataset(CachedDataset):
     if self.cache_byte_size_total_limit > 0:  # Use the cache?
       return super(HDFDataset, self).get_data(seq_idx, key)
 
-    # Otherwise, directly read it from file now.
+    # Otherwise, take it from the last load_seqs, or directly read it from file now.
     real_seq_idx = self._seq_index[seq_idx]
+    buffered = self._direct_read_buffer.get(real_seq_idx)
+    if buffered is not None and key in buffered:
+      data = buffered[key]
+      if key == "data" and self.window > 1:
+        data = self.sliding_window(data)
+      return data
     file_idx = self._get_file_index(real_seq_idx)
     fin = self.h5_files[file_idx]
 
@@ -314,6 +388,16 @@ class HDFDataset(CachedDataset):
 
     return end_pos - start_pos
 
+  def get_seq_lengths_array(self):
+    """
+    :return: data key -> seq lengths in the order of the current epoch. see :func:`Dataset.get_seq_lengths_array`
+    :rtype: dict[str,numpy.ndarray]
+    """
+    all_seq_lens = numpy.concatenate([seq_start[1:] - seq_start[:-1] for seq_start in self.file_seq_start], axis=0)
+    real_seq_idxs = numpy.array(self._seq_index, dtype="int64")[numpy.array(self._index_map, dtype="int64")]
+    seq_lens = all_seq_lens[real_seq_idxs]
+    return {key: seq_lens[:, i] for (i, key) in enumerate(["data"] + self.target_keys)}
+
   def _get_tag_by_real_idx(self, real_seq_idx):
     file_idx = self._get_file_index(real_seq_idx)
     real_file_seq_idx = real_seq_idx - self.file_start[file_idx]
@@ -371,10 +455,12 @@ class HDFDataset(CachedDataset):
                       "frames: %i" % self.get_num_timesteps()])
 
   def _get_file_index(self, real_seq_idx):
-    file_index = 0
-    while file_index < len(self.file_start) - 1 and real_seq_idx >= self.file_start[file_index + 1]:
-      file_index += 1
-    return file_index
+    """
+    :param int real_seq_idx:
+    :return: file idx, via binary search in self.file_start
+    :rtype: int
+    """
+    return max(bisect.bisect_right(self.file_start, real_seq_idx) - 1, 0)
 
 
 # ------------------------------------------------------------------------------
@@ -879,9 +965,20 @@ class SimpleHDFWriter:
   which can be read later by :class:`HDFDataset`.
 
   Note that we dump to a temp file first, and only at :func:`close` we move it over to the real destination.
+
+  The HDF datasets are chunked and grow geometrically (see :attr:`growth_factor`),
+  i.e. we do not resize them for every batch, and they are cut to their real size in :func:`close`.
+  With ``async_write``, :func:`insert_batch` only puts the batch into a bounded queue,
+  and a background thread does the (maybe compressed) writing, such that it overlaps with the computation.
   """
 
-  def __init__(self, filename, dim, labels=None, ndim=None, extra_type=None, swmr=False):
+  # Capacity of the HDF datasets grows by this factor when they are full.
+  growth_factor = 1.5
+  # Approximate size of a single HDF chunk.
+  chunk_num_bytes = 1024 * 1024
+
+  def __init__(self, filename, dim, labels=None, ndim=None, extra_type=None, swmr=False,
+               async_write=False, max_queue_size=10, compression=None):
     """
     :param str filename: Create file, truncate if exists
     :param int|None dim:
@@ -889,6 +986,9 @@ class SimpleHDFWriter:
     :param list[str]|None labels:
     :param dict[str,(int,int,str)]|None extra_type: key -> (dim,ndim,dtype)
     :param bool swmr: see http://docs.h5py.org/en/stable/swmr.html
+    :param bool async_write: write in a background thread. see :func:`insert_batch`
+    :param int max_queue_size: number of batches which can be pending for the background thread
+    :param str|None compression: HDF compression filter for the data, e.g. "gzip" or "lzf"
     """
     from Util import hdf5_strings, unicode
     import tempfile
@@ -904,6 +1004,7 @@ class SimpleHDFWriter:
     if labels:
       assert len(labels) == dim
     self.filename = filename
+    self.compression = compression
     # By default, we should not override existing data.
     # If we want that at some later point, we can introduce an option for it.
     assert not os.path.exists(self.filename)
@@ -926,13 +1027,17 @@ class SimpleHDFWriter:
     # where data_key_idx == 0 is for the main input data,
     # and otherwise data_key_idx == 1 + sorted(self._prepared_extra).index(data_key).
     # data_key_idx must allow for 2 entries by default, as HDFDataset assumes 'classes' by default.
-    self._seq_lengths = self._file.create_dataset("seqLengths", (0, 2), dtype='i', maxshape=(None, None))
+    self._seq_lengths = self._file.create_dataset(
+      "seqLengths", (0, 2), dtype='i', maxshape=(None, None), chunks=(4096, 2))
     # Note about strings in HDF: http://docs.h5py.org/en/stable/strings.html
     # Earlier we used S%i, i.e. fixed-sized strings, with the calculated max string length.
     # noinspection PyUnresolvedReferences
     dt = h5py.special_dtype(vlen=unicode)
-    self._seq_tags = self._file.create_dataset('seqTags', (0,), dtype=dt, maxshape=(None,))
+    self._seq_tags = self._file.create_dataset('seqTags', (0,), dtype=dt, maxshape=(None,), chunks=(4096,))
 
+    # The HDF datasets are bigger than this (see _grow_dataset). These are the real sizes.
+    self._num_seqs = 0
+    self._num_time_steps = 0
     self._extra_num_time_steps = {}  # type: typing.Dict[str,int]  # key -> num-steps
     self._prepared_extra = set()
     if extra_type:
@@ -944,11 +1049,62 @@ class SimpleHDFWriter:
       # See comments in test_SimpleHDFWriter_swmr...
       raise NotImplementedError("SimpleHDFWriter SWMR is not really finished...")
 
+    self.num_resizes = 0
+    self.queue_blocked_time = 0.0  # time in insert_batch waiting for a free place in the queue
+    self.close_blocked_time = 0.0  # time in close waiting for the pending batches
+    self._queue = None
+    self._thread = None
+    self._thread_exception = None  # type: typing.Optional[BaseException]
+    if async_write:
+      from threading import Thread
+      try:
+        # noinspection PyCompatibility
+        from Queue import Queue
+      except ImportError:
+        # noinspection PyCompatibility
+        from queue import Queue
+      self._queue = Queue(maxsize=max_queue_size)
+      self._thread = Thread(target=self._thread_main, name="%r writer" % self)
+      self._thread.daemon = True
+      self._thread.start()
+
+  def __repr__(self):
+    return "<%s %r>" % (self.__class__.__name__, self.filename)
+
   def __del__(self):
     if self._file:
       self._file.close()
       self._file = None
 
+  def _get_chunk_shape(self, shape, dtype):
+    """
+    :param list[int]|tuple[int] shape: initial shape
+    :param str|numpy.dtype dtype:
+    :return: chunk shape, or True to let h5py guess it
+    :rtype: tuple[int]|bool
+    """
+    if any([d == 0 for d in shape[1:]]):
+      return True  # dynamic other axes, we cannot really know. let h5py guess
+    if isinstance(dtype, str) and dtype == "string":
+      item_size = 16
+    else:
+      item_size = numpy.dtype(dtype).itemsize or 16
+    frame_num_bytes = item_size * int(numpy.prod(shape[1:]))
+    return (max(1, self.chunk_num_bytes // frame_num_bytes),) + tuple(shape[1:])
+
+  def _grow_dataset(self, hdf_data, size):
+    """
+    Makes sure that the first axis of the HDF dataset has at least the given size.
+    The dataset grows geometrically, so that we do not resize it for every batch.
+
+    :param h5py.Dataset hdf_data:
+    :param int size:
+    """
+    if hdf_data.shape[0] >= size:
+      return
+    hdf_data.resize(max(size, int(hdf_data.shape[0] * self.growth_factor)), axis=0)
+    self.num_resizes += 1
+
   def _prepare_extra(self, extra_type):
     """
     :param dict[str,(int,int,str)] extra_type: key -> (dim,ndim,dtype)
@@ -971,11 +1127,13 @@ class SimpleHDFWriter:
       shape = [None] * ndim  # type: typing.List[typing.Optional[int]]
       if ndim >= 2:
         shape[-1] = dim
+      chunks = self._get_chunk_shape([d if d else 0 for d in shape], dtype)
       if dtype == "string":
         # noinspection PyUnresolvedReferences
         dtype = h5py.special_dtype(vlen=str)
       self._datasets[data_key] = self._file['targets/data'].create_dataset(
-        data_key, shape=[d if d else 0 for d in shape], dtype=dtype, maxshape=shape)
+        data_key, shape=[d if d else 0 for d in shape], dtype=dtype, maxshape=shape,
+        chunks=chunks, compression=self.compression)
       self._file['targets/size'].attrs[data_key] = [dim or 1, ndim]
       self._extra_num_time_steps[data_key] = 0
       self._prepared_extra.add(data_key)
@@ -996,14 +1154,13 @@ class SimpleHDFWriter:
     name = "inputs"
     if name not in self._datasets:
       self._datasets[name] = self._file.create_dataset(
-        name, raw_data.shape, raw_data.dtype, maxshape=tuple(None for _ in raw_data.shape))
-    else:
-      old_shape = self._datasets[name].shape
-      self._datasets[name].resize(old_shape[0] + raw_data.shape[0], axis=0)
+        name, (0,) + raw_data.shape[1:], raw_data.dtype, maxshape=tuple(None for _ in raw_data.shape),
+        chunks=self._get_chunk_shape(raw_data.shape, raw_data.dtype), compression=self.compression)
+    offset = self._num_time_steps
+    self._num_time_steps += raw_data.shape[0]
+    self._grow_dataset(self._datasets[name], self._num_time_steps)
     # append raw data to dataset
-    self._datasets[name][self._file.attrs['numTimesteps']:] = raw_data
-    self._file.attrs['numTimesteps'] += raw_data.shape[0]
-    self._file.attrs['numSeqs'] += 1
+    self._datasets[name][offset:self._num_time_steps] = raw_data
 
   def _insert_h5_other(self, data_key, raw_data, dtype=None, add_time_dim=False, dim=None):
     """
@@ -1028,10 +1185,10 @@ class SimpleHDFWriter:
         dim = 1  # dummy
 
     # We assume that _insert_h5_inputs was called before.
-    assert self._file.attrs['numSeqs'] > 0 and self._seq_lengths.shape[0] > 0
-    seq_idx = self._file.attrs['numSeqs'] - 1
+    assert self._num_seqs > 0 and self._seq_lengths.shape[0] > 0
+    seq_idx = self._num_seqs - 1
 
-    if raw_data.dtype == numpy.object:
+    if raw_data.dtype == object:
       # Is this a string?
       assert isinstance(raw_data.flat[0], (str, bytes))
       dtype = "string"
@@ -1044,15 +1201,15 @@ class SimpleHDFWriter:
       for data_key_idx_0, data_key_ in enumerate(sorted(self._prepared_extra)):
         self._seq_lengths[seq_idx, data_key_idx_0 + 1] = self._extra_num_time_steps[data_key_]
 
+    offset = self._extra_num_time_steps[data_key]
     self._extra_num_time_steps[data_key] += raw_data.shape[0]
-    self._datasets[data_key].resize(self._extra_num_time_steps[data_key], axis=0)
+    hdf_data = self._datasets[data_key]
+    self._grow_dataset(hdf_data, self._extra_num_time_steps[data_key])
 
     data_key_idx = sorted(self._prepared_extra).index(data_key) + 1
     self._seq_lengths[seq_idx, data_key_idx] = raw_data.shape[0]
 
-    offset = self._extra_num_time_steps[data_key] - raw_data.shape[0]
-    hdf_data = self._datasets[data_key]
-    hdf_data[offset:] = raw_data
+    hdf_data[offset:self._extra_num_time_steps[data_key]] = raw_data
 
   def insert_batch(self, inputs, seq_len, seq_tag, extra=None):
     """
@@ -1063,6 +1220,9 @@ class SimpleHDFWriter:
       The dtype and dim is inferred automatically from the Numpy array.
       If there are multiple items, the seq length must be the same currently.
       Must be batch-major, and following the time, then the feature.
+
+    With ``async_write``, this returns as soon as the batch is in the queue.
+    It blocks only if the queue is full. Errors of the writer thread are raised here or in :func:`close`.
     """
     n_batch = len(seq_tag)
     assert n_batch == inputs.shape[0]
@@ -1087,9 +1247,34 @@ class SimpleHDFWriter:
       assert all([n_batch == value.shape[0] for value in extra.values()]), (
         "n_batch %i, extra shapes: %r" % (n_batch, {key: value.shape for (key, value) in extra.items()}))
 
-    seqlen_offset = self._seq_lengths.shape[0]
-    self._seq_lengths.resize(seqlen_offset + n_batch, axis=0)
-    self._seq_tags.resize(seqlen_offset + n_batch, axis=0)
+    if not self._thread:
+      self._insert_batch(inputs=inputs, seq_len=seq_len, seq_tag=seq_tag, extra=extra)
+      return
+    import time
+    self._check_thread_exception()
+    # The arrays might be reused by the caller (e.g. the buffers of tf.py_func), thus we copy them.
+    item = dict(
+      inputs=numpy.array(inputs), seq_len={key: numpy.array(value) for (key, value) in seq_len.items()},
+      seq_tag=list(seq_tag), extra={key: numpy.array(value) for (key, value) in extra.items()} if extra else None)
+    start_time = time.time()
+    self._queue.put(item)
+    self.queue_blocked_time += time.time() - start_time
+
+  def _insert_batch(self, inputs, seq_len, seq_tag, extra=None):
+    """
+    Does the actual writing of :func:`insert_batch`, maybe in the background thread.
+
+    :param numpy.ndarray inputs:
+    :param dict[int,list[int]|numpy.ndarray] seq_len:
+    :param list[str|bytes] seq_tag:
+    :param dict[str,numpy.ndarray]|None extra:
+    """
+    n_batch = len(seq_tag)
+    ndim_with_seq_len = len(seq_len)
+    sparse = ndim_with_seq_len == self.ndim
+    seqlen_offset = self._num_seqs
+    self._grow_dataset(self._seq_lengths, seqlen_offset + n_batch)
+    self._grow_dataset(self._seq_tags, seqlen_offset + n_batch)
 
     for i in range(n_batch):
       self._seq_tags[seqlen_offset + i] = numpy.array(seq_tag[i], dtype=self._seq_tags.dtype)
@@ -1102,6 +1287,7 @@ class SimpleHDFWriter:
       if self.dim and not sparse:
         flat_shape.append(self.dim)
       self._seq_lengths[seqlen_offset + i, 0] = flat_seq_len
+      self._num_seqs += 1
       data = inputs[i]
       data = data[tuple([slice(None, seq_len[axis][i]) for axis in range(ndim_with_seq_len)])]
       data = numpy.reshape(data, flat_shape)
@@ -1126,15 +1312,68 @@ class SimpleHDFWriter:
             file=log.v3)
           raise
 
+    self._file.attrs['numTimesteps'] = self._num_time_steps
+    self._file.attrs['numSeqs'] = self._num_seqs
+
+  def _thread_main(self):
+    while True:
+      item = self._queue.get()
+      if item is None:
+        break
+      if self._thread_exception:
+        continue  # we just skip everything after an error. the main thread will raise it
+      # noinspection PyBroadException
+      try:
+        self._insert_batch(**item)
+      except BaseException as exc:
+        import sys
+        sys.excepthook(*sys.exc_info())
+        self._thread_exception = exc
+
+  def _check_thread_exception(self):
+    if self._thread_exception:
+      raise Exception("%s: writer thread failed: %r" % (self, self._thread_exception))
+
+  def _finish_datasets(self):
+    """
+    Cut the HDF datasets to their real size (we have grown them maybe more, see :func:`_grow_dataset`).
+    """
+    self._seq_lengths.resize(self._num_seqs, axis=0)
+    self._seq_tags.resize(self._num_seqs, axis=0)
+    if "inputs" in self._datasets:
+      self._datasets["inputs"].resize(self._num_time_steps, axis=0)
+    for data_key, num_time_steps in self._extra_num_time_steps.items():
+      self._datasets[data_key].resize(num_time_steps, axis=0)
+
+  def get_stats_str(self):
+    """
+    :return: stats about the writing, e.g. how long we were blocked because of the background thread
+    :rtype: str
+    """
+    s = "%i seqs, %i resizes" % (self._num_seqs, self.num_resizes)
+    if self._queue:
+      s += ", blocked %.3f sec on full queue, %.3f sec on close" % (self.queue_blocked_time, self.close_blocked_time)
+    return s
+
   def close(self):
     """
     Closes the file.
     """
     import os
     import shutil
+    import time
+    if self._thread:
+      start_time = time.time()
+      self._queue.put(None)
+      self._thread.join()
+      self._thread = None
+      self.close_blocked_time += time.time() - start_time
+      self._check_thread_exception()
     if self._file:
+      self._finish_datasets()
       self._file.close()
       self._file = None
+      print("%s: wrote %s." % (self, self.get_stats_str()), file=log.v3)
     if self.tmp_filename:
       assert not os.path.exists(self.filename)
       shutil.copyfile(self.tmp_filename, self.filename)
@@ -1318,6 +1318,23 @@ class TranslationDataset(CachedDataset2):
     self._num_seqs = len(self._seq_order)
     return True
 
+  def get_seq_lengths_array(self):
+    """
+    This waits until all the data is loaded.
+
+    :return: data key -> seq lengths in the order of the current epoch. see :func:`Dataset.get_seq_lengths_array`
+    :rtype: dict[str,numpy.ndarray]
+    """
+    seq_order = numpy.array(self._seq_order, dtype="int64")
+    res = {}
+    # Same keys as in _collect_single_seq.
+    for key, data_key in [("data", self._main_data_key), ("classes", self._main_classes_key)]:
+      self._get_data(key=data_key, line_nr=self._get_data_len() - 1)  # wait until loaded
+      with self._lock:
+        seq_lens = numpy.array([len(seq) for seq in self._data[data_key]], dtype="int64")
+      res[key] = seq_lens[seq_order]
+    return res
+
   def _collect_single_seq(self, seq_idx):
     if seq_idx >= self._num_seqs:
       return None
@@ -1379,6 +1396,13 @@ class ConfusionNetworkDataset(TranslationDataset):
     """
     return ["sparse_inputs", "sparse_weights", "classes"]
 
+  def get_seq_lengths_array(self):
+    """
+    :return: None. The keys of :func:`TranslationDataset.get_seq_lengths_array` do not match our data keys.
+    :rtype: None
+    """
+    return None
+
   def is_data_sparse(self, key):
     """
     :param str key:
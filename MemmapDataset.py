@@ -0,0 +1,303 @@
+"""
+Provides :class:`MemmapDataset` and :class:`MemmapDatasetWriter`.
+
+The format is a directory with:
+
+* ``info.json``: meta information (data keys, dims, dtypes, labels, num seqs)
+* ``<key>.data``: for each data key, the raw data of all seqs, concatenated in time, without any header
+* ``<key>.offsets.npy``: for each data key, the start frame of each seq, shape (num_seqs + 1,)
+* ``tags.npy``: the seq tags
+
+All of these are opened via :class:`numpy.memmap`, thus getting the data of a seq is just a slice into the file,
+and multiple processes on the same node share the data via the page cache of the OS.
+Use ``tools/hdf_dump.py --format memmap`` to convert some existing dataset (e.g. :class:`HDFDataset`) to this format.
+"""
+
+from __future__ import print_function
+
+import json
+import typing
+import numpy
+from Dataset import Dataset
+from Log import log
+from Util import NumbersDict
+
+
+class MemmapDataset(Dataset):
+  """
+  Reads the format written by :class:`MemmapDatasetWriter`.
+  There is no cache in this dataset, all data is memory-mapped,
+  thus this also works with any ``partition_epoch``.
+  """
+
+  FormatVersion = 1
+
+  def __init__(self, path, **kwargs):
+    """
+    :param str path: directory, as written by :class:`MemmapDatasetWriter`
+    """
+    super(MemmapDataset, self).__init__(**kwargs)
+    self.path = path
+    with open("%s/info.json" % path) as f:
+      info = json.load(f)
+    assert info["format_version"] == self.FormatVersion, "%s: unexpected format in %r" % (self, path)
+    self._data_keys = info["data_keys"]  # type: typing.List[str]
+    self._target_list = info["target_list"]  # type: typing.List[str]
+    self._data_dtypes = info["dtypes"]  # type: typing.Dict[str,str]
+    self._total_num_seqs = info["num_seqs"]
+    self.num_outputs = {key: tuple(value) for (key, value) in info["num_outputs"].items()}
+    self.labels = info.get("labels", {})
+    if "data" in self.num_outputs:
+      self.num_inputs = self.num_outputs["data"][0]
+    self._offsets = {}  # type: typing.Dict[str,numpy.ndarray]
+    self._data = {}  # type: typing.Dict[str,numpy.ndarray]
+    for key in self._data_keys:
+      self._offsets[key] = numpy.load("%s/%s.offsets.npy" % (path, key), mmap_mode="r")
+      assert self._offsets[key].shape == (self._total_num_seqs + 1,)
+      shape = (int(self._offsets[key][-1]),) + tuple(info["shapes"][key])
+      if shape[0] == 0:  # numpy.memmap does not support empty files
+        self._data[key] = numpy.zeros(shape, dtype=self._data_dtypes[key])
+      else:
+        self._data[key] = numpy.memmap("%s/%s.data" % (path, key), dtype=self._data_dtypes[key], mode="r", shape=shape)
+    self._tags = numpy.load("%s/tags.npy" % path, mmap_mode="r")
+    self._tag_idx = None  # type: typing.Optional[typing.Dict[str,int]]
+    self._seq_len_key = "data" if "data" in self._data_keys else self._data_keys[0]
+    self._num_timesteps = int(self._offsets[self._seq_len_key][-1])
+    self._num_codesteps = [int(self._offsets[key][-1]) for key in self._target_list]
+    self._seq_order = None  # type: typing.Optional[numpy.ndarray]  # sorted seq idx -> orig seq idx
+
+  def _get_seq_len_by_orig_idx(self, orig_seq_idx):
+    """
+    :param int orig_seq_idx:
+    :rtype: int
+    """
+    offsets = self._offsets[self._seq_len_key]
+    return int(offsets[orig_seq_idx + 1] - offsets[orig_seq_idx])
+
+  def init_seq_order(self, epoch=None, seq_list=None):
+    """
+    :param int|None epoch:
+    :param list[str]|None seq_list:
+    :rtype: bool
+    """
+    super(MemmapDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
+    if seq_list is not None:
+      if self._tag_idx is None:
+        self._tag_idx = {tag: i for (i, tag) in enumerate(self.get_all_tags())}
+      seq_order = [self._tag_idx[tag] for tag in seq_list]
+    else:
+      seq_order = self.get_seq_order_for_epoch(
+        epoch=epoch, num_seqs=self._total_num_seqs, get_seq_len=self._get_seq_len_by_orig_idx)
+    self._seq_order = numpy.array(seq_order, dtype="int64")
+    return True
+
+  def get_current_seq_order(self):
+    """
+    :rtype: list[int]
+    """
+    assert self._seq_order is not None
+    return self._seq_order.tolist()
+
+  def _load_seqs(self, start, end):
+    """
+    Nothing to do, all data is memory-mapped.
+
+    :param int start:
+    :param int end:
+    """
+
+  def get_data(self, seq_idx, key):
+    """
+    :param int seq_idx: sorted seq idx
+    :param str key:
+    :return: slice of the memory-mapped data, i.e. no copy
+    :rtype: numpy.ndarray
+    """
+    orig_seq_idx = self._seq_order[seq_idx]
+    offsets = self._offsets[key]
+    data = self._data[key][offsets[orig_seq_idx]:offsets[orig_seq_idx + 1]]
+    if key == "data" and self.window > 1:
+      data = self.sliding_window(data)
+    return data
+
+  def get_input_data(self, sorted_seq_idx):
+    """
+    :param int sorted_seq_idx:
+    :rtype: numpy.ndarray
+    """
+    return self.get_data(sorted_seq_idx, "data")
+
+  def get_targets(self, target, sorted_seq_idx):
+    """
+    :param str target:
+    :param int sorted_seq_idx:
+    :rtype: numpy.ndarray
+    """
+    return self.get_data(sorted_seq_idx, target)
+
+  def get_seq_length(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: NumbersDict
+    """
+    orig_seq_idx = self._seq_order[seq_idx]
+    return NumbersDict({
+      key: int(offsets[orig_seq_idx + 1] - offsets[orig_seq_idx]) for (key, offsets) in self._offsets.items()})
+
+  def get_seq_lengths_array(self):
+    """
+    :return: data key -> seq lengths in the order of the current epoch. see :func:`Dataset.get_seq_lengths_array`
+    :rtype: dict[str,numpy.ndarray]
+    """
+    return {key: numpy.diff(offsets)[self._seq_order] for (key, offsets) in self._offsets.items()}
+
+  def get_tag(self, sorted_seq_idx):
+    """
+    :param int sorted_seq_idx:
+    :rtype: str
+    """
+    return self._tags[self._seq_order[sorted_seq_idx]].decode("utf8")
+
+  def get_all_tags(self):
+    """
+    :rtype: list[str]
+    """
+    return [tag.decode("utf8") for tag in self._tags.tolist()]
+
+  def get_total_num_seqs(self):
+    """
+    :rtype: int
+    """
+    return self._total_num_seqs
+
+  def have_corpus_seq_idx(self):
+    """
+    :rtype: bool
+    """
+    return True
+
+  def get_corpus_seq_idx(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: int
+    """
+    return int(self._seq_order[seq_idx])
+
+  @property
+  def num_seqs(self):
+    """
+    :rtype: int
+    """
+    assert self._seq_order is not None
+    return len(self._seq_order)
+
+  def get_data_keys(self):
+    """
+    :rtype: list[str]
+    """
+    return list(self._data_keys)
+
+  def get_target_list(self):
+    """
+    :rtype: list[str]
+    """
+    return list(self._target_list)
+
+  def get_data_dtype(self, key):
+    """
+    :param str key:
+    :rtype: str
+    """
+    return self._data_dtypes[key]
+
+
+class MemmapDatasetWriter:
+  """
+  Writes the format for :class:`MemmapDataset`, see :func:`dump_from_dataset`.
+  The data is written in a single pass over the dataset.
+  """
+
+  def __init__(self, path):
+    """
+    :param str path: directory. will be created
+    """
+    print("Creating memmap dataset %s" % path, file=log.v3)
+    from Util import maybe_make_dirs
+    maybe_make_dirs(path)
+    self.path = path
+
+  def close(self):
+    """
+    Nothing to do. For compatibility with :class:`HDFDataset.HDFDatasetWriter`.
+    """
+
+  def dump_from_dataset(self, dataset, epoch=1, start_seq=0, end_seq=float("inf"), use_progress_bar=True):
+    """
+    :param Dataset dataset: could be any dataset implemented as child of Dataset
+    :param int epoch: for dataset
+    :param int start_seq:
+    :param int|float end_seq:
+    :param bool use_progress_bar:
+    """
+    from Util import progress_bar_with_time, try_run, human_size
+
+    print("Work on epoch: %i" % epoch, file=log.v3)
+    dataset.init_seq_order(epoch)
+    data_keys = sorted(dataset.get_data_keys())
+    for key in ["orth", "raw"]:  # special workaround for now, not handled
+      if key in data_keys:
+        data_keys.remove(key)
+    print("Data keys:", data_keys, file=log.v3)
+    dataset_num_seqs = try_run(lambda: dataset.num_seqs, default=None)  # can be unknown
+    if end_seq != float("inf"):
+      dataset_num_seqs = min(dataset_num_seqs, end_seq) if dataset_num_seqs is not None else end_seq
+
+    files = {key: open("%s/%s.data" % (self.path, key), "wb") for key in data_keys}
+    offsets = {key: [0] for key in data_keys}
+    shapes = {}  # type: typing.Dict[str,typing.Tuple[int,...]]
+    dtypes = {key: str(numpy.dtype(dataset.get_data_dtype(key))) for key in data_keys}
+    seq_tags = []
+    seq_idx = start_seq
+    try:
+      while dataset.is_less_than_num_seqs(seq_idx) and seq_idx < end_seq:
+        dataset.load_seqs(seq_idx, seq_idx + 1)
+        seq_tags.append(dataset.get_tag(seq_idx))
+        for key in data_keys:
+          data = numpy.asarray(dataset.get_data(seq_idx, key), dtype=dtypes[key])
+          if data.ndim == 0:
+            data = data.reshape((1,))
+          if key not in shapes:
+            shapes[key] = data.shape[1:]
+          assert data.shape[1:] == shapes[key], "%s: seq %i, key %r: shape %r, expected (*,) + %r" % (
+            self, seq_idx, key, data.shape, shapes[key])
+          files[key].write(numpy.ascontiguousarray(data).tobytes())
+          offsets[key].append(offsets[key][-1] + data.shape[0])
+        if use_progress_bar and dataset_num_seqs:
+          progress_bar_with_time(float(seq_idx - start_seq) / (dataset_num_seqs - start_seq))
+        seq_idx += 1
+    finally:
+      for f in files.values():
+        f.close()
+    num_seqs = len(seq_tags)
+    assert num_seqs > 0
+
+    for key in data_keys:
+      print("Total len of %r is %s, shape %r, dtype %s" % (
+        key, human_size(offsets[key][-1]), [offsets[key][-1]] + list(shapes[key]), dtypes[key]), file=log.v3)
+      numpy.save("%s/%s.offsets.npy" % (self.path, key), numpy.array(offsets[key], dtype="int64"))
+    numpy.save("%s/tags.npy" % self.path, numpy.array([tag.encode("utf8") for tag in seq_tags], dtype="S"))
+    info = {
+      "format_version": MemmapDataset.FormatVersion,
+      "num_seqs": num_seqs,
+      "data_keys": data_keys,
+      "target_list": [key for key in dataset.get_target_list() if key in data_keys],
+      "dtypes": dtypes,
+      "shapes": {key: list(shapes[key]) for key in data_keys},
+      "num_outputs": {key: list(dataset.num_outputs[key]) for key in data_keys if key in dataset.num_outputs},
+      "labels": {key: list(dataset.labels[key]) for key in data_keys if dataset.labels.get(key)}}
+    for key in data_keys:
+      if key not in info["num_outputs"]:
+        info["num_outputs"][key] = [dataset.get_data_dim(key), len(shapes[key]) + 1]
+    with open("%s/info.json" % self.path, "w") as f:
+      json.dump(info, f, indent=2, sort_keys=True)
+    print("All done.", file=log.v3)
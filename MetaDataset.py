@@ -28,8 +28,10 @@ from CachedDataset2 import CachedDataset2
 from Util import NumbersDict, load_json
 from Log import log
 from random import Random
+import functools
 import numpy
 import sys
+import time
 import typing
 
 
@@ -108,6 +110,84 @@ class EpochWiseFilter:
     return seq_order
 
 
+class SubDatasetLoader:
+  """
+  Loads seqs of independent sub-datasets (e.g. of :class:`MetaDataset` or :class:`CombinedDataset`),
+  optionally in parallel on a thread pool, such that the latency is the max and not the sum of the sub-datasets.
+  Also collects the time spent per sub-dataset, to see which one is the bottleneck.
+  """
+
+  def __init__(self, name, num_threads=0):
+    """
+    :param str name: for the stats
+    :param int num_threads: 0 means to load the sub-datasets one after another in the calling thread
+    """
+    self.name = name
+    self.num_threads = num_threads
+    self._executor = None
+    self.load_times = {}  # type: typing.Dict[str,float]  # dataset key -> time
+    self.load_counts = {}  # type: typing.Dict[str,int]  # dataset key -> num calls
+    self.total_time = 0.0
+
+  def _timed_call(self, dataset_key, func):
+    """
+    :param str dataset_key:
+    :param (()->None) func:
+    """
+    start_time = time.time()
+    func()
+    elapsed = time.time() - start_time
+    # Only one call per dataset key is running at the same time, so this is safe.
+    self.load_times[dataset_key] = self.load_times.get(dataset_key, 0.0) + elapsed
+    self.load_counts[dataset_key] = self.load_counts.get(dataset_key, 0) + 1
+
+  def run(self, calls):
+    """
+    :param list[(str,()->None)] calls: (dataset key, func), e.g. a ``load_seqs`` call. one per dataset key
+    """
+    start_time = time.time()
+    if self.num_threads > 0 and len(calls) > 1:
+      if not self._executor:
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=self.num_threads)
+      futures = [self._executor.submit(self._timed_call, dataset_key, func) for (dataset_key, func) in calls]
+      for future in futures:
+        future.result()  # wait, and reraise any exception
+    else:
+      for dataset_key, func in calls:
+        self._timed_call(dataset_key, func)
+    self.total_time += time.time() - start_time
+
+  def get_stats_str(self):
+    """
+    :rtype: str
+    """
+    parts = ["%s %.3fs in %i calls" % (key, self.load_times[key], self.load_counts[key])
+             for key in sorted(self.load_times.keys(), key=lambda k: -self.load_times[k])]
+    return "total %.3fs (%s), %s" % (
+      self.total_time, "%i threads" % self.num_threads if self.num_threads else "sequential",
+      ", ".join(parts) or "nothing loaded")
+
+  def reset_stats(self):
+    """
+    Resets the timing statistics.
+    """
+    self.load_times.clear()
+    self.load_counts.clear()
+    self.total_time = 0.0
+
+  def finish_epoch(self):
+    """
+    Logs the statistics of the epoch, resets them, and stops the threads.
+    """
+    if self.load_times:
+      print("%s: sub-dataset load times: %s" % (self.name, self.get_stats_str()), file=log.v3)
+    self.reset_stats()
+    if self._executor:
+      self._executor.shutdown(wait=True)
+      self._executor = None
+
+
 class MetaDataset(CachedDataset2):
   """
   The MetaDataset is to be used in the case of **Multimodality**.
@@ -173,6 +253,7 @@ class MetaDataset(CachedDataset2):
                seq_lens_file=None,
                data_dims=None,
                data_dtypes=None,
+               num_load_threads=0,
                window=1, **kwargs):
     """
     :param dict[str,dict[str]] datasets: dataset-key -> dataset-kwargs. including keyword 'class' and maybe 'files'
@@ -191,10 +272,14 @@ class MetaDataset(CachedDataset2):
     :param dict[str,(int,int)] data_dims: self-data-key -> data-dimension, len(shape) (1 ==> sparse repr).
        Deprecated/Only to double check. Read from data if not specified.
     :param dict[str,str] data_dtypes: self-data-key -> dtype. Read from data if not specified.
+    :param int num_load_threads: if >0, load the seqs of the sub-datasets in parallel, see :class:`SubDatasetLoader`
     """
     assert window == 1  # not implemented
     super(MetaDataset, self).__init__(**kwargs)
     assert self.shuffle_frames_of_nseqs == 0  # not implemented. anyway only for non-recurrent nets
+    # With prefetching, the sub-datasets are loaded by the prefetcher, which must do that in order.
+    assert not self.prefetch_num_seqs or self.prefetch_num_threads == 1, (
+      "%s: prefetching needs prefetch_num_threads=1" % self)
 
     self.data_map = data_map
     self.dataset_keys = set([m[0] for m in self.data_map.values()])  # type: typing.Set[str]
@@ -203,6 +288,7 @@ class MetaDataset(CachedDataset2):
     self.target_list = sorted(self.data_keys - {"data"})
     self.default_dataset_key = seq_order_control_dataset or self.data_map["data"][0]
     self.seq_order_control_dataset = seq_order_control_dataset
+    self.sub_dataset_loader = SubDatasetLoader(name=self.name, num_threads=num_load_threads)
 
     # This will only initialize datasets needed for features occuring in data_map
     self.datasets = {
@@ -374,16 +460,37 @@ class MetaDataset(CachedDataset2):
     This would get called at the end of the epoch.
     """
     super(MetaDataset, self).finish_epoch()
+    self.sub_dataset_loader.finish_epoch()
     for _, dataset in self.datasets.items():
       assert isinstance(dataset, Dataset)
       dataset.finish_epoch()
 
   def _load_seqs(self, start, end):
+    if not self.prefetch_num_seqs:  # otherwise in _prefetch_collect_single_seq
+      self._load_sub_dataset_seqs(start, end)
+    super(MetaDataset, self)._load_seqs(start=start, end=end)
+
+  def _load_sub_dataset_seqs(self, start, end):
+    """
+    :param int start:
+    :param int end:
+    """
+    self.sub_dataset_loader.run([
+      (dataset_key, functools.partial(self.datasets[dataset_key].load_seqs, start, end))
+      for dataset_key in sorted(self.dataset_keys)])
     for dataset_key in self.dataset_keys:
-      self.datasets[dataset_key].load_seqs(start, end)
       for seq_idx in range(start, end):
         self._check_dataset_seq(dataset_key, seq_idx)
-    super(MetaDataset, self)._load_seqs(start=start, end=end)
+
+  def _prefetch_collect_single_seq(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: DatasetSeq|None
+    """
+    if seq_idx >= self.num_seqs:
+      return None
+    self._load_sub_dataset_seqs(seq_idx, seq_idx + 1)
+    return self._collect_single_seq(seq_idx)
 
   def _check_dataset_seq(self, dataset_key, seq_idx):
     """
@@ -475,7 +582,8 @@ class ClusteringDataset(CachedDataset2):
     :param int n_clusters:
     :param single_cluster:
     """
-    super(CachedDataset2, self).__init__(**kwargs)
+    super(ClusteringDataset, self).__init__(**kwargs)
+    assert not self.prefetch_num_seqs, "%s: prefetching not supported, the seqs are loaded in _load_seqs" % self
     self.dataset = init_dataset(dataset)
     self.n_clusters = n_clusters
     self.single_cluster = single_cluster
@@ -625,6 +733,7 @@ class ConcatDataset(CachedDataset2):
     :param list[dict[str]] datasets: list of kwargs for init_dataset
     """
     super(ConcatDataset, self).__init__(**kwargs)
+    assert not self.prefetch_num_seqs, "%s: prefetching not supported, the seqs are loaded in _load_seqs" % self
     self.datasets = [init_dataset(d_kwargs) for d_kwargs in datasets]
     assert self.datasets
     self.num_inputs = self.datasets[0].num_inputs
@@ -790,6 +899,7 @@ class CombinedDataset(CachedDataset2):
                data_map,
                data_dims=None,
                data_dtypes=None,
+               num_load_threads=0,
                window=1, **kwargs):
     """
     :param dict[str,dict[str]] datasets: dataset-key -> dataset-kwargs. including keyword 'class' and maybe 'files'
@@ -798,12 +908,15 @@ class CombinedDataset(CachedDataset2):
     :param dict[str,(int,int)] data_dims: self-data-key -> data-dimension, len(shape) (1 ==> sparse repr).
        Deprecated/Only to double check. Read from data if not specified.
     :param dict[str,str] data_dtypes: self-data-key -> dtype. Read from data if not specified.
+    :param int num_load_threads: if >0, load the seqs of the sub-datasets in parallel, see :class:`SubDatasetLoader`
     """
     assert window == 1  # not implemented
     super(CombinedDataset, self).__init__(**kwargs)
     assert self.shuffle_frames_of_nseqs == 0  # not implemented. anyway only for non-recurrent nets
+    assert not self.prefetch_num_seqs, "%s: prefetching not supported, the seqs are loaded in _load_seqs" % self
 
     self.rnd = Random(self.epoch)
+    self.sub_dataset_loader = SubDatasetLoader(name=self.name, num_threads=num_load_threads)
     self.dataset_keys = set([m[0] for m in data_map.keys()])  # type: typing.Set[str]
     self.dataset_idx2key_map = dict(enumerate(sorted(self.dataset_keys)))  # idx -> dataset-key
     self.data_keys = set(data_map.values())  # type: typing.Set[str]
@@ -952,13 +1065,15 @@ class CombinedDataset(CachedDataset2):
 
     requested_seqs = self.dataset_sorted_seq_idx_list[start:end]
 
+    calls = []
     for dataset_idx in range(len(self.datasets)):
-      dataset = self.datasets[self.dataset_idx2key_map[dataset_idx]]
+      dataset_key = self.dataset_idx2key_map[dataset_idx]
       sub_requested_seqs = [s[1] for s in requested_seqs if s[0] == dataset_idx]
       if not sub_requested_seqs:
         continue
       sub_start, sub_end = min(sub_requested_seqs), max(sub_requested_seqs)
-      dataset.load_seqs(sub_start, sub_end + 1)
+      calls.append((dataset_key, functools.partial(self.datasets[dataset_key].load_seqs, sub_start, sub_end + 1)))
+    self.sub_dataset_loader.run(calls)
     super(CombinedDataset, self)._load_seqs(start=start, end=end)
 
   def _get_data(self, dataset_key, dataset_seq_idx, data_key):
@@ -1001,6 +1116,13 @@ class CombinedDataset(CachedDataset2):
     else:
       return self._expand_dataset_sec_idxs(n - len(self.dataset_sorted_seq_idx_list) + 1)
 
+  def finish_epoch(self):
+    """
+    Logs the sub-dataset load times of the epoch.
+    """
+    super(CombinedDataset, self).finish_epoch()
+    self.sub_dataset_loader.finish_epoch()
+
   def get_target_list(self):
     """
     :rtype: list[str]
@@ -1215,6 +1337,7 @@ class ChunkShuffleDataset(CachedDataset2):
     :param dict[str] dataset: kwargs for init_dataset
     """
     super(ChunkShuffleDataset, self).__init__(**kwargs)
+    assert not self.prefetch_num_seqs, "%s: prefetching not supported, the seqs are collected in _load_seqs" % self
     self.dataset = init_dataset(dataset)
     assert self.dataset
     self.dataset_last_load_seq_end = None
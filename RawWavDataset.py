@@ -21,6 +21,9 @@ class RawWavDataset(CachedDataset2):
   wav files.
   """
 
+  # get_seq_len in init_seq_order uses the current seq order, thus the lens cannot be cached.
+  _seq_order_seq_lens_static = False
+
   # Need to keep names as-is for compatibility.
   # noinspection PyPep8Naming
   def __init__(self, listFile, frameLength, frameShift, num_outputs=None, **kwargs):
@@ -12,10 +12,17 @@ import sys
 import os
 import typing
 import array
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from
 import numpy
 import zlib
 import mmap
+import threading
+try:
+  # noinspection PyCompatibility
+  from collections.abc import Mapping
+except ImportError:  # Python 2
+  # noinspection PyUnresolvedReferences,PyCompatibility
+  from collections import Mapping
 
 
 class FileInfo:
@@ -44,6 +51,9 @@ class FileInfo:
 class FileArchive:
   """
   File archive.
+
+  Reading an entry (:func:`read`, :func:`read_features`, :func:`read_alignment`) does not use any shared cursor
+  (mmap slices or positional reads), thus it can be done from multiple threads at the same time.
   """
 
   # read routines
@@ -173,20 +183,33 @@ class FileArchive:
   start_recovery_tag = 0xaa55aa55
   end_recovery_tag = 0x55aa55aa
 
-  def __init__(self, filename, must_exists=True):
+  def __init__(self, filename, must_exists=True, file_info_table=None):
+    """
+    :param str filename:
+    :param bool must_exists:
+    :param dict[str,FileInfo]|None file_info_table: if given (e.g. from the index of :class:`FileArchiveBundle`),
+      we will not read it from the file
+    """
 
+    self.filename = filename
     self.ft = {}  # type: typing.Dict[str,FileInfo]
+    self._mmap = None  # type: typing.Optional[mmap.mmap]  # whole file, for reading
+    self._pread_lock = threading.Lock()  # if os.pread is not available
     if os.path.exists(filename):
       self.allophones = []
       self.f = open(filename, 'rb')
       header = self.read_str(len(self.SprintCacheHeader))
-      assert header == self.SprintCacheHeader
+      assert header == self.SprintCacheHeader, "%r is not a Sprint cache" % filename
 
-      ft = bool(self.read_char())
-      if ft:
-        self.read_file_info_table()
+      if file_info_table is not None:
+        self.ft = file_info_table
       else:
-        self.scan_archive()
+        ft = bool(self.read_char())
+        if ft:
+          self.read_file_info_table()
+        else:
+          self.scan_archive()
+      self._mmap = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
 
     else:
       assert not must_exists, "File does not exist: %r" % filename
@@ -200,6 +223,15 @@ class FileArchive:
       self._short_seg_names.clear()
 
   def __del__(self):
+    self.close()
+
+  def close(self):
+    """
+    Closes the file. Also see :class:`FileArchiveBundle`, which will reopen it lazily.
+    """
+    if self._mmap is not None:
+      self._mmap.close()
+      self._mmap = None
     self.f.close()
 
   def file_list(self):
@@ -278,10 +310,12 @@ class FileArchive:
       # raise NotImplementedError("Need to scan archive if no "
       #                           "file info table found.")
 
-  def _raw_read(self, size, typ):
+  @staticmethod
+  def _decode(raw, typ, allophones=None):
     """
-    :param int|None size: needed for typ == "str"
+    :param bytes raw: (decompressed) content of the entry
     :param str typ: "str", "feat" or "align"
+    :param list[str]|None allophones: for "align"
     :return: depending on typ, "str" -> string, "feat" -> (time, data), "align" -> align,
       where string is a str,
       time is list of time-stamp tuples (start-time,end-time) in millisecs,
@@ -292,68 +326,19 @@ class FileArchive:
     """
 
     if typ == "str":
-      return self.read_str(size)
+      return raw.decode("ascii")
 
     elif typ == "feat":
-      type_len = self.read_U32()
-      typ = self.read_str(type_len)
-      # print(typ)
-      assert typ == "vector-f32"
-      count = self.read_U32()
-      data = [None] * count  # type: typing.List[typing.Optional[numpy.ndarray]]
-      time_ = [None] * count  # type: typing.List[typing.Optional[numpy.ndarray]]
-      for i in range(count):
-        size = self.read_U32()
-        data[i] = self.read_v("f", size)  # size x f32
-        time_[i] = self.read_v("d", 2)  # 2    x f64
-      return time_, data
+      times, data = decode_features(raw)
+      return list(times), list(data)
 
     elif typ in ["align", "align_raw"]:
-      type_len = self.read_U32()
-      typ = self.read_str(type_len)
-      assert typ == "flow-alignment"
-      self.read_u32()  # flag ?
-      typ = self.read_str(8)
-      if typ in ["ALIGNRLE", "AALPHRLE"]:
-        # In case of AALPHRLE, after the alignment, we include the alphabet of the used labels.
-        # We ignore this at the moment.
-        size = self.read_U32()
-        if size < (1 << 31):
-          # RLE scheme
-          time = 0
-          alignment = []
-          while len(alignment) < size:
-            n = self.read_char()
-            # print(n)
-            if n > 0:
-              while n > 0:
-                mix, state = self.read_u32(), None
-                if typ != "align_raw":
-                  mix, state = self.get_state(mix)
-                # print(mix, state)
-                # print(time, self.allophones[mix])
-                alignment.append((time, mix, state))
-                time += 1
-                n -= 1
-            elif n < 0:
-              mix, state = self.read_u32(), None
-              if typ != "align_raw":
-                mix, state = self.get_state(mix)
-              while n < 0:
-                # print(mix, state)
-                # print(time, self.allophones[mix])
-                alignment.append((time, mix, state))
-                time += 1
-                n += 1
-            else:
-              time = self.read_u32()
-              # print("time", time)
-          return alignment
-        else:
-          raise NotImplementedError("No support for weighted "
-                                    "alignments yet.")
-      else:
-        raise Exception("No valid alignment header found (found: %r). Wrong cache?" % typ)
+      # Note: "align_raw" also gets the (allophone, state) decoding of the mixture index, as it always was.
+      times, mixes, states = decode_alignment(raw, allophones=allophones)
+      return list(zip(times.tolist(), mixes.tolist(), states.tolist()))
+
+    else:
+      raise NotImplementedError("typ: %r" % typ)
 
   def has_entry(self, filename):
     """
@@ -373,38 +358,77 @@ class FileArchive:
       align is a list of (time, allophone, state), time is an int from 0 to len of align,
         allophone is some int, state is e.g. in [0,1,2].
     :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]
+
+    See :func:`read_features` and :func:`read_alignment` for a faster variant which returns numpy arrays.
     """
+    raw = self.read_bytes_of_entry(filename)
+    if raw is None:
+      return None
+    return self._decode(raw, typ=typ, allophones=self.allophones)
 
+  def read_bytes_of_entry(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :return: the (decompressed) content of the entry, or None if it is empty
+    :rtype: bytes|None
+    """
     if filename not in self.ft:
       if filename in self._short_seg_names:
         filename = self._short_seg_names[filename]
 
     fi = self.ft[filename]
-    self.f.seek(fi.pos)
-    size = self.read_U32()
-    comp = self.read_U32()
-    self.read_U32()  # chk
+    if self._mmap is not None:
+      size, comp, _ = unpack_from("III", self._mmap, fi.pos)  # size, comp, chk
+      pos = fi.pos + 12
+      if size == 0:
+        return None
+      if comp > 0:
+        return zlib.decompress(self._mmap[pos:pos + comp], 15 + 32)
+      return self._mmap[pos:pos + fi.size]
+    size, comp, _ = unpack("III", self._pread(12, fi.pos))  # size, comp, chk
     if size == 0:
       return None
-
     if comp > 0:
-      # read compressed bytes into memory as 'bytearray'
-      a = array.array('b')
-      a.fromfile(self.f, comp)
-      # unpack
-      b = zlib.decompress(a.tostring(), 15+32)
-      # substitute self.f by an anonymous memmap file object
-      # restore original file handle after we're done
-      backup_f = self.f
-      self.f = mmap.mmap(-1, len(b))
-      self.f.write(b)
-      self.f.seek(0)
-      try:
-        return self._raw_read(size=fi.size, typ=typ)
-      finally:
-        self.f = backup_f
+      return zlib.decompress(self._pread(comp, fi.pos + 12), 15 + 32)
+    return self._pread(fi.size, fi.pos + 12)
+
+  def _pread(self, size, pos):
+    """
+    Positional read, i.e. does not change the file position, if possible.
+
+    :param int size:
+    :param int pos:
+    :rtype: bytes
+    """
+    if hasattr(os, "pread"):
+      self.f.flush()
+      return os.pread(self.f.fileno(), size, pos)
+    with self._pread_lock:
+      self.f.seek(pos)
+      return self.f.read(size)
 
-    return self._raw_read(size=fi.size, typ=typ)
+  def read_features(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :return: (times, data), or None if empty. see :func:`decode_features`
+    :rtype: (numpy.ndarray,numpy.ndarray)|None
+    """
+    raw = self.read_bytes_of_entry(filename)
+    if raw is None:
+      return None
+    return decode_features(raw)
+
+  def read_alignment(self, filename, decode_state=True):
+    """
+    :param str filename: the entry-name in the archive
+    :param bool decode_state: if True, splits the mixture index into (allophone, state), see :func:`get_state`
+    :return: (times, mixes, states), or None if empty. see :func:`decode_alignment`
+    :rtype: (numpy.ndarray,numpy.ndarray,numpy.ndarray|None)|None
+    """
+    raw = self.read_bytes_of_entry(filename)
+    if raw is None:
+      return None
+    return decode_alignment(raw, allophones=self.allophones if decode_state else None)
 
   def get_state(self, mix):
     """
@@ -494,38 +518,195 @@ class FileArchive:
 class FileArchiveBundle:
   """
   File archive bundle.
+  The archives are opened lazily, and at most ``max_open_archives`` are kept open
+  (least recently used are released, and closed as soon as no other thread reads from them anymore).
+  Reading can be done from multiple threads at the same time, also see :func:`read_parallel`.
+  For a .bundle file, the combined file info table of all archives is stored in an index file next to it
+  (``<bundle>.index``, if writeable), such that later instances do not need to read all the archives.
   """
 
-  def __init__(self, filename=None):
+  IndexFormatVersion = 1
+
+  def __init__(self, filename=None, max_open_archives=100):
     """
     :param str|None filename: .bundle file
-    """
-    # filename -> FileArchive
-    self.archives = {}  # type: typing.Dict[str,FileArchive]
-    # archive content file -> FileArchive
-    self.files = {}  # type: typing.Dict[str,FileArchive]
+    :param int max_open_archives:
+    """
+    from collections import OrderedDict
+    self.max_open_archives = max_open_archives
+    # filename -> FileArchive, only the open ones, in LRU order
+    self.archives = OrderedDict()  # type: typing.Dict[str,FileArchive]
+    # filename -> file info table
+    self._archive_file_infos = {}  # type: typing.Dict[str,typing.Dict[str,FileInfo]]
+    # archive content file -> archive filename
+    self._file_archive_names = {}  # type: typing.Dict[str,str]
+    # archive content file -> FileArchive, opened on access
+    self.files = _FileArchiveBundleFiles(self)
+    # archive content file -> file info
+    self.ft = {}  # type: typing.Dict[str,FileInfo]
     self._short_seg_names = {}
+    self._allophones_filename = None  # type: typing.Optional[str]
+    self._lock = threading.RLock()  # for the open archives
     if filename is not None:
       self.add_bundle(filename=filename)
 
+  def close(self):
+    """
+    Closes all open archives. They will be reopened when needed.
+    This must not be called while other threads are reading.
+    """
+    with self._lock:
+      while self.archives:
+        _, archive = self.archives.popitem()
+        archive.close()
+
+  @staticmethod
+  def _get_index_filename(filename):
+    """
+    :param str filename: bundle
+    :rtype: str
+    """
+    return "%s.index" % filename
+
+  def _load_index(self, filename):
+    """
+    :param str filename: bundle
+    :return: list of (archive filename, (mtime, size), file info table), or None if there is no valid index
+    :rtype: list[(str,(float,int),dict[str,FileInfo])]|None
+    """
+    import pickle
+    index_filename = self._get_index_filename(filename)
+    if not os.path.exists(index_filename):
+      return None
+    bundle_stat = os.stat(filename)
+    # noinspection PyBroadException
+    try:
+      with open(index_filename, "rb") as f:
+        index = pickle.load(f)
+    except Exception as exc:
+      print("FileArchiveBundle: cannot load index %r: %s" % (index_filename, exc), file=sys.stderr)
+      return None
+    if index.get("version") != self.IndexFormatVersion:
+      return None
+    if index["bundle_stat"] != (bundle_stat.st_mtime, bundle_stat.st_size):
+      return None
+    for archive_filename, archive_stat, _ in index["archives"]:
+      if not os.path.exists(archive_filename) or archive_stat != self._get_file_stat(archive_filename):
+        # Archive was changed after the index was written. Entries might have been added or removed.
+        print("FileArchiveBundle: archive %r changed, index %r is outdated" % (archive_filename, index_filename),
+              file=sys.stderr)
+        return None
+    return [
+      (archive_filename, archive_stat, {name: FileInfo(name, *info) for (name, info) in entries.items()})
+      for (archive_filename, archive_stat, entries) in index["archives"]]
+
+  @staticmethod
+  def _get_file_stat(filename):
+    """
+    :param str filename:
+    :return: (mtime, size)
+    :rtype: (float,int)
+    """
+    stat = os.stat(filename)
+    return stat.st_mtime, stat.st_size
+
+  def _save_index(self, filename, archive_filenames):
+    """
+    :param str filename: bundle
+    :param list[str] archive_filenames:
+    """
+    import pickle
+    index_filename = self._get_index_filename(filename)
+    bundle_stat = os.stat(filename)
+    index = {
+      "version": self.IndexFormatVersion,
+      "bundle_stat": (bundle_stat.st_mtime, bundle_stat.st_size),
+      "archives": [
+        (archive_filename, self._get_file_stat(archive_filename), {
+          name: (fi.pos, fi.size, fi.compressed, fi.index)
+          for (name, fi) in self._archive_file_infos[archive_filename].items()})
+        for archive_filename in archive_filenames]}
+    tmp_filename = "%s.%i.tmp" % (index_filename, os.getpid())
+    try:
+      with open(tmp_filename, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+      os.rename(tmp_filename, index_filename)
+    except (IOError, OSError) as exc:  # e.g. not writeable. just ignore
+      print("FileArchiveBundle: cannot write index %r: %s" % (index_filename, exc), file=sys.stderr)
+
   def add_bundle(self, filename):
     """
     :param str filename: bundle
     """
-    for line in open(filename).read().splitlines():
+    index = self._load_index(filename)
+    if index is not None:
+      for archive_filename, _, file_info_table in index:
+        self._add_file_info_table(archive_filename, file_info_table)
+      return
+    archive_filenames = open(filename).read().splitlines()
+    for line in archive_filenames:
       self.add_archive(filename=line)
+    self._save_index(filename, archive_filenames)
+
+  def _add_file_info_table(self, filename, file_info_table):
+    """
+    :param str filename: single archive
+    :param dict[str,FileInfo] file_info_table:
+    """
+    self._archive_file_infos[filename] = file_info_table
+    for f, fi in file_info_table.items():
+      self._file_archive_names[f] = filename
+      self.ft[f] = fi
+    # See FileArchive.
+    short_seg_names = {os.path.basename(n): n for n in file_info_table.keys()}
+    if len(short_seg_names) == len(file_info_table):
+      self._short_seg_names.update(short_seg_names)
+
+  def _get_archive(self, filename):
+    """
+    :param str filename: single archive
+    :return: opened archive
+    :rtype: FileArchive
+    """
+    with self._lock:
+      return self._get_archive_locked(filename)
+
+  def _get_archive_locked(self, filename):
+    """
+    :param str filename: single archive
+    :rtype: FileArchive
+    """
+    archive = self.archives.get(filename)
+    if archive is not None:
+      self.archives[filename] = self.archives.pop(filename)  # most recently used. move_to_end is PY3 only
+      return archive
+    archive = FileArchive(filename, must_exists=True, file_info_table=self._archive_file_infos[filename])
+    if self._allophones_filename:
+      archive.set_allophones(self._allophones_filename)
+    self._add_open_archive(archive)
+    return archive
+
+  def _add_open_archive(self, archive):
+    """
+    :param FileArchive archive:
+    """
+    self.archives[archive.filename] = archive
+    while len(self.archives) > self.max_open_archives:
+      # Not closed explicitly, as some other thread might still read from it. It will be closed via __del__.
+      self.archives.popitem(last=False)
 
   def add_archive(self, filename):
     """
     :param str filename: single archive
     """
-    if filename in self.archives:
-      return
-    self.archives[filename] = a = FileArchive(filename, must_exists=True)
-    for f in a.ft.keys():
-      self.files[f] = a
-    # noinspection PyProtectedMember
-    self._short_seg_names.update(a._short_seg_names)
+    with self._lock:
+      if filename in self._archive_file_infos:
+        return
+      archive = FileArchive(filename, must_exists=True)
+      if self._allophones_filename:
+        archive.set_allophones(self._allophones_filename)
+      self._add_file_info_table(filename, archive.ft)
+      self._add_open_archive(archive)
 
   def add_bundle_or_archive(self, filename):
     """
@@ -541,14 +722,14 @@ class FileArchiveBundle:
     :rtype: list[str]
     :returns: list of content-filenames (which can be used for self.read())
     """
-    return self.files.keys()
+    return self._file_archive_names.keys()
 
   def has_entry(self, filename):
     """
     :param str filename: argument for self.read()
     :return: True if we have this entry
     """
-    return filename in self.files
+    return filename in self._file_archive_names
 
   def read(self, filename, typ):
     """
@@ -564,19 +745,216 @@ class FileArchiveBundle:
 
     Uses FileArchive.read().
     """
-    if filename not in self.files:
+    if filename not in self._file_archive_names:
       if filename in self._short_seg_names:
         filename = self._short_seg_names[filename]
-    return self.files[filename].read(filename, typ)
+    return self._get_archive(self._file_archive_names[filename]).read(filename, typ)
+
+  def read_features(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :return: (times, data), or None if empty. see :func:`FileArchive.read_features`
+    :rtype: (numpy.ndarray,numpy.ndarray)|None
+    """
+    if filename not in self._file_archive_names:
+      if filename in self._short_seg_names:
+        filename = self._short_seg_names[filename]
+    return self._get_archive(self._file_archive_names[filename]).read_features(filename)
+
+  def read_alignment(self, filename, decode_state=True):
+    """
+    :param str filename: the entry-name in the archive
+    :param bool decode_state:
+    :return: (times, mixes, states), or None if empty. see :func:`FileArchive.read_alignment`
+    :rtype: (numpy.ndarray,numpy.ndarray,numpy.ndarray|None)|None
+    """
+    if filename not in self._file_archive_names:
+      if filename in self._short_seg_names:
+        filename = self._short_seg_names[filename]
+    return self._get_archive(self._file_archive_names[filename]).read_alignment(filename, decode_state=decode_state)
 
   def set_allophones(self, filename):
     """
     :param str filename: allophone filename
     """
+    self._allophones_filename = filename
     for a in self.archives.values():
       a.set_allophones(filename)
 
 
+class _FileArchiveBundleFiles(Mapping):
+  """
+  Archive content file -> :class:`FileArchive`, for :class:`FileArchiveBundle`.
+  The archives are opened on access.
+  """
+
+  def __init__(self, bundle):
+    """
+    :param FileArchiveBundle bundle:
+    """
+    self._bundle = bundle
+
+  def __getitem__(self, filename):
+    """
+    :param str filename: archive content file
+    :rtype: FileArchive
+    """
+    # noinspection PyProtectedMember
+    return self._bundle._get_archive(self._bundle._file_archive_names[filename])
+
+  def __contains__(self, filename):
+    # noinspection PyProtectedMember
+    return filename in self._bundle._file_archive_names
+
+  def __iter__(self):
+    # noinspection PyProtectedMember
+    return iter(self._bundle._file_archive_names)
+
+  def __len__(self):
+    # noinspection PyProtectedMember
+    return len(self._bundle._file_archive_names)
+
+
+def read_parallel(archive, filenames, read_func=None, num_threads=4):
+  """
+  Reads multiple entries with a thread pool. zlib decompression and most of the decoding releases the GIL.
+
+  :param FileArchive|FileArchiveBundle archive:
+  :param list[str] filenames: entry-names in the archive
+  :param ((str)->T)|None read_func: e.g. ``archive.read_features`` (default)
+  :param int num_threads:
+  :return: for each filename, the result of ``read_func``, in the same order
+  :rtype: list[T]
+  """
+  from concurrent.futures import ThreadPoolExecutor
+  if read_func is None:
+    read_func = archive.read_features
+  with ThreadPoolExecutor(max_workers=num_threads) as executor:
+    return list(executor.map(read_func, filenames))
+
+
+def _read_buffer_str(buf, pos, length):
+  """
+  :param bytes buf:
+  :param int pos:
+  :param int length:
+  :rtype: str
+  """
+  return buf[pos:pos + length].decode("ascii")
+
+
+def decode_features(buf):
+  """
+  Decodes the content of a feature entry (``vector-f32``) of a Sprint cache.
+  If all frames have the same dimension (the usual case), this is a single :func:`numpy.frombuffer`.
+
+  :param bytes buf: (decompressed) content of the entry
+  :return: (times, data), times of shape (time,2) float64 with (start-time,end-time), data of shape (time,dim) float32.
+    If the frames have different dimensions, data is a list of float32 vectors instead.
+  :rtype: (numpy.ndarray,numpy.ndarray|list[numpy.ndarray])
+  """
+  pos = 0
+  type_len, = unpack("I", buf[pos:pos + 4])
+  pos += 4
+  typ = _read_buffer_str(buf, pos, type_len)
+  pos += type_len
+  assert typ == "vector-f32"
+  count, = unpack("I", buf[pos:pos + 4])
+  pos += 4
+  if count == 0:
+    return numpy.zeros((0, 2), dtype="float64"), numpy.zeros((0, 0), dtype="float32")
+  dim, = unpack("I", buf[pos:pos + 4])
+  frame_dtype = numpy.dtype([("size", "=u4"), ("data", "=f4", (dim,)), ("time", "=f8", (2,))])
+  assert frame_dtype.itemsize == 4 + 4 * dim + 16  # packed, no alignment
+  if len(buf) >= pos + count * frame_dtype.itemsize:
+    frames = numpy.frombuffer(buf, dtype=frame_dtype, count=count, offset=pos)
+    if numpy.all(frames["size"] == dim):
+      return numpy.array(frames["time"], dtype="float64"), numpy.array(frames["data"], dtype="float32")
+  # Variable dimension (unusual). Decode frame by frame.
+  times = numpy.zeros((count, 2), dtype="float64")
+  data = []
+  for i in range(count):
+    size, = unpack("I", buf[pos:pos + 4])
+    pos += 4
+    data.append(numpy.frombuffer(buf, dtype="float32", count=size, offset=pos))
+    pos += size * 4
+    times[i] = numpy.frombuffer(buf, dtype="float64", count=2, offset=pos)
+    pos += 16
+  return times, data
+
+
+def decode_alignment(buf, allophones=None):
+  """
+  Decodes the content of an alignment entry (``flow-alignment`` with ``ALIGNRLE`` or ``AALPHRLE``) of a Sprint cache.
+  The run-length encoded records are parsed in Python, the expansion to frames is done via numpy.
+
+  :param bytes buf: (decompressed) content of the entry
+  :param list[str]|None allophones: if given, splits the mixture index into (allophone, state),
+    see :func:`FileArchive.get_state`
+  :return: (times, mixes, states), each int32 of shape (time,). states is None if no allophones are given
+  :rtype: (numpy.ndarray,numpy.ndarray,numpy.ndarray|None)
+  """
+  pos = 0
+  type_len, = unpack("I", buf[pos:pos + 4])
+  pos += 4
+  typ = _read_buffer_str(buf, pos, type_len)
+  pos += type_len
+  assert typ == "flow-alignment"
+  pos += 4  # flag ?
+  typ = _read_buffer_str(buf, pos, 8)
+  pos += 8
+  if typ not in ["ALIGNRLE", "AALPHRLE"]:
+    raise Exception("No valid alignment header found (found: %r). Wrong cache?" % typ)
+  # In case of AALPHRLE, after the alignment, we include the alphabet of the used labels.
+  # We ignore this at the moment.
+  size, = unpack("I", buf[pos:pos + 4])
+  pos += 4
+  if size >= (1 << 31):
+    raise NotImplementedError("No support for weighted alignments yet.")
+  values = []  # type: typing.List[numpy.ndarray]  # for each record
+  repeats = []  # type: typing.List[int]  # for each record, how often each value is repeated
+  start_times = []  # type: typing.List[typing.Tuple[int,int]]  # (frame idx, time)
+  num_frames = 0
+  while num_frames < size:
+    n, = unpack("b", buf[pos:pos + 1])
+    pos += 1
+    if n > 0:
+      values.append(numpy.frombuffer(buf, dtype="int32", count=n, offset=pos))
+      repeats.append(1)
+      pos += 4 * n
+      num_frames += n
+    elif n < 0:
+      values.append(numpy.frombuffer(buf, dtype="int32", count=1, offset=pos))
+      repeats.append(-n)
+      pos += 4
+      num_frames += -n
+    else:
+      time, = unpack("i", buf[pos:pos + 4])
+      pos += 4
+      start_times.append((num_frames, time))
+  if values:
+    mixes = numpy.repeat(
+      numpy.concatenate(values), numpy.repeat(repeats, [len(v) for v in values])).astype("int64")
+  else:
+    mixes = numpy.zeros((0,), dtype="int64")
+  # By default, the time is the frame index. Each explicit time record restarts the counting from there.
+  times = numpy.arange(num_frames, dtype="int64")
+  for frame_idx, time in start_times:
+    times[frame_idx:] = numpy.arange(time, time + num_frames - frame_idx)
+  states = None
+  if allophones is not None:
+    # See :func:`FileArchive.get_state`.
+    assert allophones or not num_frames
+    max_states = 6
+    num_allophones = len(allophones)
+    num_sub = numpy.where(mixes >= num_allophones, (mixes - num_allophones) // (1 << 26) + 1, 0)
+    num_sub = numpy.minimum(num_sub, max_states)
+    mixes = mixes - num_sub * (1 << 26)
+    states = numpy.minimum(num_sub, max_states - 1).astype("int32")
+    assert numpy.all(mixes >= 0)
+  return times.astype("int32"), mixes.astype("int32"), states
+
+
 def open_file_archive(archive_filename, must_exists=True):
   """
   :param str archive_filename:
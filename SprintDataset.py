@@ -1045,7 +1045,7 @@ class SprintCacheDataset(CachedDataset2):
       """
       assert self.type == "feat"
       assert self.content_keys
-      times, feats = self.sprint_cache.read(self.content_keys[0], "feat")
+      times, feats = self.sprint_cache.read_features(self.content_keys[0])
       assert len(times) == len(feats) > 0
       feat = feats[0]
       assert isinstance(feat, numpy.ndarray)
@@ -1058,30 +1058,39 @@ class SprintCacheDataset(CachedDataset2):
       :return: numpy array of shape (time, [num_labels])
       :rtype: numpy.ndarray
       """
-      res = self.sprint_cache.read(name, typ=self.type)
       if self.type == "align":
-        label_seq = numpy.array([self.allophone_labeling.get_label_idx(a, s) for (t, a, s) in res], dtype=self.dtype)
-        assert label_seq.shape == (len(res),)
+        times, allos, states = self.sprint_cache.read_alignment(name)
+        label_seq = numpy.array(
+          [self.allophone_labeling.get_label_idx(a, s) for (a, s) in zip(allos.tolist(), states.tolist())],
+          dtype=self.dtype)
+        assert label_seq.shape == (len(times),)
         return label_seq
       elif self.type == "align_raw":
-        label_seq = numpy.array(
-          [self.allophone_labeling.state_tying_by_allo_state_idx[a] for (t, a, s) in res], dtype=self.dtype)
-        assert label_seq.shape == (len(res),)
+        times, allos, _ = self.sprint_cache.read_alignment(name)
+        state_tying = self.allophone_labeling.state_tying_by_allo_state_idx
+        label_seq = numpy.array([state_tying[a] for a in allos.tolist()], dtype=self.dtype)
+        assert label_seq.shape == (len(times),)
         return label_seq
       elif self.type == "feat":
-        times, feats = res
+        times, feats = self.sprint_cache.read_features(name)
         assert len(times) == len(feats) > 0
-        feat_mat = numpy.array(feats, dtype=self.dtype)
+        feat_mat = numpy.asarray(feats, dtype=self.dtype)
         assert feat_mat.shape == (len(times), self.num_labels)
         return feat_mat
       else:
         assert False
 
-  def __init__(self, data, **kwargs):
+  def __init__(self, data, num_read_threads=0, read_look_ahead=None, **kwargs):
     """
     :param dict[str,dict[str]] data: data-key -> dict which keys such as filename, see SprintCacheReader constructor
+    :param int num_read_threads: if > 0, reads (and decompresses) the next seqs in epoch order in a thread pool
+    :param int|None read_look_ahead: number of seqs to read in advance. by default 2 * num_read_threads
     """
     super(SprintCacheDataset, self).__init__(**kwargs)
+    self._num_read_threads = num_read_threads
+    self._read_executor = None  # created on demand, stopped in finish_epoch
+    self._read_look_ahead = read_look_ahead or 2 * num_read_threads
+    self._read_futures = {}  # type: typing.Dict[int,typing.Any]  # seq idx -> Future of DatasetSeq
     self.data = {key: self.SprintCacheReader(data_key=key, **opts) for (key, opts) in data.items()}
     self.seq_list_original = self.data["data"].content_keys
     self.seq_list_ordered = self.seq_list_original
@@ -1115,6 +1124,7 @@ class SprintCacheDataset(CachedDataset2):
     assert not seq_list
     need_reinit = self.epoch is None or self.epoch != epoch
     super(SprintCacheDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
+    self._cancel_read_futures()
     if not need_reinit:
       return False
     self._num_seqs = len(self.seq_list_original)
@@ -1148,9 +1158,35 @@ class SprintCacheDataset(CachedDataset2):
     """
     if seq_idx >= self.num_seqs:
       return None
+    if self._num_read_threads > 0:
+      if not self._read_executor:
+        from concurrent.futures import ThreadPoolExecutor
+        self._read_executor = ThreadPoolExecutor(max_workers=self._num_read_threads)
+      for old_seq_idx in [i for i in self._read_futures if i < seq_idx]:
+        self._read_futures.pop(old_seq_idx).cancel()  # not needed anymore
+      for next_seq_idx in range(seq_idx, min(seq_idx + self._read_look_ahead + 1, self.num_seqs)):
+        if next_seq_idx not in self._read_futures:
+          self._read_futures[next_seq_idx] = self._read_executor.submit(
+            self.get_dataset_seq_for_name, seq_idx=next_seq_idx, name=self.get_tag(next_seq_idx))
+      return self._read_futures.pop(seq_idx).result()
     seq_tag = self.get_tag(seq_idx)  # type: str
     return self.get_dataset_seq_for_name(seq_idx=seq_idx, name=seq_tag)
 
+  def _cancel_read_futures(self):
+    for future in self._read_futures.values():
+      future.cancel()
+    self._read_futures.clear()
+
+  def finish_epoch(self):
+    """
+    Cancels the pending reads and stops the read threads.
+    """
+    self._cancel_read_futures()
+    if self._read_executor:
+      self._read_executor.shutdown(wait=False)
+      self._read_executor = None
+    super(SprintCacheDataset, self).finish_epoch()
+
   def get_data_keys(self):
     """
     :rtype: list[str]
@@ -22,6 +22,9 @@ class StereoDataset(CachedDataset2):
   have an easy to use interface for using RETURNN as a regression tool
   """
 
+  # get_seq_len in init_seq_order uses the current seq order, thus the lens cannot be cached.
+  _seq_order_seq_lens_static = False
+
   def __init__(self, partition_epoch=1, **kwargs):
     """constructor"""
     super(StereoDataset, self).__init__(**kwargs)
@@ -133,6 +133,7 @@ It depends on whether the full network is recurrent or not.
 from __future__ import print_function
 
 import sys
+import time
 import typing
 try:
   # noinspection PyCompatibility
@@ -140,7 +141,7 @@ try:
 except ImportError:
   # noinspection PyCompatibility,PyUnresolvedReferences
   from queue import Queue
-from threading import Thread, Condition
+from threading import Thread, Condition, Lock
 
 import numpy
 import tensorflow as tf
@@ -148,7 +149,7 @@ from tensorflow.python.ops.data_flow_ops import StagingArea
 
 from Dataset import Dataset, BatchSetGenerator
 from TFNetwork import ExternData, Data
-from Util import NumbersDict
+from Util import NumbersDict, PhaseTimes
 from Log import log
 
 
@@ -866,6 +867,7 @@ class DataProviderBase(object):
     if data_keys is None:
       data_keys = extern_data.data.keys()
     self.data_keys = sorted(data_keys)  # type: typing.List[str]
+    self.wait_for_data_time = 0.0  # how long the consumer (i.e. the session.run loop) was blocked, waiting for data
 
   def start_threads(self):
     """
@@ -926,15 +928,169 @@ class DataProviderBase(object):
     raise NotImplementedError
 
 
+class SharedMemBatchBuffers(object):
+  """
+  Ring of preallocated shared memory buffers (slots), where each slot can hold one padded batch.
+  This is used by :class:`FeedDictDataProvider` with worker processes:
+  The worker process writes the padded batch arrays directly into a slot,
+  and only a small description of the arrays is sent back via the pipe.
+  The consumer then uses views on the slot memory, so there is no pickling and no copy of the data.
+
+  The slots are :class:`TaskSystem.SharedMem` instances.
+  They must be created before the worker processes are forked, which then inherit the mapping.
+  A slot is acquired before the batch is given to a worker, and released once the consumer
+  does not need the views anymore.
+  """
+
+  Alignment = 64  # bytes
+
+  def __init__(self, num_slots, slot_size):
+    """
+    :param int num_slots:
+    :param int slot_size: in bytes
+    """
+    import ctypes
+    from TaskSystem import SharedMem
+    assert num_slots > 0 and slot_size > 0
+    self.slot_size = slot_size
+    self.mems = [SharedMem(size=slot_size) for _ in range(num_slots)]
+    self.buffers = [
+      numpy.frombuffer((ctypes.c_char * slot_size).from_address(mem.ptr), dtype="uint8")
+      for mem in self.mems]
+    self.free_slots = Queue()
+    for i in range(num_slots):
+      self.free_slots.put(i)
+
+  def __repr__(self):
+    return "<%s num_slots=%i slot_size=%i>" % (self.__class__.__name__, len(self.mems), self.slot_size)
+
+  def init_child(self):
+    """
+    To be called in the forked child process.
+    The child must not remove the shared memory.
+    """
+    for mem in self.mems:
+      mem.is_creator = False
+
+  def remove(self):
+    """
+    Frees the shared memory. The slots cannot be used anymore after this.
+    """
+    self.buffers = []
+    for mem in self.mems:
+      mem.remove()
+    self.mems = []
+
+  def acquire_slot(self):
+    """
+    Blocks until there is some free slot.
+
+    :return: slot idx
+    :rtype: int
+    """
+    return self.free_slots.get()
+
+  def release_slot(self, slot_idx):
+    """
+    :param int slot_idx:
+    """
+    self.free_slots.put(slot_idx)
+
+  def make_alloc_func(self, slot_idx):
+    """
+    :param int slot_idx:
+    :return: function (shape, dtype) -> numpy.ndarray (zero-initialized view on the slot memory).
+      It raises :class:`MemoryError` if the slot is too small.
+    :rtype: ((tuple[int]|list[int],str)->numpy.ndarray)
+    """
+    buffer = self.buffers[slot_idx]
+    state = {"offset": 0}
+
+    def alloc(shape, dtype):
+      """
+      :param tuple[int]|list[int] shape:
+      :param str dtype:
+      :rtype: numpy.ndarray
+      """
+      dtype = numpy.dtype(dtype)
+      offset = state["offset"]
+      num_bytes = int(numpy.prod(shape)) * dtype.itemsize
+      if offset + num_bytes > self.slot_size:
+        raise MemoryError("%r: batch does not fit into slot, need at least %i bytes" % (self, offset + num_bytes))
+      state["offset"] = offset + num_bytes + (-num_bytes) % self.Alignment
+      array = buffer[offset:offset + num_bytes].view(dtype).reshape(shape)
+      array.fill(0)
+      return array
+
+    return alloc
+
+  def encode(self, slot_idx, data):
+    """
+    :param int slot_idx:
+    :param dict[str,numpy.ndarray|object] data: arrays were allocated via :func:`make_alloc_func`
+    :return: arrays in the slot are replaced by (offset, shape, dtype), which can be sent cheaply over a pipe
+    :rtype: dict[str,(int,tuple[int],str)|object]
+    """
+    buffer_start = self.buffers[slot_idx].__array_interface__["data"][0]
+    res = {}
+    for key, value in data.items():
+      if isinstance(value, numpy.ndarray) and value.base is not None:
+        offset = value.__array_interface__["data"][0] - buffer_start
+        if 0 <= offset < self.slot_size:
+          value = (offset, value.shape, value.dtype.str)
+      res[key] = value
+    return res
+
+  def decode(self, slot_idx, encoded_data):
+    """
+    :param int slot_idx:
+    :param dict[str,(int,tuple[int],str)|object] encoded_data: via :func:`encode`
+    :return: arrays are views on the slot memory
+    :rtype: dict[str,numpy.ndarray|object]
+    """
+    buffer = self.buffers[slot_idx]
+    res = {}
+    for key, value in encoded_data.items():
+      if isinstance(value, tuple):
+        offset, shape, dtype = value
+        dtype = numpy.dtype(dtype)
+        value = buffer[offset:offset + int(numpy.prod(shape)) * dtype.itemsize].view(dtype).reshape(shape)
+      res[key] = value
+    return res
+
+
 class FeedDictDataProvider(DataProviderBase):
   """
   This class will fill all the placeholders used for training or forwarding or evaluation etc.
   of a `TFNetwork.Network`.
   It will run a background thread which reads the data from a dataset and puts it into a queue.
+
+  Optionally (``num_workers > 0``), the batch assembly (allocating the padded arrays and copying each seq into them)
+  is distributed over a pool of workers.
+  The background thread still iterates over the :class:`BatchSetGenerator` and calls ``dataset.load_seqs``
+  in the original order (most datasets require monotonic loading, e.g. :class:`CachedDataset2`),
+  but the workers can build the batches out of order.
+  The batches are still given back in the original deterministic order.
+
+  With ``worker_type="thread"``, the raw seq data is fetched from the dataset in the background thread
+  and the workers only do the padding/copying, which overlaps with the loading of the next batches.
+  With ``worker_type="process"``, every worker is a forked process with its own copy of the dataset,
+  which does the ``load_seqs`` and ``get_data`` calls, i.e. the background thread does not load anything.
+  Every worker only loads its own batches (still in increasing order), i.e. it skips the seqs of the others.
+  This is useful for datasets where loading is expensive but the seq lengths are cheap and skipping seqs is cheap,
+  e.g. :class:`HDFDataset` with ``cache_byte_size=0``.
+  The workers are forked in :func:`start_threads`, i.e. after the TF session was created.
+  The TF runtime (its threads) is not usable in the forked child, thus the workers only use the dataset and Numpy.
+
+  With worker processes, the batches are by default pickled and sent back over a pipe.
+  With ``shared_mem_slot_size``, there is a ring of preallocated shared memory slots (:class:`SharedMemBatchBuffers`)
+  and the worker writes the padded arrays directly into it, so that the consumer gets them without any copy.
+  The arrays from :func:`get_feed_dict` are then only valid until the next call to :func:`get_feed_dict`
+  or :func:`stop_threads`.
   """
 
   def __init__(self, tf_session, dataset, batches, enforce_min_len1=False, capacity=10, tf_queue=None,
-               batch_slice=None, **kwargs):
+               batch_slice=None, num_workers=0, worker_type="thread", shared_mem_slot_size=None, **kwargs):
     """
     :param tf.Session|tf.InteractiveSession tf_session:
     :param Dataset dataset:
@@ -942,9 +1098,12 @@ class FeedDictDataProvider(DataProviderBase):
     :param bool enforce_min_len1:
     :param ExternData extern_data:
     :param set(str)|None data_keys:
-    :param int capacity:
+    :param int capacity: max number of batches which are prepared in advance
     :param TFDataQueues|None tf_queue:
     :param slice|None batch_slice: select a subset of the batches
+    :param int num_workers: number of batch assembly workers. 0 means that the background thread does everything
+    :param str worker_type: "thread" or "process"
+    :param int|None shared_mem_slot_size: in bytes. for worker_type "process", transfer the batches via shared memory
     """
     super(FeedDictDataProvider, self).__init__(**kwargs)
     self.tf_session = tf_session
@@ -955,17 +1114,62 @@ class FeedDictDataProvider(DataProviderBase):
     self.state_change_cond = Condition()
     self.queue = None  # type: typing.Optional[Queue]
     self.tf_queue = tf_queue
+    self.capacity = capacity
+    assert worker_type in ("thread", "process"), "%s: invalid worker_type %r" % (self, worker_type)
+    assert not (num_workers and tf_queue), "%s: num_workers not supported with tf_queue" % self
+    self.num_workers = num_workers
+    self.worker_type = worker_type
     if not self.tf_queue:
-      self.queue = Queue(maxsize=capacity)
+      # With workers, the number of batches in flight is limited via self._in_flight_cond instead.
+      self.queue = Queue(maxsize=0 if num_workers else capacity)
     self.thread = None  # type: typing.Optional[Thread]
     self.thread_finished = False
     self.cur_batch_idx = 0
     self.reached_end = False
+    self._in_flight_cond = Condition()
+    self._in_flight = 0  # batches which were dispatched to the workers but not yet consumed
+    self._task_queue = None  # type: typing.Optional[Queue]
+    self._worker_threads = []  # type: typing.List[Thread]
+    self._worker_procs = []  # type: typing.List[TaskSystem.AsyncTask]
+    self._reorder_buffer = {}  # type: typing.Dict[int,typing.Dict[str,typing.Any]]
+    self._reorder_next = 0
+    self._reorder_lock = Lock()
+    self._worker_error = False
+    self.worker_busy_time = 0.0  # summed up over all workers
+    # Time of the background thread and the workers, i.e. this overlaps with the session.run in the consumer.
+    self.phase_times = PhaseTimes(phases=["dataset_load", "batch_gather", "batch_assembly"])
+    if shared_mem_slot_size:
+      assert num_workers and worker_type == "process", "%s: shared_mem_slot_size needs worker processes" % self
+    self.shared_mem_slot_size = shared_mem_slot_size
+    self._shared_mem_buffers = None  # type: typing.Optional[SharedMemBatchBuffers]
+    self._shared_mem_cur_slot = None  # type: typing.Optional[int]  # slot of the batch which the consumer holds
+    self._shared_mem_fallback_count = 0  # batches which did not fit into a slot and were pickled instead
 
   def start_threads(self):
     """
-    Start the thread.
-    """
+    Start the thread (and the workers, if enabled).
+    """
+    if self.num_workers:
+      from TaskSystem import AsyncTask
+      self._task_queue = Queue()
+      if self.shared_mem_slot_size:
+        # In flight are at most `capacity` batches, and the consumer holds one more.
+        self._shared_mem_buffers = SharedMemBatchBuffers(
+          num_slots=self.capacity + 1, slot_size=self.shared_mem_slot_size)
+      for i in range(self.num_workers):
+        proc = None
+        if self.worker_type == "process":
+          # The child must not use TF, which we already have initialized. See the class docstring.
+          assert self.tf_session is not None, "%s: worker processes are forked after the TF session" % self
+          # Fork before we start any of our threads, so that the child does not inherit any locked state.
+          proc = AsyncTask(
+            func=self._worker_proc_main, name="%s DataProvider worker %i" % (self.dataset.name, i))
+          self._worker_procs.append(proc)
+        thread = Thread(target=self._worker_thread_main, args=(proc,), name="DataProvider worker %i" % i)
+        thread.daemon = True
+        self._worker_threads.append(thread)
+      for thread in self._worker_threads:
+        thread.start()
     thread = Thread(target=self._thread_main, name="DataProvider thread")
     thread.daemon = True  # Thread will close when parent quits.
     thread.start()
@@ -980,6 +1184,33 @@ class FeedDictDataProvider(DataProviderBase):
     self.coord.request_stop()
     self._flush_all_data()
     self.thread.join()
+    if self._shared_mem_buffers:
+      if self._shared_mem_fallback_count:
+        print("%s: %i batches did not fit into shared_mem_slot_size %i and were pickled instead" % (
+          self, self._shared_mem_fallback_count, self.shared_mem_slot_size), file=log.v3)
+      self._shared_mem_cur_slot = None
+      self._shared_mem_buffers.remove()
+      self._shared_mem_buffers = None
+
+  def _is_batch_in_slice(self, batch_idx):
+    """
+    :param int batch_idx:
+    :return: whether this batch is selected by self.batch_slice
+    :rtype: bool
+    """
+    if self.batch_slice is None:
+      return True
+    assert (self.batch_slice.start or 0) >= 0
+    start = self.batch_slice.start or 0
+    assert (self.batch_slice.step or 1) >= 1
+    step = self.batch_slice.step or 1
+    if batch_idx < start:
+      return False
+    if self.batch_slice.stop is not None and batch_idx >= self.batch_slice.stop:
+      return False
+    if step > 1 and (batch_idx - start) % step != 0:
+      return False
+    return True
 
   def get_next_batch(self, consider_batch_slice):
     """
@@ -989,69 +1220,104 @@ class FeedDictDataProvider(DataProviderBase):
     :returns: batch-data-value-dict or None. if not consider_batch_slice, will never be None
     :rtype: dict[str,numpy.ndarray]|None
     """
-    # See EngineUtil.assign_dev_data() for reference.
     cur_batch_idx = self.cur_batch_idx
     batch, = self.batches.peek_next_n(1)
     self.cur_batch_idx += 1
-    if consider_batch_slice and self.batch_slice is not None:
-      assert (self.batch_slice.start or 0) >= 0
-      start = self.batch_slice.start or 0
-      assert (self.batch_slice.step or 1) >= 1
-      step = self.batch_slice.step or 1
-      if cur_batch_idx < start:
-        return None
-      if self.batch_slice.stop is not None and cur_batch_idx >= self.batch_slice.stop:
-        return None
-      if step > 1 and (cur_batch_idx - start) % step != 0:
-        return None
+    if consider_batch_slice and not self._is_batch_in_slice(cur_batch_idx):
+      return None
+    return self._collect_batch_data(batch)
+
+  def _collect_batch_data(self, batch, alloc_func=numpy.zeros):
+    """
+    Loads the seqs of the batch and creates the padded batch data.
+
+    :param Batch batch:
+    :param ((tuple[int],str)->numpy.ndarray) alloc_func: (shape, dtype) -> zero-initialized array
+    :rtype: dict[str,numpy.ndarray|list[str]|list[int]]
+    """
+    # See EngineUtil.assign_dev_data() for reference.
+    with self.phase_times.timed("dataset_load"):
+      self.dataset.load_seqs(batch.start_seq, batch.end_seq)
+    with self.phase_times.timed("batch_assembly"):
+      return self._assemble_batch_data(batch, self._gather_batch_seqs(batch), alloc_func=alloc_func)
+
+  def _gather_batch_seqs(self, batch):
+    """
+    Gets the raw data of all seqs in the batch from the dataset.
+    This assumes that dataset.load_seqs() was called for the batch.
+    The returned arrays are still valid after the dataset has loaded further seqs.
+
+    :param Batch batch:
+    :return: for each seq in batch.seqs: (data-key -> raw data, seq tag)
+    :rtype: list[(dict[str,numpy.ndarray],str)]
+    """
+    res = []
+    columns = batch.get_parts_columns(self.data_keys)
+    with self.dataset.lock:
+      for i, seq_idx in enumerate(columns["seq_idx"]):
+        seq_data = {}
+        for k in self.data_keys:
+          # Some special cases first, such as "seq_idx" and "seq_tag".
+          # See also :func:`TFNetwork.get_extern_data`.
+          if k in ["seq_idx", "seq_tag"]:
+            continue  # handled below. will always be added
+          if k in self.extern_data.extra_added_keys:
+            continue
+          if self.extern_data.data[k].have_time_axis():
+            if columns["length", k][i] in [0, None]:
+              continue
+          seq_data[k] = self.dataset.get_data(seq_idx, k)
+        res.append((seq_data, self.dataset.get_tag(seq_idx)))
+    return res
+
+  def _assemble_batch_data(self, batch, seqs_data, alloc_func=numpy.zeros):
+    """
+    Creates the padded batch data. This does not access the dataset.
+
+    :param Batch batch:
+    :param list[(dict[str,numpy.ndarray],str)] seqs_data: from :func:`_gather_batch_seqs`
+    :param ((tuple[int],str)->numpy.ndarray) alloc_func: (shape, dtype) -> zero-initialized array
+    :rtype: dict[str,numpy.ndarray|list[str]|list[int]]
+    """
     from Dataset import Batch, shapes_for_batches
     assert isinstance(batch, Batch)
+    columns = batch.get_parts_columns(self.data_keys)
+    assert len(seqs_data) == len(columns["seq_idx"])
     # In Returnn with Theano, we usually have the shape (time,batch,feature).
     # In TensorFlow, the default is (batch,time,feature).
     # This is also what we use here, i.e. batch_dim_first=True.
     # This must match the Data specification in TFNetwork.ExternData.init_from_config().
     shapes = shapes_for_batches(
       [batch], data_keys=self.data_keys, extern_data=self.extern_data, enforce_min_len1=self.enforce_min_len1)
-    data = {k: numpy.zeros(shape=shapes[k], dtype=self.extern_data.data[k].dtype)
+    data = {k: alloc_func(shapes[k], self.extern_data.data[k].dtype)
             for k in self.data_keys if self.extern_data.data[k].dtype != "string"}
     # Numpy cannot handle "string" dtype. Just make it a list[str], which is what TF can handle.
     data.update({k: [""] * batch.num_slices
                  for k in self.data_keys if self.extern_data.data[k].dtype == "string"})
     data.update({"seq_idx": [-1] * batch.num_slices, "seq_tag": [""] * batch.num_slices})
-    seq_lens = {k: numpy.zeros(shape=(shapes[k][0],), dtype=self.extern_data.data[k].size_dtype)
+    seq_lens = {k: alloc_func((shapes[k][0],), self.extern_data.data[k].size_dtype)
                 for k in self.data_keys if self.extern_data.data[k].have_time_axis()}
-    self.dataset.load_seqs(batch.start_seq, batch.end_seq)
     from Util import slice_pad_zeros
-    with self.dataset.lock:
-      for seq in batch.seqs:
-        o = seq.batch_frame_offset
-        q = seq.batch_slice
-        length = seq.frame_length
-        # input-data, input-index will also be set in this loop. That is data-key "data".
-        for k in self.data_keys:
-          # Some special cases first, such as "seq_idx" and "seq_tag".
-          # See also :func:`TFNetwork.get_extern_data`.
-          if k in ["seq_idx", "seq_tag"]:
-            continue  # handled below. will always be added
-          if k in self.extern_data.extra_added_keys:
-            continue
-          if self.extern_data.data[k].have_time_axis():
-            if length.get(k) in [0, None]:
-              continue
-          v = self.dataset.get_data(seq.seq_idx, k)
-          if self.extern_data.data[k].have_time_axis():
-            v = slice_pad_zeros(v, begin=seq.seq_start_frame[k], end=seq.seq_end_frame[k])
-            ls = v.shape[0]
-            if ls != length[k]:
-              raise Exception("got shape[0]: %i, expected: %i, start/end: %r/%r, seq_idx: %i, seq len: %r" % (
-                ls, length[k], seq.seq_start_frame, seq.seq_end_frame, seq.seq_idx,
-                self.dataset.get_seq_length(seq.seq_idx)))
-            data[k][q, o[k]:o[k] + ls] = v
-            seq_lens[k][q] = max(seq_lens[k][q], o[k] + ls)
-          else:  # no time-axis
-            data[k][q] = v
-        data["seq_idx"][q] = seq.seq_idx
-        data["seq_tag"][q] = self.dataset.get_tag(seq.seq_idx)
+    for i, (seq_data, seq_tag) in enumerate(seqs_data):
+      seq_idx = columns["seq_idx"][i]
+      q = columns["batch_slice"][i]
+      # input-data, input-index will also be set in this loop. That is data-key "data".
+      for k, v in seq_data.items():
+        if self.extern_data.data[k].have_time_axis():
+          o = columns["offset", k][i]
+          full_len = v.shape[0]
+          v = slice_pad_zeros(v, begin=columns["start", k][i], end=columns["end", k][i])
+          ls = v.shape[0]
+          if ls != columns["length", k][i]:
+            seq = batch.seqs[i]
+            raise Exception("got shape[0]: %i, expected: %i, start/end: %r/%r, seq_idx: %i, seq len: %r" % (
+              ls, columns["length", k][i], seq.seq_start_frame, seq.seq_end_frame, seq_idx, full_len))
+          data[k][q, o:o + ls] = v
+          seq_lens[k][q] = max(seq_lens[k][q], o + ls)
+        else:  # no time-axis
+          data[k][q] = v
+      data["seq_idx"][q] = seq_idx
+      data["seq_tag"][q] = seq_tag
     for k in seq_lens.keys():
       data["%s_seq_lens" % k] = seq_lens[k]
     return data
@@ -1061,13 +1327,32 @@ class FeedDictDataProvider(DataProviderBase):
       import better_exchook
       better_exchook.install()
 
+      task_idx = 0
       while self.batches.has_more() and not self.coord.should_stop():
-        enqueue_args = self.get_next_batch(consider_batch_slice=True)
-        if enqueue_args is not None:
-          if self.queue:
-            self.queue.put(enqueue_args)
-          else:
-            self.tf_queue.enqueue(tf_session=self.tf_session, data=enqueue_args)
+        if self.num_workers:
+          batch, = self.batches.peek_next_n(1)
+          cur_batch_idx = self.cur_batch_idx
+          self.cur_batch_idx += 1
+          if self._is_batch_in_slice(cur_batch_idx):
+            if not self._wait_for_free_slot():
+              break
+            if self.worker_type == "thread":
+              # The loading must be in order. The workers do the rest.
+              with self.phase_times.timed("dataset_load"):
+                self.dataset.load_seqs(batch.start_seq, batch.end_seq)
+              with self.phase_times.timed("batch_gather"):
+                seqs_data = self._gather_batch_seqs(batch)
+            else:
+              seqs_data = None  # the worker process loads and gathers it from its own dataset copy
+            self._task_queue.put((task_idx, batch, seqs_data))
+            task_idx += 1
+        else:
+          enqueue_args = self.get_next_batch(consider_batch_slice=True)
+          if enqueue_args is not None:
+            if self.queue:
+              self.queue.put(enqueue_args)
+            else:
+              self.tf_queue.enqueue(tf_session=self.tf_session, data=enqueue_args)
         with self.state_change_cond:
           self.state_change_cond.notifyAll()
         self.batches.advance(1)
@@ -1079,10 +1364,159 @@ class FeedDictDataProvider(DataProviderBase):
       sys.excepthook(*sys.exc_info())
 
     finally:
+      if self.num_workers:
+        self._stop_workers()
+        if self._worker_error:
+          self.reached_end = False
       with self.state_change_cond:
         self.thread_finished = True
         self.state_change_cond.notifyAll()
 
+  def _wait_for_free_slot(self):
+    """
+    Waits until the number of batches in flight is below the capacity, and then reserves one.
+
+    :return: False if we should stop
+    :rtype: bool
+    """
+    with self._in_flight_cond:
+      while self._in_flight >= self.capacity:
+        if self.coord.should_stop() or self._worker_error:
+          return False
+        self._in_flight_cond.wait(0.1)
+      self._in_flight += 1
+    return True
+
+  def _release_slot(self):
+    with self._in_flight_cond:
+      self._in_flight -= 1
+      self._in_flight_cond.notifyAll()
+
+  def _stop_workers(self):
+    """
+    Waits until all the workers have handled all the pending tasks, and then stops them.
+    """
+    for _ in self._worker_threads:
+      self._task_queue.put(None)
+    for thread in self._worker_threads:
+      thread.join()
+    for proc in self._worker_procs:
+      proc.join()
+
+  def _worker_thread_main(self, proc=None):
+    """
+    :param TaskSystem.AsyncTask|None proc: if given, the batch will be assembled in this worker process
+    """
+    import better_exchook
+    better_exchook.install()
+    try:
+      while True:
+        task = self._task_queue.get()
+        if task is None:
+          break
+        task_idx, batch, seqs_data = task
+        if self._worker_error:
+          continue  # just consume the remaining tasks
+        start_time = time.time()
+        shared_mem_slot = None
+        try:
+          if proc:
+            if self._shared_mem_buffers:
+              shared_mem_slot = self._shared_mem_buffers.acquire_slot()
+            proc.put((batch, shared_mem_slot))
+            data, in_shared_mem, error_str = proc.get()
+            if error_str:
+              raise Exception("DataProvider worker process failed: %s" % error_str)
+            if in_shared_mem:
+              data = self._shared_mem_buffers.decode(shared_mem_slot, data)
+            elif shared_mem_slot is not None:
+              if not self._shared_mem_fallback_count:
+                print("%s: batch does not fit into shared_mem_slot_size %i, fallback to pickling" % (
+                  self, self.shared_mem_slot_size), file=log.v2)
+              self._shared_mem_fallback_count += 1
+              self._shared_mem_buffers.release_slot(shared_mem_slot)
+              shared_mem_slot = None
+          else:
+            data = self._assemble_batch_data(batch, seqs_data)
+        except Exception as exc:
+          print("Exception in DataProvider worker: %r" % exc, file=log.v1)
+          sys.excepthook(*sys.exc_info())
+          self._worker_error = True
+          self.coord.request_stop()
+          if shared_mem_slot is not None:
+            self._shared_mem_buffers.release_slot(shared_mem_slot)
+          continue
+        busy_time = time.time() - start_time
+        with self._reorder_lock:  # there are multiple workers
+          self.worker_busy_time += busy_time
+        self.phase_times.add("batch_assembly", busy_time)
+        self._add_to_reorder_buffer(task_idx, data, shared_mem_slot=shared_mem_slot)
+    finally:
+      if proc:
+        proc.put(None)
+
+  def _worker_proc_main(self, proc):
+    """
+    Main loop of a forked worker process. It has its own copy of the dataset.
+
+    :param TaskSystem.AsyncTask proc:
+    """
+    if self._shared_mem_buffers:
+      self._shared_mem_buffers.init_child()
+    while True:
+      task = proc.get()
+      if task is None:
+        break
+      batch, shared_mem_slot = task
+      # noinspection PyBroadException
+      try:
+        data = None
+        if shared_mem_slot is not None:
+          try:
+            data = self._collect_batch_data(
+              batch, alloc_func=self._shared_mem_buffers.make_alloc_func(shared_mem_slot))
+          except MemoryError:
+            pass  # does not fit. fallback to pickling
+        if data is not None:
+          data, in_shared_mem = self._shared_mem_buffers.encode(shared_mem_slot, data), True
+        else:
+          data, in_shared_mem = self._collect_batch_data(batch), False
+      except Exception:
+        import traceback
+        proc.put((None, False, "".join(traceback.format_exception(*sys.exc_info()))))
+      else:
+        proc.put((data, in_shared_mem, None))
+
+  def _add_to_reorder_buffer(self, task_idx, data, shared_mem_slot=None):
+    """
+    Puts the batches to self.queue in the original order.
+
+    :param int task_idx:
+    :param dict[str] data:
+    :param int|None shared_mem_slot: if the data are views on this shared memory slot
+    """
+    with self._reorder_lock:
+      self._reorder_buffer[task_idx] = (data, shared_mem_slot)
+      while self._reorder_next in self._reorder_buffer:
+        self.queue.put(self._reorder_buffer.pop(self._reorder_next))
+        self._reorder_next += 1
+    with self.state_change_cond:
+      self.state_change_cond.notifyAll()
+
+  def _get_from_queue(self):
+    """
+    :rtype: dict[str]
+    """
+    output = self.queue.get()
+    if self.num_workers:
+      self._release_slot()
+      output, shared_mem_slot = output
+      # The consumer is done with the previous batch, so its shared memory slot can be reused.
+      if self._shared_mem_cur_slot is not None:
+        self._shared_mem_buffers.release_slot(self._shared_mem_cur_slot)
+      self._shared_mem_cur_slot = shared_mem_slot
+    return output
+
   def have_more_data(self, session):
     """
     :param tf.Session|None session:
@@ -1091,19 +1525,23 @@ class FeedDictDataProvider(DataProviderBase):
     If this returns True, you can definitely read another item from the queue.
     Threading safety: This assumes that there is no other consumer thread for the queue.
     """
-    with self.state_change_cond:
-      while True:
-        # First check if there is still data in the queue to be processed.
-        if self.queue and not self.queue.empty():
-          return True
-        if self.tf_queue and self.tf_queue.have_more(self.tf_session):
-          return True
-        if self.thread_finished:
-          return False
-        if not self.thread.is_alive:
-          return False
-        # The thread is alive and working. Wait for a change.
-        self.state_change_cond.wait()
+    start_time = time.time()
+    try:
+      with self.state_change_cond:
+        while True:
+          # First check if there is still data in the queue to be processed.
+          if self.queue and not self.queue.empty():
+            return True
+          if self.tf_queue and self.tf_queue.have_more(self.tf_session):
+            return True
+          if self.thread_finished:
+            return False
+          if not self.thread.is_alive:
+            return False
+          # The thread is alive and working. Wait for a change.
+          self.state_change_cond.wait()
+    finally:
+      self.wait_for_data_time += time.time() - start_time
 
   def _flush_all_data(self):
     """
@@ -1112,7 +1550,7 @@ class FeedDictDataProvider(DataProviderBase):
     """
     while self.have_more_data(None):
       if self.queue:
-        self.queue.get()
+        self._get_from_queue()
       else:
         raise NotImplementedError
 
@@ -1134,7 +1572,9 @@ class FeedDictDataProvider(DataProviderBase):
       assert self.batch_slice is None
       output = self.get_next_batch(consider_batch_slice=False)
     else:
-      output = self.queue.get()
+      start_time = time.time()
+      output = self._get_from_queue()
+      self.wait_for_data_time += time.time() - start_time
     assert isinstance(output, dict)
     # The data itself.
     d = {
@@ -34,7 +34,7 @@ from Log import log
 from Pretrain import pretrain_from_config
 from TFNetwork import TFNetwork, help_on_tf_exception
 from TFUpdater import Updater
-from Util import hms, NumbersDict, BackendEngine
+from Util import hms, NumbersDict, BackendEngine, PhaseTimes
 from pprint import pprint
 
 
@@ -44,11 +44,114 @@ class CancelTrainingException(Exception):
   """
 
 
+class LayerProfiler(object):
+  """
+  Aggregates the op execution times and output memory of sampled ``session.run`` calls with FULL_TRACE,
+  grouped by the layers of the network (via the TF name scopes of the layers),
+  and prints a report of the top layers by time and by memory.
+  See the option ``profile_layers_mod_step``.
+  """
+
+  def __init__(self, network, mod_step, skip_steps=1, num_top=20):
+    """
+    :param TFNetwork network:
+    :param int mod_step: sample every Nth step
+    :param int skip_steps: the first steps are usually slow (e.g. cuDNN autotuning), so skip them
+    :param int num_top: number of layers in the report
+    """
+    from TFNetworkLayer import LayerBase
+    self.mod_step = mod_step
+    self.skip_steps = skip_steps
+    self.num_top = num_top
+    self.scope_to_layer = {}  # type: typing.Dict[str,str]  # TF scope name -> layer name
+    for net in [network] + list(network.extra_nets.values()):
+      for layer_name in net.layers.keys():
+        self.scope_to_layer[LayerBase.cls_get_tf_scope_name(layer_name)] = layer_name
+    self.num_samples = 0
+    self.time_micros = {}  # type: typing.Dict[str,typing.Dict[str,int]]  # layer -> kind -> micro secs
+    self.output_bytes = {}  # type: typing.Dict[str,int]  # layer -> bytes
+
+  def is_sample_step(self, step):
+    """
+    :param int step: of the epoch
+    :rtype: bool
+    """
+    return step >= self.skip_steps and (step - self.skip_steps) % self.mod_step == 0
+
+  def get_layer_and_kind(self, node_name):
+    """
+    :param str node_name: e.g. "lstm0_fw/rec/MatMul" or "optimize/gradients/lstm0_fw/rec/MatMul_grad/MatMul"
+    :return: layer name (or "(other)"), and kind ("forward", "backward" or "optimizer")
+    :rtype: (str, str)
+    """
+    import re
+    kind = "forward"
+    for part in node_name.split(":")[0].split("/"):
+      if re.match("^gradients(_[0-9]+)?$", part):
+        kind = "backward"
+        continue
+      if part.startswith("update_") and part[len("update_"):] in self.scope_to_layer:
+        return self.scope_to_layer[part[len("update_"):]], "optimizer"
+      if part in self.scope_to_layer:
+        return self.scope_to_layer[part], kind
+    return "(other)", kind
+
+  def add_run_metadata(self, run_metadata):
+    """
+    :param tf.RunMetadata run_metadata: from a session.run with FULL_TRACE
+    """
+    devices = set([dev_stats.device for dev_stats in run_metadata.step_stats.dev_stats])
+    for dev_stats in run_metadata.step_stats.dev_stats:
+      # For GPUs, the plain device has the host-side (kernel launch) times,
+      # and the real execution times are in "<device>/stream:all".
+      # The individual streams are covered by "stream:all", so we must not count them twice.
+      is_stream = "/stream:" in dev_stats.device or "/memcpy" in dev_stats.device
+      if is_stream:
+        count_time = dev_stats.device.endswith("/stream:all")
+      else:
+        count_time = dev_stats.device + "/stream:all" not in devices
+      for node_stats in dev_stats.node_stats:
+        layer, kind = self.get_layer_and_kind(node_stats.node_name)
+        if count_time:
+          layer_times = self.time_micros.setdefault(layer, {})
+          layer_times[kind] = layer_times.get(kind, 0) + node_stats.all_end_rel_micros
+        if not is_stream:
+          self.output_bytes[layer] = self.output_bytes.get(layer, 0) + sum(
+            [output.tensor_description.allocation_description.requested_bytes for output in node_stats.output])
+    self.num_samples += 1
+
+  def get_report_str(self):
+    """
+    :return: report of the top layers by time and by output memory, averaged over the samples
+    :rtype: str
+    """
+    from Util import human_bytes_size
+    if not self.num_samples:
+      return "no samples"
+    kinds = ["forward", "backward", "optimizer"]
+    total_time = float(sum([sum(times.values()) for times in self.time_micros.values()])) or 1.
+    lines = ["%i sampled steps, top layers by time (avg per step):" % self.num_samples]
+    layers = sorted(self.time_micros.keys(), key=lambda layer_: -sum(self.time_micros[layer_].values()))
+    for layer in layers[:self.num_top]:
+      times = self.time_micros[layer]
+      lines.append("  %-30s %10.3f ms %5.1f%% (%s)" % (
+        layer, sum(times.values()) / 1000. / self.num_samples, sum(times.values()) / total_time * 100.,
+        ", ".join(["%s %.3f ms" % (kind, times[kind] / 1000. / self.num_samples) for kind in kinds if kind in times])))
+    lines.append("top layers by output memory (avg per step):")
+    layers = sorted(self.output_bytes.keys(), key=lambda layer_: -self.output_bytes[layer_])
+    for layer in layers[:self.num_top]:
+      lines.append("  %-30s %s" % (layer, human_bytes_size(self.output_bytes[layer] // self.num_samples)))
+    return "\n".join(lines)
+
+
 class Runner(object):
   """
   This encapsulates the logic around TF ``session.run``, i.e. iterating over the dataset.
   """
 
+  # The phases of a single step, for the timing breakdown. See :class:`Util.PhaseTimes`.
+  StepPhases = ("wait_for_data", "feed_dict", "session_run", "horovod", "eval_info", "extra_fetches", "print")
+
   # noinspection PyShadowingBuiltins
   def __init__(self, engine, dataset, batches, train, eval=True, train_flag=None,
                extra_fetches=None, extra_fetches_callback=None):
@@ -80,6 +183,22 @@ class Runner(object):
     self._should_eval = eval
     self.store_metadata_mod_step = engine.config.int("store_metadata_mod_step", 0)
     self.reset_updater_vars_mod_step = engine.config.int("reset_updater_vars_mod_step", 0)
+    # If >0, the host-side handling of the step results (eval info, extra fetches, printing)
+    # is done in a separate thread, such that the next session.run can start right away.
+    self.result_queue_size = engine.config.int("runner_result_queue_size", 0)
+    self.result_queue_blocked_time = 0.0
+    self._result_queue = None
+    self._result_consumer_thread = None
+    self._result_consumer_exception = None  # type: typing.Optional[BaseException]
+    self.phase_times = PhaseTimes(phases=self.StepPhases)
+    self.phase_times_file = engine.config.value("runner_phase_times_file", None)
+    self.layer_profiler = None  # type: typing.Optional[LayerProfiler]
+    if engine.config.int("profile_layers_mod_step", 0) > 0:
+      self.layer_profiler = LayerProfiler(
+        network=engine.network,
+        mod_step=engine.config.int("profile_layers_mod_step", 0),
+        skip_steps=engine.config.int("profile_layers_skip_steps", 1),
+        num_top=engine.config.int("profile_layers_num_top", 20))
     self.finalized = False
     self.cancel_flag = False
     self.run_exception = None
@@ -191,6 +310,35 @@ class Runner(object):
       from Util import progress_bar
       progress_bar(complete, hms(remaining_estimated))
 
+  def _print_data_provider_stats(self, elapsed):
+    """
+    Prints how long we waited for input data, i.e. how long the device was idle because of the data pipeline,
+    and statistics about the batches, such as the padding.
+
+    :param float elapsed: total elapsed time of the run
+    """
+    wait_time = self.data_provider.wait_for_data_time
+    print("%s: waited %s for input data (%.1f%% of elapsed time)" % (
+      self.data_provider.get_dataset_name(), hms(wait_time), (wait_time / elapsed * 100.) if elapsed > 0 else 0.),
+      file=log.v4)
+    load_wait_time = getattr(self.data_provider.dataset, "load_wait_time", None)  # e.g. CachedDataset2
+    if load_wait_time is not None:
+      print("  dataset waited %s for seqs in load_seqs (%.1f%% of elapsed time)%s" % (
+        hms(load_wait_time), (load_wait_time / elapsed * 100.) if elapsed > 0 else 0.,
+        ", with prefetching" if getattr(self.data_provider.dataset, "prefetch_num_seqs", 0) else ""), file=log.v4)
+    batches = getattr(self.data_provider, "batches", None)  # type: typing.Optional[BatchSetGenerator]
+    if batches is not None:
+      print("  batches: %s" % batches.get_stats_str(), file=log.v4)
+    num_workers = getattr(self.data_provider, "num_workers", 0)
+    if num_workers and elapsed > 0:
+      print("  %i %s batch assembly workers, %.1f%% busy on average" % (
+        num_workers, self.data_provider.worker_type,
+        self.data_provider.worker_busy_time / (elapsed * num_workers) * 100.), file=log.v4)
+    phase_times = getattr(self.data_provider, "phase_times", None)  # type: typing.Optional[PhaseTimes]
+    if phase_times is not None and phase_times.total:
+      print("  data provider background time per phase (overlaps with the steps):\n%s" % (
+        phase_times.get_table_str(elapsed=elapsed, indent="    "),), file=log.v4)
+
   def _print_finish_process(self):
     if self._show_interactive_process_bar:
       from Util import progress_bar
@@ -373,6 +521,116 @@ class Runner(object):
         d[k] = list(r)
     self.extra_fetches_callback(**d)
 
+  def _handle_step_results(self, report_prefix, step, fetches_results, start_time, step_times, step_duration=None):
+    """
+    Host-side handling of the results of a single step.
+    Either called directly after session.run, or in the result consumer thread (see ``runner_result_queue_size``).
+
+    :param str report_prefix:
+    :param int step:
+    :param dict[str,numpy.ndarray|str] fetches_results: results of calculations, see self._get_fetches_dict()
+    :param float start_time: of the step
+    :param dict[str,float] step_times: phase -> secs. we add the phases of this function, see :class:`PhaseTimes`
+    :param float|None step_duration: if None, the time since start_time
+    """
+    phase_start_time = time.time()
+    eval_info = self._collect_eval_info(fetches_results=fetches_results)
+    step_times["eval_info"] = time.time() - phase_start_time
+    phase_start_time = time.time()
+    self._maybe_handle_extra_fetches(fetches_results)
+    step_times["extra_fetches"] = time.time() - phase_start_time
+    if step_duration is None:
+      step_duration = time.time() - start_time
+    phase_start_time = time.time()
+    self._print_process(report_prefix=report_prefix, step=step, step_duration=step_duration, eval_info=eval_info)
+    step_times["print"] = time.time() - phase_start_time
+    self.phase_times.add_step(
+      step_times, dataset=self.data_provider.get_dataset_name(), epoch=self.engine.epoch, step=step)
+
+    if self.engine.config.bool("stop_on_nonfinite_train_score", True):
+      score_values = self._results_accumulated.values()
+      if any(numpy.isinf(score_values)) or any(numpy.isnan(score_values)):
+        print("Model seems broken, got inf or nan score.", file=log.v1)
+        print("Accumulated scores:", self._results_accumulated, file=log.v1)
+        raise Exception("Inf/nan score in step %i." % step)
+
+  def _check_step_scores_finite(self, step, fetches_results):
+    """
+    With the result consumer thread, the accumulated scores are only checked with some delay.
+    Thus we check the scores of the current step directly, to stop right away.
+
+    :param int step:
+    :param dict[str,numpy.ndarray|str] fetches_results:
+    """
+    if not self.engine.config.bool("stop_on_nonfinite_train_score", True):
+      return
+    scores = {
+      k: v for (k, v) in fetches_results.items() if k.startswith("cost:") or k.startswith("error:") or k == "loss"}
+    if any([not numpy.all(numpy.isfinite(v)) for v in scores.values()]):
+      print("Model seems broken, got inf or nan score.", file=log.v1)
+      print("Step scores:", scores, file=log.v1)
+      raise Exception("Inf/nan score in step %i." % step)
+
+  def _start_result_consumer(self):
+    from threading import Thread
+    try:
+      # noinspection PyCompatibility
+      from Queue import Queue
+    except ImportError:
+      # noinspection PyCompatibility
+      from queue import Queue
+    self._result_consumer_exception = None
+    self._result_queue = Queue(maxsize=self.result_queue_size)
+    self._result_consumer_thread = Thread(target=self._result_consumer_thread_main, name="Runner result consumer")
+    self._result_consumer_thread.daemon = True
+    self._result_consumer_thread.start()
+
+  def _result_consumer_thread_main(self):
+    while True:
+      item = self._result_queue.get()
+      if item is None:
+        break
+      if self._result_consumer_exception:
+        continue  # skip everything after an error, the main thread will raise it
+      # noinspection PyBroadException
+      try:
+        self._handle_step_results(**item)
+      except BaseException as exc:
+        self._result_consumer_exception = exc
+
+  def _put_step_results(self, **kwargs):
+    """
+    Hands the step results over to the result consumer thread.
+    This blocks if the queue is full. Errors of the consumer are raised here.
+
+    :param kwargs: see :func:`_handle_step_results`
+    """
+    self._check_result_consumer_exception()
+    start_time = time.time()
+    self._result_queue.put(kwargs)
+    self.result_queue_blocked_time += time.time() - start_time
+
+  def _check_result_consumer_exception(self):
+    if self._result_consumer_exception:
+      exc = self._result_consumer_exception
+      self._result_consumer_exception = None
+      raise exc
+
+  def _stop_result_consumer(self):
+    """
+    Waits until all pending step results are handled, and stops the thread.
+    Errors of the consumer are raised here.
+    """
+    if not self._result_consumer_thread:
+      return
+    start_time = time.time()
+    self._result_queue.put(None)
+    self._result_consumer_thread.join()
+    self._result_consumer_thread = None
+    self._result_queue = None
+    self.result_queue_blocked_time += time.time() - start_time
+    self._check_result_consumer_exception()
+
   def _horovod_finish_data(self):
     self._horovod_signal_broadcast(have_more_data=False)
 
@@ -517,6 +775,10 @@ class Runner(object):
     feed_dict = None
     meta_step_info = None
     try:
+      if self.phase_times_file:
+        self.phase_times.open_steps_file(self.phase_times_file, step_info_keys=["dataset", "epoch", "step"])
+      if self.result_queue_size > 0:
+        self._start_result_consumer()
       # step is like mini-batch in our usual terminology
       step = 0
       fetches_dict = self._get_fetches_dict()
@@ -526,8 +788,11 @@ class Runner(object):
       if writer:
         writer.add_graph(sess.graph)
       hvd_stop = hvd_error = False
+      data_start_time, data_start_wait_time = time.time(), self.data_provider.wait_for_data_time
       while self.data_provider.have_more_data(session=sess):
+        hvd_start_time = time.time()
         hvd_stop, hvd_error = self._horovod_signal_have_more_data()
+        hvd_time = time.time() - hvd_start_time
         if hvd_error:
           raise Exception("Some other Horovod peer failed.")
         if hvd_stop:
@@ -539,6 +804,9 @@ class Runner(object):
         if isinstance(self.engine.network.epoch_step, tf.Tensor):
           feed_dict[self.engine.network.epoch_step] = step
         start_time = time.time()
+        wait_time = self.data_provider.wait_for_data_time - data_start_wait_time
+        step_times = {
+          "wait_for_data": wait_time, "feed_dict": start_time - data_start_time - wait_time - hvd_time}
         if self._should_train and self.reset_updater_vars_mod_step and step % self.reset_updater_vars_mod_step == 0:
           print("Reset updater vars in step %i." % step, file=log.v5)
           self.engine.updater.init_optimizer_vars(session=sess)
@@ -572,18 +840,36 @@ class Runner(object):
               feed_dict=feed_dict,
               options=run_options,
               run_metadata=run_metadata)  # type: typing.Dict[str,typing.Union[numpy.ndarray,str]]
-            elapsed_time_tf += time.time() - session_run_start_time
+            step_times["session_run"] = time.time() - session_run_start_time
+            elapsed_time_tf += step_times["session_run"]
             writer.add_summary(fetches_results["summary"], step + step_offset)
             writer.add_run_metadata(run_metadata, 'step_{:04d}'.format(step + step_offset))
             tl = timeline.Timeline(run_metadata.step_stats)
             timeline_path = os.path.join(logdir, 'timeline.trace')
             with open(timeline_path, 'w') as f:
               f.write(tl.generate_chrome_trace_format(show_memory=True))
+            if self.layer_profiler and self.layer_profiler.is_sample_step(step):
+              self.layer_profiler.add_run_metadata(run_metadata)
+          elif self.layer_profiler and self.layer_profiler.is_sample_step(step):
+            # Sampled profiling run. The op stats are aggregated by layer, see LayerProfiler.
+            session_run_start_time = time.time()
+            profile_run_metadata = tf.RunMetadata()
+            fetches_results = sess.run(
+              fetches_dict,
+              feed_dict=feed_dict,
+              options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+              run_metadata=profile_run_metadata)  # type: typing.Dict[str,typing.Union[numpy.ndarray,str]]
+            step_times["session_run"] = time.time() - session_run_start_time
+            elapsed_time_tf += step_times["session_run"]
+            if writer and "summary" in fetches_results:
+              writer.add_summary(fetches_results["summary"], step + step_offset)
+            self.layer_profiler.add_run_metadata(profile_run_metadata)
           else:
             session_run_start_time = time.time()
             fetches_results = sess.run(
               fetches_dict, feed_dict=feed_dict)  # type: typing.Dict[str,typing.Union[numpy.ndarray,str]]
-            elapsed_time_tf += time.time() - session_run_start_time
+            step_times["session_run"] = time.time() - session_run_start_time
+            elapsed_time_tf += step_times["session_run"]
             if writer and "summary" in fetches_results:
               writer.add_summary(fetches_results["summary"], step + step_offset)
         except tf.errors.OpError as exc:
@@ -591,23 +877,25 @@ class Runner(object):
           # Extra info will be printed below.
           raise
 
-        eval_info = self._collect_eval_info(fetches_results=fetches_results)
-        self._maybe_handle_extra_fetches(fetches_results)
+        hvd_start_time = time.time()
         elapsed_time_tf += self._horovod_sync_params(local_step=step)
-        duration = time.time() - start_time
-        self._print_process(report_prefix=report_prefix, step=step, step_duration=duration, eval_info=eval_info)
-
-        if self.engine.config.bool("stop_on_nonfinite_train_score", True):
-          score_values = self._results_accumulated.values()
-          if any(numpy.isinf(score_values)) or any(numpy.isnan(score_values)):
-            print("Model seems broken, got inf or nan score.", file=log.v1)
-            print("Accumulated scores:", self._results_accumulated, file=log.v1)
-            raise Exception("Inf/nan score in step %i." % step)
+        step_times["horovod"] = hvd_time + time.time() - hvd_start_time
+        if self._result_consumer_thread:
+          self._check_step_scores_finite(step=step, fetches_results=fetches_results)
+          self._put_step_results(
+            report_prefix=report_prefix, step=step, fetches_results=fetches_results,
+            start_time=start_time, step_times=step_times, step_duration=time.time() - start_time)
+        else:
+          self._handle_step_results(
+            report_prefix=report_prefix, step=step, fetches_results=fetches_results,
+            start_time=start_time, step_times=step_times)
 
         step += 1
         if self.cancel_flag:
           raise CancelTrainingException("cancel_flag is set")
+        data_start_time, data_start_wait_time = time.time(), self.data_provider.wait_for_data_time
 
+      self._stop_result_consumer()
       self._print_finish_process()
 
       if not hvd_stop and not self.data_provider.have_reached_end():
@@ -629,6 +917,18 @@ class Runner(object):
       elapsed_tf_percentage = (elapsed_time_tf / elapsed) if (elapsed > 0) else 0.0
       print("%s, finished after %i steps, %s elapsed (%.1f%% computing time)" % (
         report_prefix, step, hms(elapsed), (elapsed_tf_percentage * 100.)), file=log.v3)
+      if self.result_queue_size > 0:
+        blocked_percentage = (self.result_queue_blocked_time / elapsed * 100.) if elapsed > 0 else 0.
+        print("  result consumer: blocked %s on full queue (%.1f%% of elapsed time)" % (
+          hms(self.result_queue_blocked_time), blocked_percentage), file=log.v4)
+      print("  time per step phase:\n%s" % self.phase_times.get_table_str(elapsed=elapsed, indent="    "), file=log.v4)
+      self._print_data_provider_stats(elapsed=elapsed)
+      if self.layer_profiler:
+        report = self.layer_profiler.get_report_str()
+        print("%s, layer profile: %s" % (report_prefix, report), file=log.v3)
+        if writer:
+          with open(os.path.join(logdir, "layer_profile.txt"), "w") as f:
+            f.write(report + "\n")
 
     except KeyboardInterrupt as exc:
       print("KeyboardInterrupt in step %r." % step)
@@ -650,6 +950,8 @@ class Runner(object):
       from Util import try_and_ignore_exception
       from TFUtil import stop_event_writer_thread
       try_and_ignore_exception(self._horovod_signal_error)  # ignored if _horovod_finish_data was called before
+      try_and_ignore_exception(self._stop_result_consumer)  # only if not stopped before, e.g. on exception
+      try_and_ignore_exception(self.phase_times.close_steps_file)
       if writer:
         try_and_ignore_exception(writer.close)
         try_and_ignore_exception(lambda: stop_event_writer_thread(writer.event_writer))
@@ -1761,7 +2063,10 @@ class Engine(EngineBase):
       data_keys=self.network.get_used_data_keys(),
       dataset=dataset, batches=batches,
       batch_slice=batch_slice,
-      enforce_min_len1=self.config.is_true("enforce_min_len1", False))
+      enforce_min_len1=self.config.is_true("enforce_min_len1", False),
+      num_workers=self.config.int("data_provider_num_workers", 0),
+      worker_type=self.config.value("data_provider_worker_type", "thread"),
+      shared_mem_slot_size=self.config.int("data_provider_shared_mem_slot_size", 0) or None)
     return data_provider
 
   def get_specific_feed_dict(self, dataset, seq_idx):
@@ -1872,7 +2177,11 @@ class Engine(EngineBase):
     else:
       assert not os.path.exists(output_file)
     print("Forward output:", output, file=log.v3)
-    writer = SimpleHDFWriter(filename=output_file, dim=output.dim, ndim=output.ndim, labels=labels)
+    writer = SimpleHDFWriter(
+      filename=output_file, dim=output.dim, ndim=output.ndim, labels=labels,
+      async_write=self.config.bool("forward_hdf_async_write", False),
+      max_queue_size=self.config.int("forward_hdf_max_queue_size", 10),
+      compression=self.config.value("forward_hdf_compression", None))
 
     def extra_fetches_cb(inputs, seq_tag, **kwargs):
       """
@@ -1910,7 +2219,7 @@ class Engine(EngineBase):
       print("Error happened. Exit now.")
       sys.exit(1)
 
-    writer.close()
+    writer.close()  # also logs the writer stats
 
   # noinspection PyUnusedLocal
   def analyze(self, data, statistics):
@@ -1964,15 +2273,18 @@ class Engine(EngineBase):
       sys.exit(1)
     return analyzer
 
-  def search(self, dataset, do_eval=True, output_layer_names="output", output_file=None, output_file_format="txt"):
+  def search(self, dataset, do_eval=True, output_layer_names="output", output_file=None, output_file_format="txt",
+             output_file_resume=False):
     """
     :param Dataset dataset:
     :param bool do_eval: calculate errors. can only be done if we have the reference target
     :param str|list[str] output_layer_names:
-    :param str output_file:
+    :param str output_file: the results are streamed to a partial file while searching, see :class:`SearchOutputWriter`
     :param str output_file_format: "txt" or "py"
+    :param bool output_file_resume: continue with the partial output file of a previous (crashed) run
     """
     from TFNetworkLayer import LayerBase
+    from EngineUtil import SearchOutputWriter
     print("Search with network on %r." % dataset, file=log.v1)
     if not self.use_search_flag or not self.network or self.use_dynamic_train_flag:
       self.use_search_flag = True
@@ -2031,19 +2343,25 @@ class Engine(EngineBase):
       out_beam_sizes.append(out_beam.beam_size if out_beam else None)
       target_keys.append(output_layer.target or self.network.extern_data.default_target)
 
-    out_cache = None
-    seq_idx_to_tag = {}
+    output_writer = None  # type: typing.Optional[SearchOutputWriter]
     if output_file:
       assert output_file_format in {"txt", "py"}
       if output_is_dict:
         assert output_file_format == "py", "Text format not supported in the case of multiple output layers."
       assert all(dataset.can_serialize_data(target_key) for target_key in target_keys)
-      assert not os.path.exists(output_file)
       print("Will write outputs to: %s" % output_file, file=log.v2)
-      output_file = open(output_file, "w")
-      # corpus-seq-idx -> str|list[(float,str)]|dict[str -> str|list[(float,str)]],
-      # depending on output_is_dict and whether output is after decision
-      out_cache = {}
+      import hashlib
+      # Such that the partial output file of a search with another dataset or model is not resumed.
+      fingerprint = hashlib.sha1(repr((
+        dataset.seq_order_seq_lens_cache_key or repr(dataset), self.model_filename, self.config.value("load", None),
+        self.epoch, output_layer_names)).encode("utf8")).hexdigest()
+      output_writer = SearchOutputWriter(
+        output_file=output_file, output_file_format=output_file_format, fingerprint=fingerprint,
+        resume=output_file_resume)
+      if output_writer.num_resumed_seqs:
+        batches = BatchSetGenerator(
+          dataset=dataset, cache_whole_epoch=False,
+          generator=self._search_skip_done_batches(dataset=dataset, batches=batches, output_writer=output_writer))
     if not log.verbose[4]:
       print("Set log_verbosity to level 4 or higher to see seq info on stdout.", file=log.v2)
 
@@ -2082,13 +2400,9 @@ class Engine(EngineBase):
           outputs[target_idx] = bytearray(outputs[target_idx]).decode("utf8")
 
       for batch_idx in range(len(seq_idx)):
-        corpus_seq_idx = None
-        if out_cache is not None:
-          corpus_seq_idx = dataset.get_corpus_seq_idx(seq_idx[batch_idx])
-          assert corpus_seq_idx not in out_cache
-          seq_idx_to_tag[corpus_seq_idx] = seq_tag[batch_idx]
-          if output_is_dict:
-            out_cache[corpus_seq_idx] = {}
+        # str|list[(float,str)]|dict[str -> str|list[(float,str)]],
+        # depending on output_is_dict and whether output is after decision
+        seq_out = {} if output_is_dict else None
 
         # noinspection PyShadowingNames
         for target_idx in range(num_targets):
@@ -2117,7 +2431,7 @@ class Engine(EngineBase):
                   dataset.serialize_data(key=target_keys[target_idx], data=outputs[target_idx][out_idx + beam_idx]),
                   file=log.v4)
 
-            if out_cache is not None:
+            if output_writer:
               if out_beam_sizes[target_idx] is None:
                   out_data = dataset.serialize_data(key=target_keys[target_idx], data=outputs[target_idx][out_idx])
               else:
@@ -2128,11 +2442,14 @@ class Engine(EngineBase):
                     for beam_idx in range(out_beam_sizes[target_idx])]
 
               if output_is_dict:
-                assert output_layer_names[target_idx] not in out_cache[corpus_seq_idx]
-                out_cache[corpus_seq_idx][output_layer_names[target_idx]] = out_data
+                assert output_layer_names[target_idx] not in seq_out
+                seq_out[output_layer_names[target_idx]] = out_data
               else:
-                assert corpus_seq_idx not in out_cache
-                out_cache[corpus_seq_idx] = out_data
+                seq_out = out_data
+
+        if output_writer:
+          output_writer.write(
+            corpus_seq_idx=dataset.get_corpus_seq_idx(seq_idx[batch_idx]), seq_tag=seq_tag[batch_idx], output=seq_out)
 
     train = self._maybe_prepare_train_in_eval(targets_via_search=True)
 
@@ -2154,26 +2471,36 @@ class Engine(EngineBase):
       extra_fetches_callback=extra_fetches_callback)
     runner.run(report_prefix=self.get_epoch_str() + " search")
     if not runner.finalized:
+      if output_writer:
+        output_writer.close()  # keep what we have, for output_file_resume
       print("Error happened (%s). Exit now." % runner.run_exception)
       sys.exit(1)
     print("Search done. Num steps %i, Final: score %s error %s" % (
       runner.num_steps, self.format_score(runner.score), self.format_score(runner.error)), file=log.v1)
-    if output_file:
-      assert out_cache
-      assert 0 in out_cache
-      assert len(out_cache) - 1 in out_cache
-      if output_file_format == "txt":
-        for i in range(len(out_cache)):
-          output_file.write("%s\n" % out_cache[i])
-      elif output_file_format == "py":
-        from Util import better_repr
-        output_file.write("{\n")
-        for i in range(len(out_cache)):
-          output_file.write("%r: %s,\n" % (seq_idx_to_tag[i], better_repr(out_cache[i])))
-        output_file.write("}\n")
-      else:
-        raise Exception("invalid output_file_format %r" % output_file_format)
-      output_file.close()
+    if output_writer:
+      output_writer.finalize()
+
+  @staticmethod
+  def _search_skip_done_batches(dataset, batches, output_writer):
+    """
+    For resuming the search. Batches where all seqs are already in the output are skipped.
+
+    :param Dataset dataset:
+    :param BatchSetGenerator batches:
+    :param SearchOutputWriter output_writer:
+    :rtype: typing.Generator[Batch]
+    """
+    num_skipped = 0
+    while batches.has_more():
+      batch, = batches.peek_next_n(1)
+      batches.advance(1)
+      if all(output_writer.have_seq(dataset.get_corpus_seq_idx(seq.seq_idx)) for seq in batch.seqs):
+        num_skipped += 1
+        continue
+      if num_skipped:
+        print("Search: skipped %i batches which were already done." % num_skipped, file=log.v3)
+        num_skipped = 0
+      yield batch
 
   def search_single(self, dataset, seq_idx, output_layer_name=None):
     """
@@ -2338,6 +2665,10 @@ class Engine(EngineBase):
     """
     Starts a web-server with a simple API to forward data through the network
     (or search if the flag is set).
+    Concurrent requests are collected into micro batches, see :class:`Util.RequestBatcher`
+    and the config options ``web_server_max_batch_size``, ``web_server_max_wait_time``
+    and ``web_server_bucket_boundaries``.
+    A GET request on ``/stats`` returns the latency and queue depth statistics as JSON.
 
     :param int port: for the http server
     :return:
@@ -2345,7 +2676,10 @@ class Engine(EngineBase):
     assert sys.version_info[0] >= 3, "only Python 3 supported"
     # noinspection PyCompatibility
     from http.server import HTTPServer, BaseHTTPRequestHandler
+    # noinspection PyCompatibility
+    from socketserver import ThreadingMixIn
     from GeneratingDataset import StaticDataset, Vocabulary, BytePairEncoding, ExtractAudioFeatures
+    from Util import RequestBatcher
 
     if not self.use_search_flag or not self.network or self.use_dynamic_train_flag:
       self.use_search_flag = True
@@ -2395,6 +2729,49 @@ class Engine(EngineBase):
       print("Given output %r has beam size %i." % (output_layer, out_beam_size), file=log.v1)
       output_layer_beam_scores_t = output_layer.get_search_choices().beam_scores
 
+    def decode_batch(features_list):
+      """
+      Called in the thread of the request batcher, thus the session is only used by a single thread.
+
+      :param list[numpy.ndarray] features_list:
+      :return: for each seq: list of (score, txt) if there is a beam, otherwise the txt
+      :rtype: list[list[(float,str)]|str]
+      """
+      targets = numpy.array([], dtype="int32")  # empty...
+      dataset = StaticDataset(
+        data=[{input_data.name: features, output_data.name: targets} for features in features_list],
+        output_dim=num_outputs)
+      dataset.init_seq_order(epoch=1)
+      start_time = time.time()
+      output_d = engine.run_single(dataset=dataset, seq_idx=-1, output_dict={
+        "output": output_t,
+        "seq_lens": output_seq_lens_t,
+        "beam_scores": output_layer_beam_scores_t})
+      print("Took %.3f secs for decoding %i seqs." % (time.time() - start_time, len(features_list)), file=log.v4)
+      output = output_d["output"]
+      seq_lens = output_d["seq_lens"]
+      beam_scores = output_d["beam_scores"]
+      beam_size = out_beam_size or 1
+      assert len(output) == len(seq_lens) == len(features_list) * beam_size
+      if out_beam_size:
+        assert beam_scores.shape == (len(features_list), out_beam_size)  # (batch, beam)
+      results = []
+      for b in range(len(features_list)):
+        if out_beam_size:
+          results.append([
+            (beam_scores[b][i], output_vocab.get_seq_labels(output[b * beam_size + i][:seq_lens[b * beam_size + i]]))
+            for i in range(out_beam_size)])
+        else:
+          results.append(output_vocab.get_seq_labels(output[b][:seq_lens[b]]))
+      return results
+
+    batcher = RequestBatcher(
+      process_batch=decode_batch,
+      max_batch_size=self.config.int("web_server_max_batch_size", 1),
+      max_wait_time=self.config.float("web_server_max_wait_time", 0.01),
+      bucket_boundaries=self.config.typed_value("web_server_bucket_boundaries", None),
+      name="web server request batcher")
+
     class Handler(BaseHTTPRequestHandler):
       """
       Handle POST requests.
@@ -2410,6 +2787,20 @@ class Engine(EngineBase):
           sys.excepthook(*sys.exc_info())
           raise
 
+      # noinspection PyPep8Naming
+      def do_GET(self):
+        """
+        Handle GET request. Only for the statistics.
+        """
+        import json
+        if self.path.rstrip("/") != "/stats":
+          self.send_error(404)
+          return
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(batcher.get_stats(), sort_keys=True).encode("utf8"))
+
       def _do_post(self):
         import cgi
         form = cgi.FieldStorage(
@@ -2439,49 +2830,42 @@ class Engine(EngineBase):
           seq = input_vocab.get_seq(sentence)
           print("Input seq:", input_vocab.get_seq_labels(seq), file=log.v4)
           features = numpy.array(seq, dtype="int32")
-        targets = numpy.array([], dtype="int32")  # empty...
-        dataset = StaticDataset(
-          data=[{input_data.name: features, output_data.name: targets}], output_dim=num_outputs)
-        dataset.init_seq_order(epoch=1)
 
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
         start_time = time.time()
-        output_d = engine.run_single(dataset=dataset, seq_idx=0, output_dict={
-          "output": output_t,
-          "seq_lens": output_seq_lens_t,
-          "beam_scores": output_layer_beam_scores_t})
+        result = batcher.submit(features, length=len(features))
         delta_time = time.time() - start_time
-        print("Took %.3f secs for decoding." % delta_time, file=log.v4)
+        print("Took %.3f secs for the request (incl. waiting for the batch)." % delta_time, file=log.v4)
         if audio_len:
           print("Real-time-factor: %.3f" % (delta_time / audio_len), file=log.v4)
-        output = output_d["output"]
-        seq_lens = output_d["seq_lens"]
-        beam_scores = output_d["beam_scores"]
-        assert len(output) == len(seq_lens) == (out_beam_size or 1)
-        if out_beam_size:
-          assert beam_scores.shape == (1, out_beam_size)  # (batch, beam)
-
-        first_best_txt = output_vocab.get_seq_labels(output[0][:seq_lens[0]])
-        print("Best output: %s" % first_best_txt, file=log.v4)
 
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain')
+        self.end_headers()
         if out_beam_size:
+          print("Best output: %s" % result[0][1], file=log.v4)
           self.wfile.write(b"[\n")
-          for i in range(out_beam_size):
-            txt = output_vocab.get_seq_labels(output[i][:seq_lens[i]])
-            score = beam_scores[0][i]
+          for score, txt in result:
             self.wfile.write(("(%r, %r)\n" % (score, txt)).encode("utf8"))
           self.wfile.write(b"]\n")
 
         else:
-          self.wfile(("%r\n" % first_best_txt).encode("utf8"))
+          print("Best output: %s" % result, file=log.v4)
+          self.wfile.write(("%r\n" % result).encode("utf8"))
+
+    class Server(ThreadingMixIn, HTTPServer):
+      """
+      Handles each request in a new thread, such that the batcher can collect them.
+      """
+      daemon_threads = True
 
     print("Simple search web server, listening on port %i." % port, file=log.v2)
     server_address = ('', port)
     # noinspection PyAttributeOutsideInit
-    self.httpd = HTTPServer(server_address, Handler)
-    self.httpd.serve_forever()
+    self.httpd = Server(server_address, Handler)
+    try:
+      self.httpd.serve_forever()
+    finally:
+      batcher.close()
 
 
 def get_global_engine():
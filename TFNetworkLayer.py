@@ -7660,12 +7660,15 @@ class HDFDumpLayer(LayerBase):
   """
   layer_class = "hdf_dump"
 
-  def __init__(self, filename, extra=None, dump_whole_batches=False, labels=None, **kwargs):
+  def __init__(self, filename, extra=None, dump_whole_batches=False, labels=None,
+               async_write=False, compression=None, **kwargs):
     """
     :param str filename:
     :param None|dict[str,LayerBase] extra:
     :param bool dump_whole_batches: dumps the whole batch as a single sequence into the HDF
     :param list[str]|None labels:
+    :param bool async_write: write in a background thread, see :class:`SimpleHDFWriter`
+    :param str|None compression: HDF compression filter, e.g. "gzip" or "lzf"
     """
     super(HDFDumpLayer, self).__init__(**kwargs)
     assert len(self.sources) == 1
@@ -7710,7 +7713,7 @@ class HDFDumpLayer(LayerBase):
         if not self.hdf_writer:
           self.hdf_writer = SimpleHDFWriter(
             filename=filename, dim=data.dim, ndim=ndim,
-            labels=labels,
+            labels=labels, async_write=async_write, compression=compression,
             extra_type={
               key: (
                 value.dim,
@@ -7808,8 +7811,9 @@ class HDFDumpLayer(LayerBase):
 
   def _at_graph_reset(self):
     if self.hdf_writer:
-      print("HDFDumpLayer, wrote %i seqs to file %r." % (self.num_seqs_written, self.filename))
       self.hdf_writer.close()
+      print("HDFDumpLayer, wrote %i seqs to file %r (%s)." % (
+        self.num_seqs_written, self.filename, self.hdf_writer.get_stats_str()))
       self.hdf_writer = None
 
   @classmethod
@@ -1050,7 +1050,7 @@ def init_thread_join_hack():
       # them for delayed handling to the main thread which hangs.
       # See CPython signalmodule.c.
       # Currently the best solution I can think of:
-      while thread_obj.isAlive():
+      while thread_obj.is_alive():
         join_orig(thread_obj, timeout=0.1)
     elif thread.get_ident() == main_thread_id and timeout > 0.1:
       # Limit the timeout. This should not matter for the underlying code.
@@ -1229,6 +1229,162 @@ def wrap_async_func(f):
     interrupt_main()
 
 
+class RequestBatcher:
+  """
+  Collects concurrent requests (e.g. from the threads of a web server) into micro batches,
+  which are processed in a single background thread via ``process_batch``.
+  Requests are grouped by their length into buckets, and a batch only contains requests of the same bucket.
+  A batch is processed when a bucket has ``max_batch_size`` requests,
+  or when the oldest request has waited ``max_wait_time``.
+  Used by :func:`TFEngine.Engine.web_server`.
+  """
+
+  class _Request:
+    def __init__(self, inputs, length):
+      """
+      :param object inputs:
+      :param int length:
+      """
+      self.inputs = inputs
+      self.length = length
+      self.enqueue_time = time.time()
+      self.done = threading.Event()
+      self.result = None
+      self.exception = None  # type: typing.Optional[BaseException]
+
+  def __init__(self, process_batch, max_batch_size=16, max_wait_time=0.01, bucket_boundaries=None,
+               num_latencies_for_stats=1000, name=None):
+    """
+    :param (list[object])->list[object] process_batch: list of inputs -> list of results, called in the batch thread
+    :param int max_batch_size: max number of requests in one batch
+    :param float max_wait_time: in secs, max time to wait for further requests, after the first one arrived
+    :param list[int]|None bucket_boundaries: a request of given length goes to the first bucket with
+      length <= boundary, or to the last bucket (unbounded)
+    :param int num_latencies_for_stats: number of the last request latencies to keep, for :func:`get_stats`
+    :param str|None name:
+    """
+    self.process_batch = process_batch
+    self.max_batch_size = max_batch_size
+    self.max_wait_time = max_wait_time
+    self.bucket_boundaries = sorted(bucket_boundaries or [])
+    self.name = name or self.__class__.__name__
+    self._buckets = [deque() for _ in range(len(self.bucket_boundaries) + 1)]  # bucket idx -> queue of requests
+    self._cond = threading.Condition()
+    self._closed = False
+    self._latencies = deque(maxlen=num_latencies_for_stats)  # type: typing.Deque[float]
+    self._num_requests = 0
+    self._num_batches = 0
+    self._max_queue_depth = 0
+    self._thread = threading.Thread(target=self._thread_main, name=self.name)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def __repr__(self):
+    return "<%s %r>" % (self.__class__.__name__, self.name)
+
+  def close(self):
+    """
+    Stops the batch thread, after all pending requests are processed.
+    """
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    self._thread.join()
+
+  def _get_queue_depth(self):
+    """
+    :rtype: int
+    """
+    return sum([len(bucket) for bucket in self._buckets])
+
+  def submit(self, inputs, length=0):
+    """
+    Blocks until the batch with this request was processed.
+
+    :param object inputs: will be passed to ``process_batch``
+    :param int length: e.g. seq len, for the bucket
+    :return: the result for ``inputs``
+    :rtype: object
+    """
+    import bisect
+    request = self._Request(inputs=inputs, length=length)
+    with self._cond:
+      assert not self._closed, "%s: already closed" % self
+      self._buckets[bisect.bisect_left(self.bucket_boundaries, length)].append(request)
+      self._max_queue_depth = max(self._max_queue_depth, self._get_queue_depth())
+      self._cond.notify_all()
+    request.done.wait()
+    if request.exception:
+      raise request.exception
+    return request.result
+
+  def _get_next_batch(self):
+    """
+    :return: requests of the next batch, or None if closed
+    :rtype: list[RequestBatcher._Request]|None
+    """
+    with self._cond:
+      while True:
+        buckets = [bucket for bucket in self._buckets if bucket]
+        if not buckets:
+          if self._closed:
+            return None
+          self._cond.wait()
+          continue
+        full_buckets = [bucket for bucket in buckets if len(bucket) >= self.max_batch_size]
+        oldest_bucket = min(buckets, key=lambda bucket_: bucket_[0].enqueue_time)
+        wait_time = oldest_bucket[0].enqueue_time + self.max_wait_time - time.time()
+        if full_buckets or wait_time <= 0 or self._closed:
+          bucket = full_buckets[0] if full_buckets else oldest_bucket
+          return [bucket.popleft() for _ in range(min(len(bucket), self.max_batch_size))]
+        self._cond.wait(wait_time)
+
+  def _thread_main(self):
+    while True:
+      batch = self._get_next_batch()
+      if batch is None:
+        return
+      # noinspection PyBroadException
+      try:
+        results = self.process_batch([request.inputs for request in batch])
+        assert len(results) == len(batch), "%s: expected %i results, got %i" % (self, len(batch), len(results))
+        for request, result in zip(batch, results):
+          request.result = result
+      except Exception as exc:
+        sys.excepthook(*sys.exc_info())
+        for request in batch:
+          request.exception = exc
+      end_time = time.time()
+      with self._cond:
+        self._num_batches += 1
+        self._num_requests += len(batch)
+        self._latencies.extend([end_time - request.enqueue_time for request in batch])
+      for request in batch:
+        request.done.set()
+
+  def get_stats(self):
+    """
+    :return: num requests, num batches, avg batch size, current and max queue depth,
+      and latency (in secs, including the waiting time) mean/median/p90/max over the last requests
+    :rtype: dict[str,float|int]
+    """
+    with self._cond:
+      latencies = np.array(self._latencies, dtype="float64")
+      stats = {
+        "num_requests": self._num_requests,
+        "num_batches": self._num_batches,
+        "avg_batch_size": float(self._num_requests) / max(self._num_batches, 1),
+        "queue_depth": self._get_queue_depth(),
+        "max_queue_depth": self._max_queue_depth}
+    if len(latencies):
+      stats.update({
+        "latency_mean": float(np.mean(latencies)),
+        "latency_median": float(np.median(latencies)),
+        "latency_p90": float(np.percentile(latencies, 90)),
+        "latency_max": float(np.max(latencies))})
+    return stats
+
+
 def try_run(func, args=(), catch_exc=Exception, default=None):
   """
   :param ((X)->T) func:
@@ -3546,6 +3702,125 @@ class Stats:
       numpy.savetxt("%s.std_dev.txt" % output_file_prefix, self.get_std_dev())
 
 
+class PhaseTimes:
+  """
+  Accumulates how much time was spent in named phases, e.g. of a train step,
+  to see where the time goes (e.g. whether we are bound by the input pipeline).
+  Adding is thread-safe, as the phases might be measured in different threads.
+  Optionally, the times of every step are dumped to a CSV or JSONL file (see :func:`open_steps_file`).
+  """
+
+  def __init__(self, phases=()):
+    """
+    :param list[str]|tuple[str] phases: the known phases, to get a fixed order. other phases are added at the end
+    """
+    self.phases = list(phases)
+    self.total = {}  # type: typing.Dict[str,float]  # phase -> secs
+    self.count = {}  # type: typing.Dict[str,int]  # phase -> num
+    self._lock = threading.Lock()
+    self._steps_file = None
+    self._steps_file_format = None  # "csv" or "jsonl"
+    self._steps_file_columns = None  # type: typing.Optional[typing.Tuple[typing.List[str],typing.List[str]]]
+
+  def reset(self):
+    """
+    Resets the accumulated times, e.g. for a new epoch.
+    """
+    with self._lock:
+      self.total.clear()
+      self.count.clear()
+
+  def add(self, phase, duration, count=1):
+    """
+    :param str phase:
+    :param float duration: in secs
+    :param int count:
+    """
+    with self._lock:
+      if phase not in self.total:
+        if phase not in self.phases:
+          self.phases.append(phase)
+        self.total[phase] = 0.0
+        self.count[phase] = 0
+      self.total[phase] += duration
+      self.count[phase] += count
+
+  def add_step(self, step_times, **step_info):
+    """
+    :param dict[str,float] step_times: phase -> secs, of a single step
+    :param step_info: e.g. epoch, step. will be written with the step times to the steps file
+    """
+    for phase, duration in step_times.items():
+      self.add(phase, duration)
+    if self._steps_file:
+      if self._steps_file_format == "csv":
+        info_keys, phases = self._steps_file_columns
+        self._steps_file.write(",".join(
+          ["%s" % (step_info[key],) for key in info_keys] +
+          ["%f" % step_times.get(phase, 0.0) for phase in phases]) + "\n")
+      else:
+        import json
+        d = dict(step_info)
+        d.update(step_times)
+        self._steps_file.write(json.dumps(d, sort_keys=True) + "\n")
+
+  @contextlib.contextmanager
+  def timed(self, phase):
+    """
+    :param str phase:
+    :return: context manager which adds the time spent in it to the phase
+    """
+    start_time = time.time()
+    try:
+      yield
+    finally:
+      self.add(phase, time.time() - start_time)
+
+  def open_steps_file(self, filename, step_info_keys):
+    """
+    The times of every step will be appended to this file.
+    For CSV, the columns are fixed, i.e. all phases must be known in advance (see ``phases``).
+
+    :param str filename: "*.csv" or "*.jsonl"
+    :param list[str] step_info_keys: see :func:`add_step`. for the CSV header
+    """
+    assert not self._steps_file
+    self._steps_file_format = "csv" if filename.endswith(".csv") else "jsonl"
+    write_header = self._steps_file_format == "csv" and not (os.path.exists(filename) and os.path.getsize(filename))
+    self._steps_file = open(filename, "a")
+    self._steps_file_columns = (sorted(step_info_keys), list(self.phases))
+    if write_header:
+      self._steps_file.write(",".join(sorted(step_info_keys) + self.phases) + "\n")
+
+  def close_steps_file(self):
+    """
+    Closes the file from :func:`open_steps_file`.
+    """
+    if self._steps_file:
+      self._steps_file.close()
+      self._steps_file = None
+
+  def get_table_str(self, elapsed=None, indent="  "):
+    """
+    :param float|None elapsed: total elapsed time, to show the percentage of each phase
+    :param str indent:
+    :return: multi-line table, one phase per line, with total time, percentage, count and average
+    :rtype: str
+    """
+    lines = []
+    with self._lock:
+      for phase in self.phases:
+        if phase not in self.total:
+          continue
+        total, count = self.total[phase], self.count[phase]
+        line = "%s%-16s %10.3f sec" % (indent, phase, total)
+        if elapsed:
+          line += " %5.1f%%" % (total / elapsed * 100.)
+        line += ", %i times, %.3f ms avg" % (count, total / count * 1000. if count else 0.)
+        lines.append(line)
+    return "\n".join(lines)
+
+
 def is_namedtuple(cls):
   """
   :param T cls: tuple, list or namedtuple type
@@ -4,10 +4,12 @@
 from __future__ import print_function
 
 import sys
+import os
 sys.path += ["."]  # Python 3 hack
 
 import unittest
 from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false
+from nose.tools import assert_not_equal, assert_raises
 from GeneratingDataset import GeneratingDataset, DummyDataset, DummyDatasetMultipleSequenceLength
 from EngineBatch import Batch
 from Dataset import DatasetSeq
@@ -326,6 +328,502 @@ def test_task12ax_window():
   assert_equal(list(data2a[-1, 2]), [0] * input_dim)  # zero-padded right
 
 
+def _make_static_dataset_with_random_seq_lens(num_seqs, vectorized_batches=True):
+  """
+  :param int num_seqs:
+  :param bool vectorized_batches: if False, the dataset does not provide get_seq_lengths_array
+  :rtype: GeneratingDataset.StaticDataset
+  """
+  from GeneratingDataset import StaticDataset
+
+  class _StaticDatasetWithoutSeqLens(StaticDataset):
+    def get_seq_lengths_array(self):
+      return None
+
+  rnd = np.random.RandomState(42)
+  data = []
+  for _ in range(num_seqs):
+    n_time = rnd.randint(1, 50)
+    data.append({
+      "data": np.zeros((n_time, 2), dtype="float32"),
+      "classes": np.zeros((rnd.randint(1, n_time + 1),), dtype="int32")})
+  dataset_class = StaticDataset if vectorized_batches else _StaticDatasetWithoutSeqLens
+  return dataset_class(data=data, output_dim={"data": (2, 2), "classes": (3, 1)})
+
+
+def _get_all_batches(dataset, **kwargs):
+  """
+  :param Dataset.Dataset dataset:
+  :return: list of batches, each as a list of the relevant attribs of the seqs
+  :rtype: list[list[tuple]]
+  """
+  def _nd(d):
+    """
+    :param NumbersDict d:
+    :rtype: tuple
+    """
+    return sorted(d.dict.items()), d.value
+
+  dataset.init_seq_order(1)
+  batch_gen = dataset.generate_batches(recurrent_net=True, **kwargs)
+  all_batches = []
+  while batch_gen.has_more():
+    batch, = batch_gen.peek_next_n(1)
+    assert_is_instance(batch, Batch)
+    assert_equal(batch.num_slices, len(batch.seqs))
+    all_batches.append([(_nd(batch.max_num_frames_per_slice),)] + [
+      (seq.seq_idx, _nd(seq.seq_start_frame), _nd(seq.seq_end_frame), seq.batch_slice, _nd(seq.batch_frame_offset))
+      for seq in batch.seqs])
+    batch_gen.advance(1)
+  return all_batches
+
+
+def test_generate_batches_vectorized_same_as_generic():
+  dataset_vec = _make_static_dataset_with_random_seq_lens(num_seqs=200)
+  dataset_ref = _make_static_dataset_with_random_seq_lens(num_seqs=200, vectorized_batches=False)
+  for kwargs in [
+        dict(batch_size=100),
+        dict(batch_size=100, max_seqs=3),
+        dict(batch_size={"data": 100, "classes": 30}, max_seqs=10),
+        dict(batch_size=30, max_seqs=5),  # some seqs are longer than the batch size
+        dict(batch_size=200, max_pad_size=20),
+        dict(batch_size=200, max_seq_length=40, min_seq_length={"data": 5}),
+        dict(batch_size=200, max_seq_length={"classes": 20}, max_total_num_seqs=50),
+        dict(batch_size=200, seq_drop=0.3),
+        dict(batch_size=0, max_seqs=7)]:
+    print("kwargs:", kwargs)
+    for ctx in [(NumbersDict(0), NumbersDict(0)), (NumbersDict({"data": 1}), NumbersDict({"data": 2}))]:
+      dataset_vec.ctx_left, dataset_vec.ctx_right = dataset_ref.ctx_left, dataset_ref.ctx_right = ctx
+      batches_vec = _get_all_batches(dataset_vec, **kwargs)
+      batches_ref = _get_all_batches(dataset_ref, **kwargs)
+      assert_equal(len(batches_vec), len(batches_ref))
+      for batch_vec, batch_ref in zip(batches_vec, batches_ref):
+        assert_equal(batch_vec, batch_ref)
+
+
+def test_generate_batches_vectorized_missing_key():
+  dataset_vec = _make_static_dataset_with_random_seq_lens(num_seqs=100)
+  dataset_ref = _make_static_dataset_with_random_seq_lens(num_seqs=100, vectorized_batches=False)
+  orig_get_seq_lengths_array = dataset_vec.get_seq_lengths_array
+  # Only "data", but "classes" is used. This must fall back to the generic code.
+  dataset_vec.get_seq_lengths_array = lambda: {"data": orig_get_seq_lengths_array()["data"]}
+  kwargs = dict(batch_size=100, max_seqs=10, used_data_keys={"data", "classes"})
+  assert_equal(_get_all_batches(dataset_vec, **kwargs), _get_all_batches(dataset_ref, **kwargs))
+
+
+def test_generate_batches_vectorized_benchmark():
+  import time
+  num_seqs = 5000
+  kwargs = dict(batch_size=1000, max_seqs=40, max_pad_size=100)
+  times = {}
+  all_batches = {}
+  for vectorized_batches in [False, True]:
+    dataset = _make_static_dataset_with_random_seq_lens(num_seqs=num_seqs, vectorized_batches=vectorized_batches)
+    start_time = time.time()
+    all_batches[vectorized_batches] = _get_all_batches(dataset, **kwargs)
+    times[vectorized_batches] = time.time() - start_time
+  print("%i seqs, %i batches: generic %.3f sec, vectorized %.3f sec" % (
+    num_seqs, len(all_batches[True]), times[False], times[True]))
+  assert_equal(all_batches[True], all_batches[False])
+
+
+def test_get_seq_order_for_epoch_seq_lens_cache():
+  import tempfile
+  import shutil
+  from Dataset import init_dataset
+  cache_dir = tempfile.mkdtemp()
+  try:
+    seq_lens = [5, 3, 8, 3, 1, 7]
+    get_seq_len_calls = []
+
+    def get_seq_len(i):
+      """
+      :param int i:
+      :rtype: int
+      """
+      get_seq_len_calls.append(i)
+      return seq_lens[i]
+
+    opts = {
+      "class": "DummyDataset", "input_dim": 2, "output_dim": 3, "num_seqs": len(seq_lens),
+      "seq_ordering": "sorted", "seq_order_seq_lens_cache": cache_dir}
+    dataset = init_dataset(opts.copy())
+    assert_equal(dataset.get_seq_order_for_epoch(1, len(seq_lens), get_seq_len), [4, 1, 3, 0, 5, 2])
+    assert_equal(len(get_seq_len_calls), len(seq_lens))
+    assert_equal(dataset.get_seq_order_for_epoch(2, len(seq_lens), get_seq_len), [4, 1, 3, 0, 5, 2])
+    assert_equal(len(get_seq_len_calls), len(seq_lens))  # in-memory cache
+    assert_equal(len(os.listdir(cache_dir)), 1)
+    # Another instance (e.g. after a restart), with some other seq ordering. Should use the file.
+    opts["seq_ordering"] = "sorted_reverse"
+    dataset = init_dataset(opts.copy())
+    assert_equal(dataset.get_seq_order_for_epoch(1, len(seq_lens), get_seq_len), [2, 5, 0, 1, 3, 4])
+    assert_equal(len(get_seq_len_calls), len(seq_lens))
+    # Different options, different seq lens.
+    opts["num_seqs"] = 4
+    dataset = init_dataset(opts.copy())
+    assert_equal(dataset.get_seq_order_for_epoch(1, 4, get_seq_len), [2, 0, 1, 3])
+    assert_equal(len(get_seq_len_calls), len(seq_lens) + 4)
+    assert_equal(len(os.listdir(cache_dir)), 2)
+    # The options hash is only calculated when needed.
+    opts["seq_ordering"] = "random"
+    dataset = init_dataset(opts.copy())
+    dataset.init_seq_order(epoch=1)
+    assert_true(dataset._seq_order_seq_lens_cache_key is None)
+    # By default, the seq lens are only cached in memory.
+    del opts["seq_order_seq_lens_cache"]
+    opts["seq_ordering"] = "sorted"
+    dataset = init_dataset(opts.copy())
+    assert_true(dataset._get_seq_order_seq_lens_cache_filename() is None)
+  finally:
+    shutil.rmtree(cache_dir)
+
+
+def test_get_dataset_kwargs_hash_dir():
+  import tempfile
+  import shutil
+  from Dataset import _get_dataset_kwargs_hash
+  corpus_dir = tempfile.mkdtemp()
+  try:
+    os.mkdir("%s/sub" % corpus_dir)
+    with open("%s/sub/a.txt" % corpus_dir, "w") as f:
+      f.write("abc")
+    key1 = _get_dataset_kwargs_hash("LibriSpeechCorpus", {"path": corpus_dir})
+    assert_equal(_get_dataset_kwargs_hash("LibriSpeechCorpus", {"path": corpus_dir}), key1)
+    # Rewrite a file in a sub directory. The directory itself does not change.
+    with open("%s/sub/a.txt" % corpus_dir, "w") as f:
+      f.write("abcdef")
+    assert_not_equal(_get_dataset_kwargs_hash("LibriSpeechCorpus", {"path": corpus_dir}), key1)
+  finally:
+    shutil.rmtree(corpus_dir)
+
+
+def test_CachedDataset2_prefetch():
+  import time
+  import threading
+  from CachedDataset2 import CachedDataset2
+
+  class _SlowDataset(CachedDataset2):
+    def __init__(self, num_seqs=20, **kwargs):
+      super(_SlowDataset, self).__init__(**kwargs)
+      self.num_inputs = 3
+      self.num_outputs = {"data": (3, 2)}
+      self.total_num_seqs = num_seqs
+      self.collect_threads = set()
+      self.max_prefetched_bytes = 0
+
+    def init_seq_order(self, epoch=None, seq_list=None):
+      super(_SlowDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
+      self._num_seqs = self.total_num_seqs
+      return True
+
+    def _collect_single_seq(self, seq_idx):
+      if seq_idx >= self.total_num_seqs:
+        return None
+      self.collect_threads.add(threading.current_thread())
+      if self._prefetcher:
+        self.max_prefetched_bytes = max(
+          self.max_prefetched_bytes, self._prefetcher.result_bytes + self._prefetcher.extra_bytes)
+      time.sleep(0.005)
+      return DatasetSeq(seq_idx=seq_idx, features=np.full((seq_idx % 5 + 1, 3), seq_idx, dtype="float32"))
+
+  seq_bytes = 5 * 3 * 4
+  for kwargs in [
+        {},
+        {"prefetch_num_seqs": 5, "prefetch_max_bytes": 3 * seq_bytes},
+        {"prefetch_num_seqs": 3, "prefetch_num_threads": 3}]:
+    dataset = _SlowDataset(**kwargs)
+    for epoch in [1, 2]:
+      dataset.init_seq_order(epoch=epoch)
+      seq_idx = 0
+      while dataset.is_less_than_num_seqs(seq_idx):
+        dataset.load_seqs(seq_idx, seq_idx + 2)
+        assert_equal(dataset.get_data(seq_idx, "data").tolist(), [[seq_idx] * 3] * (seq_idx % 5 + 1))
+        time.sleep(0.005)
+        seq_idx += 1
+      assert_equal(seq_idx, 20)
+      dataset.finish_epoch()
+      print(kwargs, "waited %.3f sec" % dataset.load_wait_time)
+    if kwargs:
+      assert threading.current_thread() not in dataset.collect_threads
+      assert dataset.max_prefetched_bytes <= (kwargs.get("prefetch_max_bytes") or float("inf")) + seq_bytes
+    else:
+      assert_equal(dataset.collect_threads, {threading.current_thread()})
+
+
+def test_LmDataset_batch_assembly_benchmark():
+  import time
+  import tempfile
+  import shutil
+  from LmDataset import LmDataset
+  from CachedDataset2 import DatasetSeqBuffer
+  from Util import BackendEngine
+
+  class _LinearSeqBuffer(DatasetSeqBuffer):
+    """
+    Lookup like the former list-based buffer, for comparison.
+    """
+    def get(self, seq_idx):
+      for seq in self:
+        if seq.seq_idx == seq_idx:
+          return seq
+      return None
+
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    rnd = np.random.RandomState(42)
+    symbols = [chr(ord("a") + i) for i in range(26)]
+    with open("%s/symbols.txt" % tmp_dir, "w") as f:
+      f.write("".join(["%s %i\n" % (sym, i) for (i, sym) in enumerate(symbols + ["[END]"])]))
+    with open("%s/corpus.txt" % tmp_dir, "w") as f:
+      for _ in range(4000):
+        f.write("".join(rnd.choice(symbols, size=rnd.randint(1, 10))) + "\n")
+    times = {}
+    for buffer_class in [_LinearSeqBuffer, DatasetSeqBuffer]:
+      try:
+        dataset = LmDataset(
+          corpus_file="%s/corpus.txt" % tmp_dir, orth_symbols_map_file="%s/symbols.txt" % tmp_dir,
+          add_delayed_seq_data=True, delayed_seq_data_start_symbol="[END]")
+      except BackendEngine.CannotSelectEngine as exc:
+        raise unittest.SkipTest(str(exc))
+      for batch_size in [10, 100, 1000]:
+        dataset.init_seq_order(epoch=1)
+        dataset.added_data = buffer_class()
+        start_time = time.time()
+        seq_idx = 0
+        while dataset.is_less_than_num_seqs(seq_idx):
+          dataset.load_seqs(seq_idx, seq_idx + batch_size)
+          end_seq_idx = seq_idx + batch_size
+          while seq_idx < end_seq_idx and dataset.is_less_than_num_seqs(seq_idx):
+            for key in dataset.get_data_keys():
+              dataset.get_data(seq_idx, key)
+            seq_idx += 1
+        times[(buffer_class, batch_size)] = time.time() - start_time
+      print("%s: batch assembly, batch size -> sec: %s" % (
+        buffer_class.__name__, ", ".join(["%i: %.3f" % (n, times[(buffer_class, n)]) for n in [10, 100, 1000]])))
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def test_BatchPlan():
+  import pickle
+  from EngineBatch import BatchPlan, PlannedBatch, BatchSetGenerator
+
+  def _nd(d):
+    """
+    :param NumbersDict d:
+    :rtype: tuple
+    """
+    return sorted(d.dict.items()), d.value
+
+  def _batch_repr(batch):
+    """
+    :param Batch batch:
+    :rtype: list[tuple]
+    """
+    return [(_nd(batch.max_num_frames_per_slice), batch.num_slices, batch.start_seq, batch.end_seq)] + [
+      (seq.seq_idx, _nd(seq.seq_start_frame), _nd(seq.seq_end_frame), seq.batch_slice, _nd(seq.batch_frame_offset))
+      for seq in batch.seqs]
+
+  dataset = DummyDatasetMultipleSequenceLength(
+    input_dim=2, output_dim=3, num_seqs=11, seq_len={'data': 24, 'classes': 12})
+  for recurrent_net, chunking in [(True, ({'data': 12, 'classes': 6}, {'data': 6, 'classes': 3})), (False, (0, 0))]:
+    dataset.chunk_size, dataset.chunk_step = [NumbersDict(x) for x in chunking]
+    dataset.init_seq_order(1)
+    batch_gen = dataset.generate_batches(recurrent_net=recurrent_net, max_seqs=3, batch_size=40)
+    batches = []
+    while batch_gen.has_more():
+      batches.extend(batch_gen.peek_next_n(1))
+      batch_gen.advance(1)
+    assert_true(len(batches) > 3)
+    plan = BatchPlan.from_batches(batches)
+    assert_equal(len(plan), len(batches))
+    keys = ["data", "classes", "seq_tag"]
+    for batch_idx, batch in enumerate(batches):
+      planned_batch = plan.get_batch(batch_idx)
+      assert_is_instance(planned_batch, Batch)
+      assert_equal(_batch_repr(planned_batch), _batch_repr(batch))
+      assert_equal(planned_batch.get_parts_columns(keys), batch.get_parts_columns(keys))
+      assert_equal(_nd(planned_batch.get_total_num_frames()), _nd(batch.get_total_num_frames()))
+      assert_equal(planned_batch.get_num_seqs(), batch.get_num_seqs())
+      planned_batch = pickle.loads(pickle.dumps(planned_batch))
+      assert_equal(len(planned_batch.plan), 1)
+      assert_equal(_batch_repr(planned_batch), _batch_repr(batch))
+
+    # With the cache, the batches of the following epochs come from the plan.
+    batch_gen = BatchSetGenerator(dataset=dataset, generator=iter(batches), cache_whole_epoch=True)
+    for epoch in range(2):
+      cached_batches = []
+      while batch_gen.has_more():
+        cached_batches.extend(batch_gen.peek_next_n(1))
+        batch_gen.advance(1)
+      assert_true(all(isinstance(batch, PlannedBatch) for batch in cached_batches))
+      assert_equal([_batch_repr(batch) for batch in cached_batches], [_batch_repr(batch) for batch in batches])
+      assert_equal(batch_gen.stats_num_batches, len(batches))
+      assert_equal(batch_gen.stats_num_seqs, sum([batch.get_num_seqs() for batch in batches]))
+      batch_gen.reset()
+
+  # Seq parts with different keys, and with the broadcast value.
+  batch = Batch()
+  batch.add_frames(seq_idx=0, seq_start_frame=0, length=NumbersDict({"data": 5, "classes": 2}))
+  batch.add_frames(seq_idx=2, seq_start_frame=NumbersDict({"data": 3}), length=NumbersDict(4))
+  batch.add_frames(seq_idx=3, seq_start_frame=1, length=2)
+  planned_batch = BatchPlan.from_batches([batch]).get_batch(0)
+  assert_equal(_nd(planned_batch.get_total_num_frames()), _nd(batch.get_total_num_frames()))
+  assert_equal(planned_batch.get_num_seqs(), batch.get_num_seqs())
+  assert_equal(planned_batch.get_num_seqs(), 4)
+
+
+def test_batch_plan_cache():
+  import tempfile
+  import shutil
+  from Dataset import init_dataset
+  from EngineBatch import PlannedBatch
+  cache_dir = tempfile.mkdtemp()
+  try:
+    opts = {
+      "class": "DummyDatasetMultipleSequenceLength", "input_dim": 2, "output_dim": 3, "num_seqs": 11,
+      "seq_len": {'data': 24, 'classes': 12}, "seq_ordering": "random", "batch_plan_cache": cache_dir}
+    batching_opts = dict(recurrent_net=True, max_seqs=3, batch_size=60, used_data_keys={"data", "classes"})
+
+    def _get_batches(dataset, epoch):
+      """
+      :param Dataset dataset:
+      :param int epoch:
+      :rtype: list[list[tuple]]
+      """
+      dataset.init_seq_order(epoch)
+      batch_gen = dataset.generate_batches(**batching_opts)
+      batches = []
+      while batch_gen.has_more():
+        batch, = batch_gen.peek_next_n(1)
+        if dataset.batch_plan_cache:
+          assert_is_instance(batch, PlannedBatch)
+        batches.append([(seq.seq_idx, seq.seq_start_frame, seq.seq_end_frame) for seq in batch.seqs])
+        batch_gen.advance(1)
+      return batches
+
+    dataset = init_dataset(opts.copy())
+    batches1 = _get_batches(dataset, epoch=1)
+    assert_equal(len(os.listdir(cache_dir)), 1)
+    assert_equal(_get_batches(dataset, epoch=1), batches1)
+    assert_equal(len(os.listdir(cache_dir)), 1)
+    # E.g. a separate planner process, for the next epoch.
+    planner_dataset = init_dataset(opts.copy())
+    filename = planner_dataset.precompute_batch_plan(epoch=2, **batching_opts)
+    assert_true(os.path.exists(filename))
+    assert_equal(len(os.listdir(cache_dir)), 2)
+    # After a restart.
+    dataset = init_dataset(opts.copy())
+    dataset._generate_batches = None  # all should come from the plans
+    assert_equal(_get_batches(dataset, epoch=1), batches1)
+    batches2 = _get_batches(dataset, epoch=2)
+    dataset = init_dataset(dict(opts, batch_plan_cache=False))
+    assert_equal(_get_batches(dataset, epoch=1), batches1)
+    assert_equal(_get_batches(dataset, epoch=2), batches2)
+    # Other batching options.
+    batching_opts["max_seqs"] = 1
+    dataset = init_dataset(opts.copy())
+    assert_true(_get_batches(dataset, epoch=1) != batches1)
+    assert_equal(len(os.listdir(cache_dir)), 3)
+  finally:
+    shutil.rmtree(cache_dir)
+
+
+def test_MetaDataset_parallel_load():
+  import time
+  from threading import Lock
+  from CachedDataset2 import CachedDataset2
+  from MetaDataset import MetaDataset, CombinedDataset
+  lock = Lock()
+  num_loads = {"active": 0, "max": 0}  # concurrent load_seqs calls of the sub-datasets
+
+  class _SlowDataset(CachedDataset2):
+    def __init__(self, **kwargs):
+      super(_SlowDataset, self).__init__(**kwargs)
+      self.num_inputs = 3
+      self.num_outputs = {"data": (3, 2), "classes": (5, 1)}
+      self.all_tags = ["seq-%i" % i for i in range(4)]
+      self.seq_order = None
+
+    def init_seq_order(self, epoch=None, seq_list=None):
+      super(_SlowDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
+      self.seq_order = [self.all_tags.index(tag) for tag in seq_list] if seq_list else list(range(4))
+      self._num_seqs = len(self.seq_order)
+      return True
+
+    def get_all_tags(self):
+      return self.all_tags
+
+    def get_total_num_seqs(self):
+      return len(self.all_tags)
+
+    def load_seqs(self, start, end):
+      with lock:
+        num_loads["active"] += 1
+        num_loads["max"] = max(num_loads["max"], num_loads["active"])
+      try:
+        super(_SlowDataset, self).load_seqs(start, end)
+      finally:
+        with lock:
+          num_loads["active"] -= 1
+
+    def _collect_single_seq(self, seq_idx):
+      if seq_idx >= self._num_seqs:
+        return None
+      time.sleep(0.02)
+      corpus_seq_idx = self.seq_order[seq_idx]
+      return DatasetSeq(
+        seq_idx=seq_idx, seq_tag=self.all_tags[corpus_seq_idx],
+        features=np.full((corpus_seq_idx + 1, 3), corpus_seq_idx, dtype="float32"),
+        targets={"classes": np.arange(corpus_seq_idx + 2, dtype="int32") % 5})
+
+  for cls in [MetaDataset, CombinedDataset]:
+    results = {}
+    for num_load_threads in [0, 2]:
+      datasets = {"audio": _SlowDataset(name="audio"), "text": _SlowDataset(name="text")}
+      if cls is MetaDataset:
+        dataset = MetaDataset(
+          datasets=datasets, data_map={"data": ("audio", "data"), "classes": ("text", "classes")},
+          seq_ordering="random", num_load_threads=num_load_threads)
+        start, end = 0, 4
+      else:
+        dataset = CombinedDataset(
+          datasets=datasets, data_map={("audio", "data"): "data", ("text", "classes"): "classes"},
+          num_load_threads=num_load_threads)
+        start, end = 2, 6  # 2 seqs of each sub-dataset
+      dataset.init_seq_order(epoch=1)
+      num_loads["max"] = 0
+      dataset.load_seqs(start, end)
+      loader = dataset.sub_dataset_loader
+      assert_equal(sorted(loader.load_times.keys()), ["audio", "text"])
+      print(cls.__name__, loader.get_stats_str())
+      assert_equal(num_loads["max"], 2 if num_load_threads else 1)
+      results[num_load_threads] = [
+        (dataset.get_tag(i), dataset.get_data(i, "classes").tolist()) for i in range(start, end)]
+      dataset.finish_epoch()
+      assert_equal(loader.load_times, {})
+    assert_equal(results[0], results[2])
+    if cls is MetaDataset:
+      meta_results = results[0]
+
+  # With prefetching, the MetaDataset prefetcher loads the sub-datasets.
+  datasets = {"audio": _SlowDataset(name="audio"), "text": _SlowDataset(name="text")}
+  dataset = MetaDataset(
+    datasets=datasets, data_map={"data": ("audio", "data"), "classes": ("text", "classes")},
+    seq_ordering="random", num_load_threads=2, prefetch_num_seqs=2)
+  dataset.init_seq_order(epoch=1)
+  results = []
+  for seq_idx in range(4):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    results.append((dataset.get_tag(seq_idx), dataset.get_data(seq_idx, "classes").tolist()))
+  assert_equal(results, meta_results)
+  assert_true(dataset._prefetcher is not None)
+  dataset.finish_epoch()
+  assert_raises(
+    AssertionError, CombinedDataset,
+    datasets=datasets, data_map={("audio", "data"): "data", ("text", "classes"): "classes"}, prefetch_num_seqs=2)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
@@ -144,6 +144,152 @@ def test_BytePairEncoding_unicode():
     u"råt råt iz ďër iz ďër ám à@@ n iz ďër ë låk ë k@@ o@@ d áv d@@ r@@ e@@ s w@@ ër yù w@@ ê@@ k dù ďë à@@ s@@ k")
 
 
+def test_BytePairEncoding_merges():
+  import tempfile
+  import shutil
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    with open("%s/bpe.codes" % tmp_dir, "w") as f:
+      f.write("#version: 0.2\na a\naa a\nb c</w>\na b\naa aa\nab c</w>\n")
+    with open("%s/bpe.vocab" % tmp_dir, "w") as f:
+      f.write(repr({"UNK": 0}))
+    bpe = BytePairEncoding(
+      bpe_file="%s/bpe.codes" % tmp_dir, vocab_file="%s/bpe.vocab" % tmp_dir, encode_cache_size=2)
+    bpe.labels = []  # no vocab check, just the merges
+    assert_equal(bpe._encode_word("a"), "a")
+    assert_equal(list(bpe._encode_word("aaa")), ["aa", "a"])  # left to right, non-overlapping
+    assert_equal(list(bpe._encode_word("aaaaa")), ["aaaa", "a"])  # word-final "a</w>" is a different symbol
+    assert_equal(list(bpe._encode_word("abc")), ["a", "bc"])  # ("b", "c</w>") has better rank than ("a", "b")
+    assert_equal(list(bpe._encode_word("cab")), ["c", "a", "b"])
+    assert_equal(len(bpe._bpe_encode_cache), 2)
+    assert_equal(list(bpe._bpe_encode_cache.keys()), ["abc", "cab"])
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+class _RawFloatFeatureExtractor:
+  """
+  Like :class:`ExtractAudioFeatures`, but reads the raw bytes as float32 samples (no soundfile needed),
+  and applies some random scaling (like random_permute).
+  """
+
+  def __init__(self):
+    self.random_state = numpy.random.RandomState(1)
+
+  def get_audio_features_from_raw_bytes(self, raw_bytes, seq_name=None):
+    """
+    :param io.BytesIO raw_bytes:
+    :param str|None seq_name:
+    :rtype: numpy.ndarray
+    """
+    if seq_name == "seq-fail":
+      raise ValueError("cannot decode %s" % seq_name)
+    audio = numpy.frombuffer(raw_bytes.getvalue(), dtype="float32")
+    return (audio * self.random_state.uniform(0.8, 1.0))[:, None]
+
+
+def test_ExtractAudioFeaturesPool():
+  import io
+  rnd = numpy.random.RandomState(42)
+  audios = [rnd.normal(size=(rnd.randint(10, 100),)).astype("float32") for _ in range(20)]
+  seq_order = list(rnd.permutation(len(audios)))
+
+  def get_job(seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: (bytes,str,list[int])|None
+    """
+    if seq_idx >= len(seq_order):
+      return None
+    ref_seq_idx = int(seq_order[seq_idx])
+    return audios[ref_seq_idx].tobytes(), "seq-%i" % ref_seq_idx, [1, ref_seq_idx]
+
+  # Reference: sequential, with the same per-seq seeds.
+  extractor = _RawFloatFeatureExtractor()
+  ref_features = []
+  for seq_idx in range(len(seq_order)):
+    raw_bytes, seq_tag, seed = get_job(seq_idx)
+    extractor.random_state.seed(seed)
+    ref_features.append(extractor.get_audio_features_from_raw_bytes(io.BytesIO(raw_bytes), seq_name=seq_tag))
+
+  for num_workers in [1, 3]:
+    pool = ExtractAudioFeaturesPool(
+      feature_extractor=_RawFloatFeatureExtractor(), get_job=get_job, num_workers=num_workers, look_ahead=5)
+    try:
+      for _ in range(2):  # like two epochs
+        pool.reset()
+        for seq_idx in range(len(seq_order)):
+          features = pool.get_features(seq_idx)
+          assert_equal(features.tolist(), ref_features[seq_idx].tolist())
+    finally:
+      pool.close()
+
+
+def test_ExtractAudioFeaturesPool_error():
+  pool = ExtractAudioFeaturesPool(
+    feature_extractor=_RawFloatFeatureExtractor(), num_workers=2,
+    get_job=lambda seq_idx: (b"", "seq-fail" if seq_idx == 1 else "seq-%i" % seq_idx, [1]) if seq_idx < 3 else None)
+  try:
+    assert_equal(pool.get_features(0).shape, (0, 1))
+    try:
+      pool.get_features(1)
+    except Exception as exc:
+      print("Expected exception: %s" % exc)
+      assert_in("cannot decode seq-fail", str(exc))
+    else:
+      assert False, "exception expected"
+    assert_equal(pool.get_features(2).shape, (0, 1))
+  finally:
+    pool.close()
+
+
+def test_AudioFeatureCache():
+  import tempfile
+  import shutil
+  path = tempfile.mkdtemp()
+  try:
+    rnd = numpy.random.RandomState(42)
+    features = {"file-%i" % i: rnd.normal(size=(rnd.randint(1, 20), 3)).astype("float32") for i in range(10)}
+    cache = AudioFeatureCache(path=path, options_hash="opts")
+    assert_equal(cache.get("file-0"), None)
+    for file_id, value in sorted(features.items()):
+      cache.add(file_id, value)
+    for file_id, value in sorted(features.items()):
+      assert_equal(cache.get(file_id).tolist(), value.tolist())
+    assert_equal((cache.num_hits, cache.num_misses), (10, 1))
+    print(cache.get_stats_str())
+    cache.save_index()
+    cache = AudioFeatureCache(path=path, options_hash="opts")  # e.g. in the next run
+    for file_id, value in sorted(features.items()):
+      assert_equal(cache.get(file_id).tolist(), value.tolist())
+    assert_equal(AudioFeatureCache(path=path, options_hash="other-opts").get("file-0"), None)
+  finally:
+    shutil.rmtree(path)
+
+
+def test_AudioFeatureCache_max_size():
+  import tempfile
+  import shutil
+  path = tempfile.mkdtemp()
+  try:
+    value = numpy.ones((16, 4), dtype="float32")  # 256 bytes
+    cache = AudioFeatureCache(path=path, options_hash="opts", max_size=3 * value.nbytes)
+    for i in range(3):
+      cache.add("file-%i" % i, value * i)
+    cache.get("file-0")  # file-1 is now the least recently used
+    cache.add("file-3", value * 3)
+    assert_equal(cache.get("file-1"), None)
+    for i in [0, 2, 3]:
+      assert_equal(cache.get("file-%i" % i).tolist(), (value * i).tolist())
+    for i in range(4, 20):  # this will compact the data file
+      cache.add("file-%i" % i, value * i)
+    assert_true(os.path.getsize("%s/opts/data.bin" % path) <= 2 * cache.max_size)
+    for i in range(17, 20):
+      assert_equal(cache.get("file-%i" % i).tolist(), (value * i).tolist())
+  finally:
+    shutil.rmtree(path)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
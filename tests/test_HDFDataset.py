@@ -12,6 +12,8 @@ from HDFDataset import *
 from nose.tools import assert_equal
 from nose.tools import assert_not_equal
 from nose.tools import assert_raises
+from nose.tools import assert_true
+from nose.tools import assert_in
 from nose.tools import raises
 import Util
 import h5py
@@ -254,6 +256,59 @@ def test_HDFDataset_partition_epoch():
       assert_equal(hdf_reader.data[key][seq_idx].tolist(), orig_reader.data[key][seq_idx].tolist())
 
 
+def test_HDFDataset_get_seq_lengths_array():
+  partition_epoch = 3
+  num_seqs = 11
+  hdf_fn = generate_hdf_from_other({"class": "TaskNumberBaseConvertDataset", "num_seqs": num_seqs})
+  hdf = HDFDataset([hdf_fn, hdf_fn], partition_epoch=partition_epoch, seq_ordering="random")
+  for epoch in range(1, partition_epoch + 1):
+    hdf.init_seq_order(epoch=epoch)
+    seq_lens = hdf.get_seq_lengths_array()
+    assert_equal(sorted(seq_lens.keys()), ["classes", "data"])
+    for key in seq_lens.keys():
+      assert_equal(seq_lens[key].shape, (hdf.num_seqs,))
+    for seq_idx in range(hdf.num_seqs):
+      seq_len = hdf.get_seq_length(seq_idx)
+      for key in seq_lens.keys():
+        assert_equal(seq_lens[key][seq_idx], seq_len[key])
+
+
+def test_HDFDataset_bucketed_seq_order():
+  hdf_fn = generate_hdf_from_other({"class": "TaskNumberBaseConvertDataset", "num_seqs": 200})
+  batching_opts = dict(recurrent_net=True, batch_size={"data": 60}, max_seqs=10)
+  padding = {}
+  for seq_ordering in ["random", "bucketed:4:60:10"]:
+    hdf = HDFDataset([hdf_fn], seq_ordering=seq_ordering)
+    hdf.init_seq_order(epoch=1)
+    seq_order = hdf.get_current_seq_order()
+    assert_equal(sorted(seq_order), list(range(200)))
+    all_batches = []
+    for vectorized in [True, False]:
+      if not vectorized:
+        hdf.get_seq_lengths_array = lambda: None
+      batch_gen = hdf.generate_batches(**batching_opts)
+      batches = []
+      while batch_gen.has_more():
+        batch, = batch_gen.peek_next_n(1)
+        batches.append([seq.seq_idx for seq in batch.seqs])
+        batch_gen.advance(1)
+      all_batches.append(batches)
+      print(seq_ordering, "vectorized" if vectorized else "generic", batch_gen.get_stats_str())
+      padding[seq_ordering] = 1. - float(batch_gen.stats_used_frames["data"]) / batch_gen.stats_padded_frames["data"]
+    assert_equal(all_batches[0], all_batches[1])
+    if seq_ordering.startswith("bucketed"):
+      group_ids = hdf._seq_order_group_ids
+      for batch in all_batches[0]:
+        assert_equal(len(set(group_ids[batch])), 1)
+      # Deterministic per epoch, and different for other epochs.
+      assert_equal(hdf.get_seq_order_for_epoch(1, 200, lambda i: hdf._seq_lengths[i][0]), list(seq_order))
+      assert_not_equal(hdf.get_seq_order_for_epoch(2, 200, lambda i: hdf._seq_lengths[i][0]), list(seq_order))
+      assert_equal(hdf._seq_order_group_ids.tolist(), group_ids.tolist())  # not overwritten by epoch 2
+      hdf.init_seq_order(epoch=1, seq_list=[hdf.get_tag(i) for i in range(10)])
+      assert_true(hdf._seq_order_group_ids is None)
+  assert padding["bucketed:4:60:10"] < padding["random"] / 2, padding
+
+
 def test_SimpleHDFWriter():
   fn = get_test_tmp_file(suffix=".hdf")
   os.remove(fn)  # SimpleHDFWriter expects that the file does not exist
@@ -316,6 +371,48 @@ def test_SimpleHDFWriter_small():
     print(repr(gzip.compress(open(fn, "rb").read())))
 
 
+def test_SimpleHDFWriter_async_compressed():
+  fn = get_test_tmp_file(suffix=".hdf")
+  os.remove(fn)  # SimpleHDFWriter expects that the file does not exist
+  rnd = numpy.random.RandomState(42)
+  n_dim = 5
+  writer = SimpleHDFWriter(filename=fn, dim=n_dim, labels=None, async_write=True, max_queue_size=2, compression="gzip")
+  seq_lens = []
+  classes_seq_lens = []
+  data = []
+  for batch_idx in range(20):
+    batch_seq_lens = [rnd.randint(1, 20) for _ in range(3)]
+    inputs = rnd.normal(size=(len(batch_seq_lens), max(batch_seq_lens), n_dim)).astype("float32")
+    batch_classes = rnd.randint(0, 10, size=(len(batch_seq_lens), max(batch_seq_lens))).astype("int32")
+    writer.insert_batch(
+      inputs=inputs, seq_len=batch_seq_lens,
+      seq_tag=["seq-%i" % (len(seq_lens) + i) for i in range(len(batch_seq_lens))],
+      extra={"classes": batch_classes})
+    data.extend([inputs[i, :seq_len].copy() for (i, seq_len) in enumerate(batch_seq_lens)])
+    # Overwrite the buffers. The writer must have copied them.
+    inputs[:] = 0
+    batch_classes[:] = -1
+    seq_lens.extend(batch_seq_lens)
+    classes_seq_lens.extend([max(batch_seq_lens)] * len(batch_seq_lens))  # extra is not cut by seq_len
+  writer.close()
+  assert writer.num_resizes < 20 * 4  # grows geometrically, not once per batch
+  stats_str = writer.get_stats_str()
+  assert_true(stats_str.startswith("%i seqs, " % len(seq_lens)), stats_str)
+  assert_in("on full queue", stats_str)  # async
+
+  dataset = HDFDataset(files=[fn])
+  reader = DatasetTestReader(dataset=dataset)
+  reader.read_all()
+  assert_equal(reader.num_seqs, len(seq_lens))
+  assert_equal(reader.seq_tags, ["seq-%i" % i for i in range(reader.num_seqs)])
+  for i, seq_len in enumerate(seq_lens):
+    assert_equal(reader.seq_lens[i]["data"], seq_len)
+    assert_equal(reader.seq_lens[i]["classes"], classes_seq_lens[i])
+    numpy.testing.assert_array_equal(reader.data["data"][i], data[i])
+  assert_equal(dataset.get_data_shape("data"), [n_dim])
+  assert_equal(dataset.get_data_dtype("classes"), "int32")
+
+
 def test_read_simple_hdf():
   if sys.version_info[0] <= 2:  # gzip.decompress is >=PY3
     raise unittest.SkipTest
@@ -674,6 +771,129 @@ def test_HDFDataset_no_cache_efficiency():
   # TODO... check alloc intervals etc
 
 
+def test_HDFDataset_read_seqs_benchmark():
+  import time
+  num_files = 50
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 200})
+  hdf_dataset = HDFDataset(files=[hdf_fn] * num_files, cache_byte_size=0)
+  hdf_dataset.initialize()
+  hdf_dataset.init_seq_order(epoch=1)
+  num_seqs = hdf_dataset.num_seqs
+  assert_equal(num_seqs, 200 * num_files)
+
+  def get_file_index_linear(real_seq_idx):
+    """
+    :param int real_seq_idx:
+    :rtype: int
+    """
+    file_index = 0
+    while file_index < len(hdf_dataset.file_start) - 1 and real_seq_idx >= hdf_dataset.file_start[file_index + 1]:
+      file_index += 1
+    return file_index
+
+  start_time = time.time()
+  file_idxs_linear = [get_file_index_linear(i) for i in range(num_seqs)]
+  time_linear = time.time() - start_time
+  start_time = time.time()
+  file_idxs_bisect = [hdf_dataset._get_file_index(i) for i in range(num_seqs)]
+  time_bisect = time.time() - start_time
+  print("file index of %i seqs in %i files: linear %.3f sec, binary search %.3f sec" % (
+    num_seqs, num_files, time_linear, time_bisect))
+  assert_equal(file_idxs_linear, file_idxs_bisect)
+
+  keys = hdf_dataset.get_data_keys()
+  start_time = time.time()
+  # Without load_seqs, get_data reads each seq on its own.
+  data_single = [{key: hdf_dataset.get_data(i, key) for key in keys} for i in range(num_seqs)]
+  time_single = time.time() - start_time
+  start_time = time.time()
+  hdf_dataset.load_seqs(0, num_seqs)
+  data_planned = [{key: hdf_dataset.get_data(i, key) for key in keys} for i in range(num_seqs)]
+  time_planned = time.time() - start_time
+  print("reading %i seqs: single %.3f sec, planned %.3f sec" % (num_seqs, time_single, time_planned))
+  for seq_single, seq_planned in zip(data_single, data_planned):
+    for key in keys:
+      assert_equal(seq_single[key].tolist(), seq_planned[key].tolist())
+
+
+def test_HDFDataset_load_seqs_cached_random_order():
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 23})
+  hdf_cached = HDFDataset(files=[hdf_fn, hdf_fn], seq_ordering="random", cache_byte_size=10 ** 7)
+  hdf_cached.initialize()
+  assert hdf_cached.cache_byte_size_total_limit > 0
+  hdf_direct = HDFDataset(files=[hdf_fn, hdf_fn], seq_ordering="random", cache_byte_size=0)
+  hdf_direct.initialize()
+  for dataset in [hdf_cached, hdf_direct]:
+    dataset.init_seq_order(epoch=1)
+    dataset.load_seqs(0, dataset.num_seqs)
+  assert_equal(hdf_cached.num_seqs, hdf_direct.num_seqs)
+  for seq_idx in range(hdf_cached.num_seqs):
+    assert_equal(hdf_cached.get_tag(seq_idx), hdf_direct.get_tag(seq_idx))
+    for key in hdf_cached.get_data_keys():
+      assert_equal(hdf_cached.get_data(seq_idx, key).tolist(), hdf_direct.get_data(seq_idx, key).tolist())
+
+
+def test_SeqFrameCache():
+  from CachedDataset import SeqFrameCache
+  cache = SeqFrameCache(num_frames=10, frame_shape=[2], dtype="float32")
+  seq_lens = [3, 4, 2, 3, 4, 2]
+  seqs = {i: np.arange(n * 2).reshape(n, 2).astype("float32") + i * 100 for (i, n) in enumerate(seq_lens)}
+  for i in range(4):
+    assert not cache.touch(i)
+    cache.add(i, seqs[i])
+  assert_equal(cache.num_misses, 4)
+  assert_equal(sorted(cache._entries.keys()), [1, 2, 3])  # 0 got evicted
+  assert cache.touch(1)
+  cache.add(4, seqs[4], pinned={4, 2})  # evicts the least recently used which is not pinned, i.e. 3
+  assert_equal(sorted(cache._entries.keys()), [1, 2, 4])
+  cache.add(5, seqs[5])
+  for i in cache._entries.keys():
+    assert_equal(cache.get(i).tolist(), seqs[i].tolist())
+  assert cache.used_frames <= cache.num_frames
+  assert cache.num_evictions > 0 and cache.num_compactions > 0
+  assert_equal(cache.num_arena_reallocs, 0)  # no views were held
+  # A view from get() stays valid, also when the seq gets evicted and the arena gets compacted.
+  view = cache.get(5)
+  assert_raises(ValueError, view.__setitem__, 0, 0.)  # read-only
+  for i in range(4):
+    cache.add(i, seqs[i])
+  assert 5 not in cache
+  assert_equal(view.tolist(), seqs[5].tolist())
+  assert_equal(cache.num_arena_reallocs, 1)
+  for i in cache._entries.keys():
+    assert_equal(cache.get(i).tolist(), seqs[i].tolist())
+  print(cache.get_stats_str())
+
+
+def test_HDFDataset_lru_cache_partition_epoch():
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 23})
+  opts = dict(files=[hdf_fn], seq_ordering="random", partition_epoch=2)
+  hdf_direct = HDFDataset(cache_byte_size=0, **opts)
+  hdf_direct.initialize()
+  total_frames = sum(hdf_direct.get_seq_length_nd(i)[0] for i in range(hdf_direct.num_seqs))
+  frame_bytes = 4 * hdf_direct.get_data_dim("data")
+  for cache_byte_size, expect_hits in [(-1, True), (total_frames * frame_bytes // 3, False)]:
+    hdf_cached = HDFDataset(cache_byte_size=cache_byte_size, cache_engine="lru", **opts)
+    hdf_cached.initialize()
+    for epoch in range(1, 5):
+      seq_tags = []
+      for dataset in [hdf_cached, hdf_direct]:
+        dataset.init_seq_order(epoch=epoch)
+        seq_tags.append([dataset.get_tag(i) for i in range(dataset.num_seqs)])
+      assert_equal(seq_tags[0], seq_tags[1])
+      for seq_idx in range(hdf_cached.num_seqs):
+        for dataset in [hdf_cached, hdf_direct]:
+          dataset.load_seqs(seq_idx, seq_idx + 1)
+        for key in hdf_cached.get_data_keys():
+          assert_equal(hdf_cached.get_data(seq_idx, key).tolist(), hdf_direct.get_data(seq_idx, key).tolist())
+    cache = hdf_cached._seq_cache
+    print(cache.get_stats_str())
+    assert_equal(cache.num_hits > 0, expect_hits)
+    assert cache.used_frames <= cache.num_frames
+    if not expect_hits:
+      assert cache.num_evictions > 0
+
+
 def test_siamese_triplet_sampling():
   datasets_path = generate_dummy_hdf(3)
   dataset = SiameseHDFDataset(input_stream_name="features", seq_label_stream="classes", files=datasets_path)
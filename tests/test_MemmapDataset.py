@@ -0,0 +1,132 @@
+from __future__ import print_function
+
+import os
+import sys
+my_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, "%s/.." % my_dir)
+
+import tempfile
+import shutil
+import unittest
+from nose.tools import assert_equal, assert_true
+from MemmapDataset import MemmapDataset, MemmapDatasetWriter
+from HDFDataset import HDFDatasetWriter
+from Dataset import init_dataset
+import Util
+import better_exchook
+better_exchook.install()
+better_exchook.replace_traceback_format_tb()
+Util.init_thread_join_hack()
+
+from Log import log
+log.initialize(verbosity=[5])
+
+
+def _dump_memmap(dataset_opts):
+  """
+  :param dict[str] dataset_opts:
+  :return: directory of the memmap dataset. will be deleted at exit
+  :rtype: str
+  """
+  path = tempfile.mkdtemp(suffix=".memmap")
+  import atexit
+  atexit.register(lambda: shutil.rmtree(path))
+  writer = MemmapDatasetWriter(path)
+  writer.dump_from_dataset(init_dataset(dataset_opts), use_progress_bar=False)
+  writer.close()
+  return path
+
+
+def _check_same_data(dataset, ref_dataset, epoch=1):
+  """
+  :param Dataset.Dataset dataset:
+  :param Dataset.Dataset ref_dataset:
+  :param int epoch:
+  """
+  dataset.init_seq_order(epoch=epoch)
+  ref_dataset.init_seq_order(epoch=epoch)
+  assert_equal(sorted(dataset.get_data_keys()), sorted(ref_dataset.get_data_keys()))
+  assert_equal(dataset.num_seqs, ref_dataset.num_seqs)
+  for seq_idx in range(dataset.num_seqs):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    ref_dataset.load_seqs(seq_idx, seq_idx + 1)
+    assert_equal(dataset.get_tag(seq_idx), ref_dataset.get_tag(seq_idx))
+    assert_equal(dataset.get_seq_length(seq_idx), ref_dataset.get_seq_length(seq_idx))
+    for key in dataset.get_data_keys():
+      data = dataset.get_data(seq_idx, key)
+      ref_data = ref_dataset.get_data(seq_idx, key)
+      assert_equal(str(data.dtype), ref_dataset.get_data_dtype(key))
+      assert_equal(data.tolist(), ref_data.tolist())
+
+
+def test_MemmapDataset_same_as_source():
+  opts = {"class": "Task12AXDataset", "num_seqs": 23}
+  path = _dump_memmap(opts)
+  dataset = init_dataset({"class": "MemmapDataset", "path": path})
+  assert isinstance(dataset, MemmapDataset)
+  assert_equal(dataset.num_outputs, init_dataset(opts).num_outputs)
+  _check_same_data(dataset, init_dataset(opts))
+
+
+def test_MemmapDataset_from_hdf():
+  hdf_fn = tempfile.mktemp(suffix=".hdf")
+  hdf_writer = HDFDatasetWriter(hdf_fn)
+  hdf_writer.dump_from_dataset(init_dataset({"class": "Task12AXDataset", "num_seqs": 11}), use_progress_bar=False)
+  hdf_writer.close()
+  try:
+    hdf_opts = {"class": "HDFDataset", "files": [hdf_fn], "seq_ordering": "sorted"}
+    path = _dump_memmap(hdf_opts)
+    _check_same_data(MemmapDataset(path=path, seq_ordering="sorted"), init_dataset(hdf_opts))
+  finally:
+    os.remove(hdf_fn)
+
+
+def test_MemmapDataset_partition_epoch():
+  num_seqs = 11
+  partition_epoch = 3
+  path = _dump_memmap({"class": "TaskNumberBaseConvertDataset", "num_seqs": num_seqs})
+  dataset = MemmapDataset(path=path, partition_epoch=partition_epoch, seq_ordering="random")
+  dataset.initialize()
+  assert_equal(dataset.get_total_num_seqs(), num_seqs)
+  all_tags = []
+  for epoch in range(1, partition_epoch + 1):
+    dataset.init_seq_order(epoch=epoch)
+    assert_true(dataset.num_seqs < num_seqs)
+    seq_lens = dataset.get_seq_lengths_array()
+    for seq_idx in range(dataset.num_seqs):
+      all_tags.append(dataset.get_tag(seq_idx))
+      for key in dataset.get_data_keys():
+        assert_equal(dataset.get_data(seq_idx, key).shape[0], seq_lens[key][seq_idx])
+  assert_equal(sorted(all_tags), sorted(dataset.get_all_tags()))
+
+
+def test_MemmapDataset_seq_list():
+  path = _dump_memmap({"class": "Task12AXDataset", "num_seqs": 7})
+  dataset = MemmapDataset(path=path)
+  dataset.initialize()
+  seq_list = dataset.get_all_tags()[::-2]
+  dataset.init_seq_order(epoch=1, seq_list=seq_list)
+  assert_equal([dataset.get_tag(i) for i in range(dataset.num_seqs)], seq_list)
+
+
+if __name__ == "__main__":
+  better_exchook.install()
+  if len(sys.argv) <= 1:
+    for k, v in sorted(globals().items()):
+      if k.startswith("test_"):
+        print("-" * 40)
+        print("Executing: %s" % k)
+        try:
+          v()
+        except unittest.SkipTest as exc:
+          print("SkipTest:", exc)
+        print("-" * 40)
+    print("Finished all tests.")
+  else:
+    assert len(sys.argv) >= 2
+    for arg in sys.argv[1:]:
+      print("Executing: %s" % arg)
+      if arg in globals():
+        globals()[arg]()  # assume function and execute
+      else:
+        eval(arg)  # assume Python code and execute
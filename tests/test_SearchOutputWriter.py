@@ -0,0 +1,88 @@
+
+from __future__ import print_function
+
+import sys
+import os
+import shutil
+import tempfile
+sys.path += ["."]  # Python 3 hack
+
+from nose.tools import assert_equal, assert_true, assert_false
+from EngineUtil import SearchOutputWriter
+from Log import log
+import better_exchook
+better_exchook.replace_traceback_format_tb()
+
+
+log.initialize()
+
+
+def test_SearchOutputWriter():
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    outputs = {i: [(-0.5 * i, "hyp %i a" % i), (-1.5 * i, "hyp %i\tb" % i)] for i in range(10)}
+    for output_file_format in ["txt", "py"]:
+      output_file = "%s/search.%s" % (tmp_dir, output_file_format)
+      writer = SearchOutputWriter(output_file=output_file, output_file_format=output_file_format, fingerprint="a")
+      for i in [9, 8, 7, 6, 5]:  # e.g. sorted_reverse
+        writer.write(corpus_seq_idx=i, seq_tag="seq-%i" % i, output=outputs[i])
+      writer.close()
+      # Simulate a crash during writing the next entry.
+      with open(writer.partial_file, "ab") as f:
+        f.write(b"4\t'seq-4'\t'[(-2.0, ")
+      assert_false(os.path.exists(output_file))
+
+      writer = SearchOutputWriter(
+        output_file=output_file, output_file_format=output_file_format, fingerprint="a", resume=True)
+      assert_equal(writer.num_resumed_seqs, 5)
+      assert_true(writer.have_seq(5))
+      assert_false(writer.have_seq(4))
+      for i in reversed(range(6)):  # seq 5 again, as part of a partially done batch
+        writer.write(corpus_seq_idx=i, seq_tag="seq-%i" % i, output=outputs[i])
+      writer.finalize()
+      assert_false(os.path.exists(writer.partial_file))
+      if output_file_format == "txt":
+        assert_equal(open(output_file).read().splitlines(), ["%s" % (outputs[i],) for i in range(10)])
+      else:
+        assert_equal(eval(open(output_file).read()), {"seq-%i" % i: outputs[i] for i in range(10)})
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def test_SearchOutputWriter_resume_other_search():
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    output_file = "%s/search.txt" % tmp_dir
+    writer = SearchOutputWriter(output_file=output_file, fingerprint="a")
+    writer.write(corpus_seq_idx=1, seq_tag="seq-1", output="hyp a")
+    writer.close()
+    # E.g. another dataset or model.
+    writer = SearchOutputWriter(output_file=output_file, fingerprint="b", resume=True)
+    assert_equal(writer.num_resumed_seqs, 0)
+    assert_false(writer.have_seq(1))
+    for i in range(2):
+      writer.write(corpus_seq_idx=i, seq_tag="seq-%i" % i, output="hyp %i b" % i)
+    writer.finalize()
+    assert_equal(open(output_file).read().splitlines(), ["hyp 0 b", "hyp 1 b"])
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+  better_exchook.install()
+  if len(sys.argv) <= 1:
+    for k, v in sorted(globals().items()):
+      if k.startswith("test_"):
+        print("-" * 40)
+        print("Executing: %s" % k)
+        v()
+        print("-" * 40)
+    print("Finished all tests.")
+  else:
+    assert len(sys.argv) >= 2
+    for arg in sys.argv[1:]:
+      print("Executing: %s" % arg)
+      if arg in globals():
+        globals()[arg]()  # assume function and execute
+      else:
+        eval(arg)  # assume Python code and execute
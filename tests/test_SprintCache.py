@@ -0,0 +1,201 @@
+from __future__ import print_function
+
+import os
+import sys
+my_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, "%s/.." % my_dir)
+
+import tempfile
+import shutil
+import unittest
+from struct import pack
+import numpy
+from nose.tools import assert_equal, assert_true
+from SprintCache import FileArchive, FileArchiveBundle, decode_alignment, read_parallel
+import better_exchook
+better_exchook.install()
+better_exchook.replace_traceback_format_tb()
+
+
+def _write_archive(filename, entries):
+  """
+  :param str filename:
+  :param list[(str,bytes)] entries: name -> uncompressed content
+  """
+  with open(filename, "wb") as f:
+    f.write(FileArchive.SprintCacheHeader.encode("ascii") + pack("b", 1))
+    infos = []
+    for name, content in entries:
+      f.write(pack("I", FileArchive.start_recovery_tag) + pack("i", len(name)) + name.encode("ascii"))
+      infos.append((name, f.tell(), len(content)))
+      f.write(pack("III", len(content), 0, 0) + content + pack("I", FileArchive.end_recovery_tag))
+    pos = f.tell()
+    f.write(pack("i", len(infos)))
+    for name, entry_pos, size in infos:
+      f.write(pack("i", len(name)) + name.encode("ascii") + pack("q", entry_pos) + pack("II", size, 0))
+    f.write(pack("q", 0) + pack("q", pos))
+
+
+def test_FileArchive_read_features():
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    fn = "%s/feat.cache" % tmp_dir
+    rnd = numpy.random.RandomState(42)
+    features = rnd.normal(size=(17, 5)).astype("float32")
+    times = [(i * 10., (i + 1) * 10.) for i in range(len(features))]
+    content = pack("I", 10) + b"vector-f32" + pack("I", len(features))
+    for feature, (start, end) in zip(features, times):
+      content += pack("I", len(feature)) + feature.tobytes() + pack("dd", start, end)
+    _write_archive(fn, [("corpus/seq-1", content)])
+
+    archive = FileArchive(fn)
+    times_, features_ = archive.read_features("corpus/seq-1")
+    assert_equal(features_.dtype, numpy.float32)
+    assert_equal(features_.tolist(), features.tolist())
+    assert_equal(times_.shape, (len(times), 2))
+    assert_equal(times_.tolist(), [list(t) for t in times])
+    # The list-based API.
+    times_list, features_list = archive.read("corpus/seq-1", "feat")
+    assert_equal(len(features_list), len(features))
+    assert_equal(numpy.array(features_list).tolist(), features.tolist())
+    assert_equal(numpy.array(times_list).tolist(), [list(t) for t in times])
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def test_FileArchiveBundle_lazy_open_and_index():
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    archive_filenames = []
+    for i in range(5):
+      fn = "%s/archive.%i" % (tmp_dir, i)
+      _write_archive(fn, [("corpus/seq-%i-%i" % (i, j), ("content %i %i" % (i, j)).encode("ascii")) for j in range(3)])
+      archive_filenames.append(fn)
+    bundle_fn = "%s/archive.bundle" % tmp_dir
+    with open(bundle_fn, "w") as f:
+      f.write("".join(["%s\n" % fn for fn in archive_filenames]))
+
+    bundle = FileArchiveBundle(bundle_fn, max_open_archives=2)
+    assert_true(len(bundle.archives) <= 2)
+    assert_true(os.path.exists("%s.index" % bundle_fn))
+    bundle2 = FileArchiveBundle(bundle_fn, max_open_archives=2)
+    assert_equal(len(bundle2.archives), 0)  # loaded from the index, nothing opened
+    assert_equal(sorted(bundle2.file_list()), sorted(bundle.file_list()))
+    assert_true(isinstance(bundle2.files["corpus/seq-1-0"], FileArchive))  # opened on access
+    assert_equal(list(bundle2.archives.keys()), ["%s/archive.1" % tmp_dir])
+    for b in [bundle, bundle2]:
+      for i in range(5):
+        for j in range(3):
+          assert_equal(b.read("corpus/seq-%i-%i" % (i, j), "str"), "content %i %i" % (i, j))
+          assert_equal(b.read("seq-%i-%i" % (i, j), "str"), "content %i %i" % (i, j))  # short name
+          assert_true(len(b.archives) <= 2)
+
+    # Change an archive. The index should be detected as outdated and be rewritten.
+    _write_archive(archive_filenames[0], [("corpus/other-seq", b"other")] + [
+      ("corpus/seq-0-%i" % j, ("new content %i" % j).encode("ascii")) for j in range(2)])
+    os.utime(archive_filenames[0], (0, 0))
+    bundle3 = FileArchiveBundle(bundle_fn)
+    assert_true(bundle3.has_entry("corpus/other-seq"))
+    assert_true(not bundle3.has_entry("corpus/seq-0-2"))
+    assert_equal(bundle3.read("corpus/seq-0-1", "str"), "new content 1")
+    assert_equal(bundle3.read("corpus/other-seq", "str"), "other")
+    bundle4 = FileArchiveBundle(bundle_fn)
+    assert_equal(len(bundle4.archives), 0)  # loaded from the rewritten index
+    assert_equal(sorted(bundle4.file_list()), sorted(bundle3.file_list()))
+    bundle.close()
+    bundle2.close()
+    bundle3.close()
+    bundle4.close()
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def _make_feature_content(features):
+  """
+  :param numpy.ndarray features: (time,dim) float32
+  :return: content of a Sprint cache feature entry
+  :rtype: bytes
+  """
+  content = pack("I", 10) + b"vector-f32" + pack("I", len(features))
+  for t, feature in enumerate(features):
+    content += pack("I", len(feature)) + feature.tobytes() + pack("dd", t * 10., (t + 1) * 10.)
+  return content
+
+
+def test_read_parallel():
+  from SprintDataset import SprintCacheDataset
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    rnd = numpy.random.RandomState(42)
+    features = {}
+    archive_filenames = []
+    for i in range(3):
+      fn = "%s/archive.%i" % (tmp_dir, i)
+      entries = []
+      for j in range(10):
+        name = "corpus/seq-%i-%i" % (i, j)
+        features[name] = rnd.normal(size=(rnd.randint(1, 50), 7)).astype("float32")
+        entries.append((name, _make_feature_content(features[name])))
+      _write_archive(fn, entries)
+      archive_filenames.append(fn)
+    bundle_fn = "%s/archive.bundle" % tmp_dir
+    with open(bundle_fn, "w") as f:
+      f.write("".join(["%s\n" % fn for fn in archive_filenames]))
+
+    bundle = FileArchiveBundle(bundle_fn, max_open_archives=1)
+    names = sorted(features.keys()) * 3
+    for name, (times, feats) in zip(names, read_parallel(bundle, names, num_threads=4)):
+      assert_equal(feats.tolist(), features[name].tolist())
+
+    dataset = SprintCacheDataset(data={"data": {"filename": bundle_fn}}, num_read_threads=3, seq_ordering="random")
+    for epoch in [1, 2]:
+      dataset.init_seq_order(epoch=epoch)
+      seq_idx = 0
+      while dataset.is_less_than_num_seqs(seq_idx):
+        dataset.load_seqs(seq_idx, seq_idx + 1)
+        assert_equal(dataset.get_data(seq_idx, "data").tolist(), features[dataset.get_tag(seq_idx)].tolist())
+        seq_idx += 1
+      assert_equal(seq_idx, len(features))
+      dataset.finish_epoch()
+      assert_true(dataset._read_executor is None)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def test_decode_alignment():
+  values = [3, 4 + (1 << 26), 5 + 2 * (1 << 26)]
+  records = pack("b", 2) + pack("i", values[0]) + pack("i", values[1])  # two single frames
+  records += pack("b", -3) + pack("i", values[2])  # one value repeated three times
+  records += pack("b", 0) + pack("i", 10)  # explicit time
+  records += pack("b", -2) + pack("i", values[0])
+  buf = pack("I", 14) + b"flow-alignment" + pack("i", 0) + b"ALIGNRLE" + pack("I", 7) + records
+  times, mixes, states = decode_alignment(buf)
+  assert_true(states is None)
+  assert_equal(times.tolist(), [0, 1, 2, 3, 4, 10, 11])
+  assert_equal(mixes.tolist(), [values[0], values[1]] + [values[2]] * 3 + [values[0]] * 2)
+  times, allos, states = decode_alignment(buf, allophones=["a%i" % i for i in range(10)])
+  assert_equal(allos.tolist(), [3, 4, 5, 5, 5, 3, 3])
+  assert_equal(states.tolist(), [0, 1, 2, 2, 2, 0, 0])
+
+
+if __name__ == "__main__":
+  better_exchook.install()
+  if len(sys.argv) <= 1:
+    for k, v in sorted(globals().items()):
+      if k.startswith("test_"):
+        print("-" * 40)
+        print("Executing: %s" % k)
+        try:
+          v()
+        except unittest.SkipTest as exc:
+          print("SkipTest:", exc)
+        print("-" * 40)
+    print("Finished all tests.")
+  else:
+    assert len(sys.argv) >= 2
+    for arg in sys.argv[1:]:
+      print("Executing: %s" % arg)
+      if arg in globals():
+        globals()[arg]()  # assume function and execute
+      else:
+        eval(arg)  # assume Python code and execute
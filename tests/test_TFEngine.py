@@ -159,6 +159,50 @@ def test_DataProvider():
   assert_equal(classes.tolist(), [[1, 2, 0, 1, 2]])
 
 
+def test_DataProvider_num_workers():
+  from GeneratingDataset import DummyDataset
+  from TFDataPipeline import FeedDictDataProvider
+  dataset = DummyDataset(input_dim=2, output_dim=3, num_seqs=20, seq_len=7)
+  extern_data = ExternData()
+  extern_data.init_from_dataset(dataset)
+
+  def get_batches_data(**kwargs):
+    """
+    :return: all batches of the epoch, as provided by FeedDictDataProvider
+    :rtype: list[dict[str]]
+    """
+    dataset.init_seq_order(epoch=1)
+    batches = dataset.generate_batches(recurrent_net=True, batch_size=20, max_seqs=3)
+    data_provider = FeedDictDataProvider(
+      tf_session=session, extern_data=extern_data,
+      data_keys=["data", "classes"],
+      dataset=dataset, batches=batches, capacity=2, **kwargs)
+    data_provider.start_threads()
+    res = []
+    while data_provider.have_more_data(session=session):
+      feed_dict, meta = data_provider.get_feed_dict()
+      # Copy, because with shared memory, the arrays are only valid until the next get_feed_dict().
+      res.append(({key: numpy.array(value) for (key, value) in feed_dict.items()}, meta))
+    assert data_provider.have_reached_end()
+    data_provider.stop_threads()
+    return res
+
+  ref = get_batches_data()
+  assert len(ref) > 3
+  for kwargs in [
+        dict(worker_type="thread"),
+        dict(worker_type="process"),
+        dict(worker_type="process", shared_mem_slot_size=4096),
+        dict(worker_type="process", shared_mem_slot_size=128)]:  # too small, fallback to pickling
+    res = get_batches_data(num_workers=3, **kwargs)
+    assert_equal(len(res), len(ref))
+    for (feed_dict, meta), (ref_feed_dict, ref_meta) in zip(res, ref):
+      assert_equal(meta["seq_idx"], ref_meta["seq_idx"])
+      assert_equal(set(feed_dict.keys()), set(ref_feed_dict.keys()))
+      for key in feed_dict.keys():
+        numpy.testing.assert_array_equal(feed_dict[key], ref_feed_dict[key])
+
+
 def test_engine_train():
   from GeneratingDataset import DummyDataset
   seq_len = 5
@@ -536,6 +580,50 @@ def test_engine_forward_to_hdf():
   os.remove(output_file)
 
 
+def test_engine_forward_to_hdf_result_consumer():
+  from GeneratingDataset import DummyDataset
+  import tempfile
+  output_file = tempfile.mktemp(suffix=".hdf", prefix="nose-tf-forward")
+  seq_len = 5
+  n_data_dim = 2
+  n_classes_dim = 3
+  num_seqs = 20
+  dataset = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim,
+                         num_seqs=num_seqs, seq_len=seq_len)
+  dataset.init_seq_order(epoch=1)
+
+  config = Config()
+  config.update({
+    "model": "%s/model" % _get_tmp_dir(),
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network": {"output": {"class": "softmax", "loss": "ce"}},
+    "output_file": output_file,
+    "runner_result_queue_size": 2,
+    "forward_hdf_async_write": True,
+  })
+  _cleanup_old_models(config)
+
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=dataset, dev_data=None, eval_data=None,)
+
+  engine.forward_to_hdf(data=dataset, output_file=output_file, batch_size=5)
+
+  engine.finalize()
+
+  from HDFDataset import HDFDataset
+  ds = HDFDataset()
+  ds.add_file(output_file)
+  assert_equal(ds.num_inputs, n_classes_dim)
+  assert_equal(ds.get_num_timesteps(), seq_len * num_seqs)
+  assert_equal(ds.num_seqs, num_seqs)
+  # The extra fetches callback is still called in order.
+  ds.init_seq_order(epoch=1)
+  assert_equal([ds.get_tag(i) for i in range(num_seqs)], ["seq-%i" % i for i in range(num_seqs)])
+
+  os.remove(output_file)
+
+
 def test_engine_rec_subnet_count():
   from GeneratingDataset import DummyDataset
   seq_len = 5
@@ -3089,6 +3177,38 @@ def test_preinit_reset_train_dataset():
       assert os.path.exists(fn)  # should have been created now
 
 
+def test_LayerProfiler():
+  with make_scope() as session:
+    extern_data = ExternData({"data": {"dim": 3}})
+    network = TFNetwork(extern_data=extern_data, train_flag=True)
+    network.construct_from_dict({
+      "layer1": {"class": "linear", "activation": "tanh", "n_out": 5, "from": "data"},
+      "output": {"class": "linear", "activation": None, "n_out": 2, "from": "layer1"}})
+    profiler = LayerProfiler(network=network, mod_step=2, skip_steps=1)
+    assert_equal([step for step in range(6) if profiler.is_sample_step(step)], [1, 3, 5])
+    assert_equal(profiler.get_layer_and_kind("layer1/linear/MatMul"), ("layer1", "forward"))
+    assert_equal(
+      profiler.get_layer_and_kind("optimize/gradients/layer1/linear/MatMul_grad/MatMul"), ("layer1", "backward"))
+    assert_equal(profiler.get_layer_and_kind("optimize/update_output/W/ApplyAdam"), ("output", "optimizer"))
+    assert_equal(profiler.get_layer_and_kind("global_step"), ("(other)", "forward"))
+
+    session.run(tf.global_variables_initializer())
+    data = network.extern_data.data["data"]
+    for _ in range(2):
+      run_metadata = tf.RunMetadata()
+      session.run(
+        network.get_default_output_layer().output.placeholder,
+        feed_dict={data.placeholder: numpy.random.normal(size=(3, 7, 3)), data.size_placeholder[0]: [7, 5, 3]},
+        options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+        run_metadata=run_metadata)
+      profiler.add_run_metadata(run_metadata)
+    assert_equal(profiler.num_samples, 2)
+    assert "layer1" in profiler.time_micros and "output" in profiler.time_micros
+    report = profiler.get_report_str()
+    print(report)
+    assert "2 sampled steps" in report
+
+
 if __name__ == "__main__":
   try:
     better_exchook.install()
@@ -284,6 +284,88 @@ def test_CollectionReadCheckCovered():
   assert x and x.truth_value
 
 
+def test_RequestBatcher():
+  import threading
+  batches = []
+
+  def process_batch(inputs):
+    batches.append(list(inputs))
+    if "fail" in inputs:
+      raise ValueError("cannot process %r" % inputs)
+    return [x * 2 for x in inputs]
+
+  batcher = RequestBatcher(process_batch=process_batch, max_batch_size=4, max_wait_time=0.5, bucket_boundaries=[5])
+  results = {}
+
+  def submit(x):
+    try:
+      results[x] = batcher.submit(x, length=len(x))
+    except ValueError as exc:
+      results[x] = exc
+
+  threads = [threading.Thread(target=submit, args=(x,)) for x in ["a", "b", "c", "d", "e", "long-1", "long-2"]]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  submit("fail")
+  batcher.close()
+  for x in ["a", "b", "c", "d", "e", "long-1", "long-2"]:
+    assert_equal(results[x], x * 2)
+  assert_true(isinstance(results["fail"], ValueError))
+  for batch in batches:
+    assert_true(len(batch) <= 4)
+    assert_true(len(set([len(x) <= 5 for x in batch])) == 1)  # all in the same bucket
+  assert_equal(sorted(sum(batches, [])), sorted(results.keys()))
+  assert_true(len(batches) < len(results))
+  stats = batcher.get_stats()
+  print(stats)
+  assert_equal(stats["num_requests"], len(results))
+  assert_equal(stats["num_batches"], len(batches))
+  assert_equal(stats["queue_depth"], 0)
+  assert_equal(stats["avg_batch_size"], float(len(results)) / len(batches))
+  assert_true(1 <= stats["max_queue_depth"] <= len(results))
+  assert_true("latency_max" in stats)
+
+
+def test_PhaseTimes():
+  import tempfile
+  import json
+  phase_times = PhaseTimes(phases=["load", "run"])
+  with phase_times.timed("load"):
+    pass
+  phase_times.add("run", 0.5)
+  phase_times.add("other", 0.25)
+  assert_equal(phase_times.phases, ["load", "run", "other"])
+  assert_equal(phase_times.count, {"load": 1, "run": 1, "other": 1})
+  table = phase_times.get_table_str(elapsed=1.0)
+  print(table)
+  assert_equal(len(table.splitlines()), 3)
+  assert_true("50.0%" in table.splitlines()[1])
+  phase_times.reset()
+  assert_equal(phase_times.total, {})
+
+  for ext in ["csv", "jsonl"]:
+    fn = tempfile.mktemp(suffix="." + ext)
+    try:
+      phase_times = PhaseTimes(phases=["load", "run"])
+      phase_times.open_steps_file(fn, step_info_keys=["epoch", "step"])
+      for step in range(3):
+        phase_times.add_step({"load": 0.25, "run": 1.0 + step}, epoch=1, step=step)
+      phase_times.close_steps_file()
+      assert_equal(phase_times.total, {"load": 0.75, "run": 6.0})
+      lines = open(fn).read().splitlines()
+      if ext == "csv":
+        assert_equal(lines[0], "epoch,step,load,run")
+        assert_equal(lines[1:], ["1,%i,0.250000,%f" % (step, 1.0 + step) for step in range(3)])
+      else:
+        assert_equal([json.loads(line) for line in lines], [
+          {"epoch": 1, "step": step, "load": 0.25, "run": 1.0 + step} for step in range(3)])
+    finally:
+      if os.path.exists(fn):
+        os.remove(fn)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
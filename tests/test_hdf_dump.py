@@ -64,6 +64,25 @@ def test_hdf_create_and_load():
   os.remove(hdf_filename)
 
 
+def test_memmap_create_and_load():
+  from MemmapDataset import MemmapDataset
+  import shutil
+  path = tempfile.mkdtemp(suffix=".memmap", prefix="nose-dataset-load")
+  writer = hdf_dataset_init(path, dump_format="memmap")
+
+  dataset = DummyDataset(input_dim=2, output_dim=3, num_seqs=4)
+  dataset.init_seq_order(epoch=1)
+
+  hdf_dump_from_dataset(dataset, writer, DictAsObj(options))
+  hdf_close(writer)
+
+  loaded_dataset = MemmapDataset(path=path)
+  loaded_dataset.initialize()
+  assert loaded_dataset.num_seqs == 4
+
+  shutil.rmtree(path)
+
+
 def test_hdf_create_unicode_labels():
   hdf_filename = tempfile.mktemp(suffix=".hdf", prefix="nose-dataset-create")
   hdf_dataset = hdf_dataset_init(hdf_filename)
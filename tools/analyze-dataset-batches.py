@@ -29,6 +29,81 @@ from Config import Config
 
 config = None  # type: typing.Optional[Config]
 dataset = None  # type: typing.Optional[Dataset]
+net_dict = None  # type: typing.Optional[typing.Dict[str,typing.Dict[str]]]
+
+
+def get_network_batching_opts():
+  """
+  Constructs the network of the config (TF only), to get the same batching options as the TFEngine.
+
+  :return: (recurrent_net, used_data_keys), or None if there is no network or it cannot be constructed
+  :rtype: (bool,set[str])|None
+  """
+  if not net_dict or not Util.BackendEngine.is_tensorflow_selected():
+    return None
+  import tensorflow as tf
+  from TFNetwork import TFNetwork
+  print("Construct network, to get the batching options.", file=log.v3)
+  with tf.Graph().as_default():
+    network = TFNetwork(name="root", config=config, rnd_seed=1, train_flag=True, eval_flag=True)
+    network.construct_from_dict(net_dict)
+    return network.recurrent, network.get_used_data_keys()
+
+
+def get_batching_opts(options):
+  """
+  Like in the TFEngine, such that a stored batch plan (see ``batch_plan_cache``) is compatible.
+
+  :param options: argparse.Namespace
+  :return: kwargs for :func:`Dataset.generate_batches`
+  :rtype: dict[str]
+  """
+  network_opts = None
+  if options.recurrent_net is None or not options.used_data_keys:
+    network_opts = get_network_batching_opts()
+    if not network_opts:
+      print("No network, thus batching options might not match the training.", file=log.v2)
+  if options.recurrent_net is not None:
+    recurrent_net = bool(options.recurrent_net)
+  elif network_opts:
+    recurrent_net = network_opts[0]
+  else:
+    recurrent_net = True
+  if options.used_data_keys:
+    used_data_keys = set(options.used_data_keys.split(","))
+  elif network_opts:
+    used_data_keys = network_opts[1]
+  else:
+    used_data_keys = set(dataset.get_data_keys())
+  max_seq_length = config.typed_value('max_seq_length', None) or config.float('max_seq_length', 0)
+  if not max_seq_length:
+    max_seq_length = sys.maxsize
+  if isinstance(max_seq_length, dict):
+    max_seq_length = NumbersDict(max_seq_length)
+  opts = dict(
+    recurrent_net=recurrent_net,
+    batch_size=config.typed_value('batch_size', 1),
+    max_seqs=config.int('max_seqs', -1),
+    max_seq_length=max_seq_length,
+    max_pad_size=config.typed_value("max_pad_size", None),
+    seq_drop=config.float('seq_drop', 0.0),
+    used_data_keys=used_data_keys)
+  print("Batching options: %r" % opts, file=log.v3)
+  return opts
+
+
+def precompute_batch_plans(options):
+  """
+  Stores the batch plans for the epochs, such that the training can just load them.
+  This can run in parallel to the training, for the next epochs.
+
+  :param options: argparse.Namespace
+  """
+  batching_opts = get_batching_opts(options)
+  for epoch in range(options.epoch, options.epoch + options.precompute_epochs):
+    start_time = time.time()
+    filename = dataset.precompute_batch_plan(epoch=epoch, **batching_opts)
+    print("Epoch %i: batch plan %r, %s." % (epoch, filename, hms(time.time() - start_time)), file=log.v2)
 
 
 def analyze_dataset(options):
@@ -48,22 +123,9 @@ def analyze_dataset(options):
   if options.endseq < 0:
     options.endseq = float("inf")
 
-  recurrent = True
-  used_data_keys = dataset.get_data_keys()
-  batch_size = config.typed_value('batch_size', 1)
-  max_seqs = config.int('max_seqs', -1)
-  seq_drop = config.float('seq_drop', 0.0)
-  max_seq_length = config.typed_value('max_seq_length', None) or config.float('max_seq_length', 0)
-  max_pad_size = config.typed_value("max_pad_size", None)
-
-  batches = dataset.generate_batches(
-    recurrent_net=recurrent,
-    batch_size=batch_size,
-    max_seqs=max_seqs,
-    max_seq_length=max_seq_length,
-    max_pad_size=max_pad_size,
-    seq_drop=seq_drop,
-    used_data_keys=used_data_keys)
+  batching_opts = get_batching_opts(options)
+  used_data_keys = batching_opts["used_data_keys"]
+  batches = dataset.generate_batches(**batching_opts)
 
   step = 0
   total_num_seqs = 0
@@ -127,13 +189,14 @@ def analyze_dataset(options):
     dataset.finish_epoch()
 
 
-def init(config_str, config_dataset, use_pretrain, epoch, verbosity):
+def init(config_str, config_dataset, use_pretrain, epoch, verbosity, batch_plan_cache=None):
   """
   :param str config_str: either filename to config-file, or dict for dataset
   :param str|None config_dataset:
   :param bool use_pretrain: might overwrite config options, or even the dataset
   :param int epoch:
   :param int verbosity:
+  :param str|None batch_plan_cache: dataset option, see :class:`Dataset`
   """
   rnn.init_better_exchook()
   rnn.init_thread_join_hack()
@@ -161,6 +224,8 @@ def init(config_str, config_dataset, use_pretrain, epoch, verbosity):
   rnn.init_faulthandler()
   rnn.init_config_json_network()
   Util.BackendEngine.select_engine(config=config)
+  global net_dict
+  net_dict = config.typed_value("network", None)
   if not dataset_opts:
     if config_dataset:
       dataset_opts = "config:%s" % config_dataset
@@ -197,7 +262,9 @@ def init(config_str, config_dataset, use_pretrain, epoch, verbosity):
   Dataset.kwargs_update_from_config(config, dataset_default_opts)
   print("Using dataset:", dataset_opts, file=log.v2)
   global dataset
-  dataset = init_dataset(dataset_opts, default_kwargs=dataset_default_opts)
+  dataset = init_dataset(
+    dataset_opts, default_kwargs=dataset_default_opts,
+    extra_kwargs={"batch_plan_cache": batch_plan_cache} if batch_plan_cache else None)
   assert isinstance(dataset, Dataset)
   dataset.init_seq_order(epoch=epoch)
 
@@ -211,12 +278,24 @@ def main():
   argparser.add_argument("--verbosity", type=int, default=5, help="overwrites log_verbosity (default: 4)")
   argparser.add_argument("--key", default="data", help="data-key, e.g. 'data' or 'classes'. (default: 'data')")
   argparser.add_argument("--use_pretrain", action="store_true")
+  argparser.add_argument(
+    "--used_data_keys", help="comma-separated, as used by the network (default: from the network, or all)")
+  argparser.add_argument(
+    "--recurrent_net", type=int, choices=[0, 1], help="as the network (default: from the network, or 1)")
+  argparser.add_argument(
+    "--batch_plan_cache", help="dir for the batch plans. existing ones are loaded. see dataset option")
+  argparser.add_argument(
+    "--precompute_epochs", type=int, default=0,
+    help="only store the batch plans for this many epochs, starting with --epoch. needs --batch_plan_cache")
   args = argparser.parse_args()
   init(
     config_str=args.crnn_config, config_dataset=args.dataset, epoch=args.epoch, use_pretrain=args.use_pretrain,
-    verbosity=args.verbosity)
+    verbosity=args.verbosity, batch_plan_cache=args.batch_plan_cache)
   try:
-    analyze_dataset(args)
+    if args.precompute_epochs:
+      precompute_batch_plans(args)
+    else:
+      analyze_dataset(args)
   except KeyboardInterrupt:
     print("KeyboardInterrupt")
     sys.exit(1)
@@ -13,22 +13,27 @@ from Log import log
 import rnn
 import argparse
 import HDFDataset
+import MemmapDataset
 from Dataset import Dataset, init_dataset
 from Config import Config
 
 
-def hdf_dataset_init(file_name):
+def hdf_dataset_init(file_name, dump_format="hdf"):
   """
-  :param str file_name: filename of hdf dataset file in the filesystem
-  :rtype: HDFDataset.HDFDatasetWriter
+  :param str file_name: filename of hdf dataset file in the filesystem (or directory for the memmap format)
+  :param str dump_format: "hdf" or "memmap"
+  :rtype: HDFDataset.HDFDatasetWriter|MemmapDataset.MemmapDatasetWriter
   """
+  if dump_format == "memmap":
+    return MemmapDataset.MemmapDatasetWriter(path=file_name)
+  assert dump_format == "hdf", "unknown format %r" % dump_format
   return HDFDataset.HDFDatasetWriter(filename=file_name)
 
 
 def hdf_dump_from_dataset(dataset, hdf_dataset, parser_args):
   """
   :param Dataset dataset: could be any dataset implemented as child of Dataset
-  :type hdf_dataset: HDFDataset.HDFDatasetWriter
+  :type hdf_dataset: HDFDataset.HDFDatasetWriter|MemmapDataset.MemmapDatasetWriter
   :param parser_args: argparse object from main()
   """
   hdf_dataset.dump_from_dataset(
@@ -39,7 +44,7 @@ def hdf_dump_from_dataset(dataset, hdf_dataset, parser_args):
 
 def hdf_close(hdf_dataset):
   """
-  :param HDFDataset.HDFDatasetWriter hdf_dataset: to close
+  :param HDFDataset.HDFDatasetWriter|MemmapDataset.MemmapDatasetWriter hdf_dataset: to close
   """
   hdf_dataset.close()
 
@@ -93,6 +98,8 @@ def main(argv):
   parser.add_argument('--start_seq', type=int, default=0, help="Start sequence index of the dataset to dump")
   parser.add_argument('--end_seq', type=int, default=float("inf"), help="End sequence index of the dataset to dump")
   parser.add_argument('--epoch', type=int, default=1, help="Optional start epoch for initialization")
+  parser.add_argument('--format', default="hdf", choices=["hdf", "memmap"],
+                      help="hdf: for HDFDataset. memmap: directory for MemmapDataset")
 
   args = parser.parse_args(argv[1:])
   crnn_config = None
@@ -102,7 +109,7 @@ def main(argv):
   else:
     dataset_config_str = args.config_file_or_dataset
   dataset = init(config_filename=crnn_config, cmd_line_opts=[], dataset_config_str=dataset_config_str)
-  hdf_dataset = hdf_dataset_init(args.hdf_filename)
+  hdf_dataset = hdf_dataset_init(args.hdf_filename, dump_format=args.format)
   hdf_dump_from_dataset(dataset, hdf_dataset, args)
   hdf_close(hdf_dataset)
 